@@ -0,0 +1,186 @@
+import copy
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List
+
+import numpy as np
+from dotenv import load_dotenv
+
+from utils import vault_version
+
+load_dotenv()
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE", "1").lower() in {"1", "true", "yes"}
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "600"))
+# Cosine similarity above which two questions count as the same question.
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+_TRAILING_PUNCT = re.compile(r"[\s?.!]+$")
+# Numbers, codes and file names: questions that differ in these never match.
+_SALIENT_TOKEN = re.compile(r"\b\w*[\d._]\w*(?:[._-]\w+)*\b")
+
+
+def normalize_question(question: str) -> str:
+    q = " ".join(question.lower().split())
+    return _TRAILING_PUNCT.sub("", q)
+
+
+def _salient_tokens(normalized: str) -> frozenset:
+    return frozenset(_SALIENT_TOKEN.findall(normalized))
+
+
+class AnswerCache:
+    """
+    Response cache for ask_question.
+
+    Lookups are by exact normalized question, then by query-embedding
+    similarity for near-duplicates. Entries expire after `ttl` seconds and
+    the whole cache is dropped when the vault version changes (any
+    ingestion that modified the corpus).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = ANSWER_CACHE_SIZE,
+        ttl: float = ANSWER_CACHE_TTL,
+        similarity: float = ANSWER_CACHE_SIMILARITY,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = vault_version()
+
+        # Lazily rebuilt matrix of unit query embeddings for semantic lookup.
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[str] = []
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _check_version(self) -> None:
+        version = vault_version()
+        if version != self._version:
+            self._entries.clear()
+            self._matrix = None
+            self._version = version
+
+    def _alive(self, entry: Dict[str, Any], now: float) -> bool:
+        return now - entry["created_at"] <= self.ttl
+
+    def get(self, question: str) -> Optional[Dict[str, Any]]:
+        key = normalize_question(question)
+
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(key)
+            if entry is None or not self._alive(entry, time.time()):
+                return None
+
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return copy.deepcopy(entry["response"])
+
+    def get_similar(
+        self,
+        question: str,
+        query_embedding: np.ndarray,
+        intent: str,
+    ) -> Optional[Dict[str, Any]]:
+        key = normalize_question(question)
+        salient = _salient_tokens(key)
+
+        with self._lock:
+            self._check_version()
+
+            if self._matrix is None:
+                self._matrix_keys = [
+                    k for k, e in self._entries.items() if e["embedding"] is not None
+                ]
+                self._matrix = (
+                    np.stack([self._entries[k]["embedding"] for k in self._matrix_keys])
+                    if self._matrix_keys else None
+                )
+
+            if self._matrix is None:
+                self.misses += 1
+                return None
+
+            query = _unit(query_embedding)
+            scores = self._matrix @ query
+            now = time.time()
+
+            for row in np.argsort(-scores):
+                if scores[row] < self.similarity:
+                    break
+                entry = self._entries.get(self._matrix_keys[row])
+                if (
+                    entry is None
+                    or entry["intent"] != intent
+                    or entry["salient"] != salient
+                    or not self._alive(entry, now)
+                ):
+                    continue
+
+                self.semantic_hits += 1
+                return copy.deepcopy(entry["response"])
+
+            self.misses += 1
+            return None
+
+    def put(
+        self,
+        question: str,
+        response: Dict[str, Any],
+        intent: str,
+        query_embedding: Optional[np.ndarray] = None,
+    ) -> None:
+        key = normalize_question(question)
+
+        with self._lock:
+            self._check_version()
+            self._entries[key] = {
+                "response": copy.deepcopy(response),
+                "intent": intent,
+                "salient": _salient_tokens(key),
+                "embedding": _unit(query_embedding) if query_embedding is not None else None,
+                "created_at": time.time(),
+            }
+            self._entries.move_to_end(key)
+
+            now = time.time()
+            for old_key in [k for k, e in self._entries.items() if not self._alive(e, now)]:
+                del self._entries[old_key]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+            self._matrix = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+        }
+
+
+def _unit(vector) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(v)
+    return v / norm if norm else v
+
+
+answer_cache = AnswerCache()
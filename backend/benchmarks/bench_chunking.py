@@ -0,0 +1,104 @@
+"""
+Compare chunking strategies on real files or a synthetic document.
+
+    cd backend
+    python benchmarks/bench_chunking.py                      # synthetic text
+    python benchmarks/bench_chunking.py data/documents/*.pdf --json
+
+For each strategy reports chunk count, token fill of the embedding
+window, chunks the model would truncate, and chunking throughput.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from typing import List, Dict, Any
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunking import CHUNKERS, CHUNK_MAX_TOKENS, count_tokens  # noqa: E402
+from loaders import iter_segments, Segment  # noqa: E402
+
+WORDS = (
+    "policy employee leave salary benefit travel approval manager report "
+    "quarter revenue contract vendor invoice payment schedule project review "
+    "security access account system process request document team office"
+).split()
+
+
+def synthetic_segments(pages: int = 50, seed: int = 7) -> List[Segment]:
+    """
+    Pages of headed sections with paragraphs of varying length.
+    """
+    rng = random.Random(seed)
+    segments = []
+    for page in range(1, pages + 1):
+        lines = []
+        for section in range(rng.randint(1, 3)):
+            lines.append(f"{page}.{section + 1} {rng.choice(WORDS).title()} {rng.choice(WORDS).title()}")
+            for _ in range(rng.randint(1, 4)):
+                sentences = [
+                    " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 20))).capitalize() + "."
+                    for _ in range(rng.randint(2, 8))
+                ]
+                lines.append(" ".join(sentences))
+                lines.append("")
+        segments.append(("\n".join(lines), {"page": page}))
+    return segments
+
+
+def run(name: str, segments: List[Segment]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    chunks = list(CHUNKERS[name](iter(segments)))
+    seconds = time.perf_counter() - started
+
+    tokens = [count_tokens(text) for text, _ in chunks] or [0]
+    chars = sum(len(text) for text, _ in segments)
+    return {
+        "strategy": name,
+        "chunks": len(chunks),
+        "mean_tokens": round(statistics.mean(tokens), 1),
+        "min_tokens": min(tokens),
+        "max_tokens": max(tokens),
+        "fill": round(statistics.mean(tokens) / CHUNK_MAX_TOKENS, 3),
+        "truncated": sum(1 for t in tokens if t > CHUNK_MAX_TOKENS),
+        "seconds": round(seconds, 4),
+        "chunks_per_s": round(len(chunks) / seconds, 1) if seconds else None,
+        "mb_per_s": round(chars / 1e6 / seconds, 2) if seconds else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("files", nargs="*", help="documents to chunk (default: synthetic)")
+    parser.add_argument("--pages", type=int, default=50, help="synthetic document pages")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    if args.files:
+        segments = [s for path in args.files for s in iter_segments(path)]
+    else:
+        segments = synthetic_segments(args.pages)
+
+    # Load the tokenizer before timing anything.
+    count_tokens("warmup")
+
+    results = [run(name, segments) for name in CHUNKERS]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'strategy':<10} {'chunks':>7} {'mean tok':>9} {'fill':>6} {'trunc':>6} {'chunks/s':>9} {'MB/s':>6}")
+    for r in results:
+        print(
+            f"{r['strategy']:<10} {r['chunks']:>7} {r['mean_tokens']:>9} {r['fill']:>6} "
+            f"{r['truncated']:>6} {r['chunks_per_s']:>9} {r['mb_per_s']:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
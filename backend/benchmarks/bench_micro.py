@@ -0,0 +1,214 @@
+"""
+Microbenchmarks of the ingest and retrieval hot paths.
+
+    cd backend
+    python benchmarks/bench_micro.py --fake-embeddings
+    python benchmarks/bench_micro.py --vectors 50000 --chroma-latency-ms 20 --json
+
+Times chunk_text, load_file per document type, embed_texts (cold and
+cached, per batch size) and VectorStore.search against the in-process
+Chroma fake, unfiltered and filtered by file. Everything runs in a
+scratch directory, so the real data/ is never touched.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import prepare_workdir, summarize, write_results  # noqa: E402
+
+
+def _repeat(fn: Callable[[], Any], repeats: int) -> List[float]:
+    seconds = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - started)
+    return seconds
+
+
+def bench_chunk_text(text: str, repeats: int) -> Dict[str, Any]:
+    from ingest import chunk_text
+
+    chunks = len(chunk_text(text))
+    seconds = _repeat(lambda: chunk_text(text), repeats)
+    mb = len(text.encode("utf-8")) / 1e6
+    return {
+        "chars": len(text),
+        "chunks": chunks,
+        "mb_per_second": round(mb / min(seconds), 2),
+        "latency": summarize(seconds),
+    }
+
+
+def bench_load_file(corpus: Dict[str, Any], repeats: int) -> Dict[str, Any]:
+    from loaders import load_file
+
+    results = {}
+    for path in corpus:
+        ext = os.path.splitext(path)[1].lstrip(".")
+        if ext in results:
+            continue
+        size = os.path.getsize(path)
+        seconds = _repeat(lambda: load_file(path), repeats)
+        results[ext] = {
+            "bytes": size,
+            "chars": len(load_file(path)),
+            "mb_per_second": round(size / 1e6 / min(seconds), 2),
+            "latency": summarize(seconds),
+        }
+    return results
+
+
+def bench_embed_texts(texts: List[str], batch_sizes: List[int]) -> Dict[str, Any]:
+    """
+    Cold: every text is new to the cache. Cached: the same batch again.
+    """
+    import embeddings
+
+    results = {}
+    offset = 0
+    for size in batch_sizes:
+        # Unique texts per batch size, so earlier sizes don't warm the cache.
+        batch = [f"{text} #{offset + i}" for i, text in enumerate(texts[:size])]
+        offset += size
+
+        started = time.perf_counter()
+        embeddings.embed_texts(batch)
+        cold = time.perf_counter() - started
+
+        started = time.perf_counter()
+        embeddings.embed_texts(batch)
+        cached = time.perf_counter() - started
+
+        results[str(len(batch))] = {
+            "cold_ms": round(cold * 1000, 3),
+            "cached_ms": round(cached * 1000, 3),
+            "cold_texts_per_second": round(len(batch) / cold, 1),
+            "cached_texts_per_second": round(len(batch) / cached, 1),
+        }
+    return results
+
+
+def bench_search(vectors: int, files: int, dim: int, queries: int, k: int) -> Dict[str, Any]:
+    """
+    VectorStore.search over `vectors` synthetic unit vectors spread over
+    `files` file names. Latency includes the injected Chroma round trip.
+    """
+    from vector_store import VectorStore
+
+    rng = np.random.default_rng(7)
+    store = VectorStore(collection_name="bench_micro")
+
+    started = time.perf_counter()
+    batch = 5000
+    for start in range(0, vectors, batch):
+        n = min(batch, vectors - start)
+        block = rng.standard_normal((n, dim)).astype(np.float32)
+        block /= np.linalg.norm(block, axis=1, keepdims=True)
+        store.upsert(
+            ids=[f"v{start + i}" for i in range(n)],
+            embeddings=block,
+            documents=[f"synthetic chunk {start + i}" for i in range(n)],
+            metadatas=[{"file_name": f"file_{(start + i) % files:03d}.pdf", "chunk_id": start + i} for i in range(n)],
+        )
+    load_seconds = time.perf_counter() - started
+
+    probes = rng.standard_normal((queries, dim)).astype(np.float32)
+    probes /= np.linalg.norm(probes, axis=1, keepdims=True)
+
+    def run(file_name=None) -> List[float]:
+        seconds = []
+        for probe in probes:
+            started = time.perf_counter()
+            store.search(probe, k=k, file_name=file_name)
+            seconds.append(time.perf_counter() - started)
+        return seconds
+
+    return {
+        "vectors": vectors,
+        "dim": dim,
+        "load_vectors_per_second": round(vectors / load_seconds, 1),
+        "unfiltered": summarize(run()),
+        "filtered": summarize(run(file_name="file_000.pdf")),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--fake-embeddings", action="store_true", help="hash encoder instead of the real model")
+    parser.add_argument("--chroma-latency-ms", type=float, default=0.0, help="injected Chroma round trip")
+    parser.add_argument("--pages", type=int, default=20, help="pages per synthetic PDF")
+    parser.add_argument("--rows", type=int, default=2000, help="rows of the synthetic XLSX")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--batch-sizes", default="1,8,32,128", help="comma-separated embed_texts batch sizes")
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--files", type=int, default=50, help="distinct file names among the vectors")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--out", help="results file (default: benchmarks/results/micro-<time>.json)")
+    args = parser.parse_args()
+
+    workdir = prepare_workdir(env={"ANSWER_CACHE": "0"})
+
+    from corpus import make_corpus
+    from fakes import Latency, install_fakes
+    from loaders import load_file
+
+    installed = install_fakes(
+        chroma_latency=Latency(args.chroma_latency_ms, seed=args.seed),
+        fake_embeddings=args.fake_embeddings,
+    )
+    corpus = make_corpus(
+        os.path.join(workdir, "corpus"), pdf=1, docx=1, xlsx=1,
+        pages=args.pages, rows=args.rows, seed=args.seed,
+    )
+    text = load_file(next(p for p in corpus if p.endswith(".pdf")))
+    batch_sizes = [int(n) for n in args.batch_sizes.split(",") if n.strip()]
+    texts = [s for s in text.split(". ") if s.strip()]
+    while len(texts) < max(batch_sizes):
+        texts += texts
+
+    import embeddings
+
+    dim = int(np.asarray(embeddings.embed_texts(["dimension probe"])).shape[1])
+
+    print("[INFO] Timing chunk_text")
+    results: Dict[str, Any] = {"embeddings": installed["embeddings"]}
+    results["chunk_text"] = bench_chunk_text(text, args.repeats)
+    print("[INFO] Timing load_file")
+    results["load_file"] = bench_load_file(corpus, args.repeats)
+    print("[INFO] Timing embed_texts")
+    results["embed_texts"] = bench_embed_texts(texts, batch_sizes)
+    print(f"[INFO] Timing VectorStore.search over {args.vectors} vectors")
+    results["search"] = bench_search(args.vectors, args.files, dim, args.queries, args.k)
+
+    write_results("micro", results, args, args.out)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    chunking = results["chunk_text"]
+    print(f"\nchunk_text   {chunking['chunks']} chunks, {chunking['mb_per_second']} MB/s")
+    for ext, r in results["load_file"].items():
+        print(f"load_file    {ext:<5} {r['bytes'] / 1024:>7.0f} KB  {r['latency']['p50_ms']:>9.1f} ms  {r['mb_per_second']} MB/s")
+    for size, r in results["embed_texts"].items():
+        print(f"embed_texts  {size:>5}  cold {r['cold_ms']:>9.1f} ms  cached {r['cached_ms']:>7.2f} ms")
+    search = results["search"]
+    for name in ("unfiltered", "filtered"):
+        s = search[name]
+        print(f"search       {name:<10}  p50 {s['p50_ms']:>7.2f}  p95 {s['p95_ms']:>7.2f}  p99 {s['p99_ms']:>7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
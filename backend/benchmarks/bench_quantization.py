@@ -0,0 +1,91 @@
+"""
+Memory, recall and latency of the local index per vector dtype.
+
+    cd backend
+    python benchmarks/bench_quantization.py --rows 200000 --json
+
+Builds a throwaway LocalCollection per dtype over the same synthetic,
+clustered unit vectors (shaped like sentence embeddings) and compares
+top-k results against exact float32 search.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from local_store import LocalCollection, VECTOR_DTYPES  # noqa: E402
+
+
+def synthetic_vectors(rows: int, dim: int, seed: int = 7) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, rows // 200), dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), rows)]
+    vectors += 0.6 * rng.standard_normal((rows, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    vectors = synthetic_vectors(args.rows, args.dim)
+    queries = synthetic_vectors(args.queries, args.dim, seed=11)
+    ids = [str(i) for i in range(args.rows)]
+
+    results = []
+    exact = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for dtype in VECTOR_DTYPES:
+            collection = LocalCollection(dtype, os.path.join(tmp, dtype), dtype=dtype)
+            started = time.perf_counter()
+            collection.add(ids=ids, embeddings=vectors, metadatas=[{} for _ in ids])
+            build = time.perf_counter() - started
+
+            latencies, found = [], []
+            for query in queries:
+                started = time.perf_counter()
+                rows, _ = collection._top_k(query, None, args.k)
+                latencies.append(time.perf_counter() - started)
+                found.append(set(rows.tolist()))
+
+            if exact is None:
+                exact = found
+            recall = statistics.mean(len(f & e) / args.k for f, e in zip(found, exact))
+
+            results.append({
+                "dtype": dtype,
+                "rows": args.rows,
+                "resident_mb": round(collection.memory_bytes() / 1e6, 1),
+                "recall_at_k": round(recall, 4),
+                "query_ms_p50": round(statistics.median(latencies) * 1e3, 2),
+                "build_seconds": round(build, 2),
+            })
+            del collection
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'dtype':<8} {'resident MB':>12} {f'recall@{args.k}':>10} {'p50 ms':>8} {'build s':>8}")
+    for r in results:
+        print(
+            f"{r['dtype']:<8} {r['resident_mb']:>12} {r['recall_at_k']:>10} "
+            f"{r['query_ms_p50']:>8} {r['build_seconds']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Compare two benchmark result files and flag regressions.
+
+    cd backend
+    python benchmarks/compare_results.py benchmarks/results/load-A.json benchmarks/results/load-B.json --threshold 10
+
+Compares every latency (*_ms, lower is better) and throughput
+(*_per_second, higher is better) figure present in both files. Exits
+with status 1 if any got worse by more than --threshold percent, so it
+can gate CI.
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, Iterable, List, Tuple
+
+
+def _leaves(value: Any, path: str = "") -> Iterable[Tuple[str, float]]:
+    if isinstance(value, dict):
+        for key, child in value.items():
+            yield from _leaves(child, f"{path}.{key}" if path else str(key))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield path, float(value)
+
+
+def _direction(path: str) -> int:
+    """
+    +1 if higher is better, -1 if lower is better, 0 if not compared.
+    """
+    name = path.rsplit(".", 1)[-1]
+    if name.endswith("_per_second"):
+        return 1
+    if name.endswith("_ms"):
+        return -1
+    return 0
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any], threshold: float, min_ms: float) -> List[Dict[str, Any]]:
+    before = dict(_leaves(old.get("results", {})))
+    after = dict(_leaves(new.get("results", {})))
+
+    rows = []
+    for path, old_value in before.items():
+        direction = _direction(path)
+        if not direction or path not in after:
+            continue
+        new_value = after[path]
+        # Sub-millisecond timings are mostly noise.
+        if direction < 0 and max(old_value, new_value) < min_ms:
+            continue
+        if old_value == 0:
+            continue
+        change = (new_value - old_value) / old_value * 100
+        rows.append({
+            "metric": path,
+            "old": old_value,
+            "new": new_value,
+            "change_percent": round(change, 1),
+            "regression": change * direction < -threshold,
+        })
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent change that counts as a regression")
+    parser.add_argument("--min-ms", type=float, default=1.0, help="ignore latencies below this in both runs")
+    parser.add_argument("--all", action="store_true", help="list every compared metric, not only regressions")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    with open(args.old, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+
+    if old.get("benchmark") != new.get("benchmark"):
+        print(f"[WARN] Comparing different benchmarks: {old.get('benchmark')} vs {new.get('benchmark')}")
+
+    rows = compare(old, new, args.threshold, args.min_ms)
+    regressions = [r for r in rows if r["regression"]]
+
+    if args.json:
+        print(json.dumps({"compared": len(rows), "regressions": regressions, "metrics": rows}, indent=2))
+    else:
+        print(f"{old.get('git_commit')} ({old.get('created_at')}) -> {new.get('git_commit')} ({new.get('created_at')})")
+        shown = rows if args.all else regressions
+        for r in shown:
+            flag = "REGRESSION" if r["regression"] else ""
+            print(f"{r['metric']:<55} {r['old']:>12.2f} {r['new']:>12.2f} {r['change_percent']:>+8.1f}%  {flag}")
+        print(f"\n{len(rows)} metrics compared, {len(regressions)} regressed by more than {args.threshold:g}%")
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
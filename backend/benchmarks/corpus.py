@@ -0,0 +1,222 @@
+"""
+Synthetic documents for benchmarks: PDF, DOCX and XLSX files built from a
+fixed vocabulary, reproducible from a seed.
+
+    cd backend
+    python benchmarks/corpus.py /tmp/corpus --pdf 5 --docx 5 --xlsx 2
+
+Every document covers a few topics with "The <topic> <attribute> is
+<value>." facts, so questions generated from the returned facts have
+real answers in the vault.
+"""
+import argparse
+import os
+import random
+from typing import Dict, List, Tuple
+
+WORDS = (
+    "policy employee leave salary benefit travel approval manager report "
+    "quarter revenue contract vendor invoice payment schedule project review "
+    "security access account system process request document team office"
+).split()
+
+TOPICS = (
+    "onboarding", "expenses", "procurement", "payroll", "compliance", "retention",
+    "hardware", "licensing", "recruiting", "facilities", "insurance", "training",
+)
+ATTRIBUTES = ("owner", "deadline", "budget", "threshold", "contact", "frequency", "limit", "code")
+
+# (file_name, topic, attribute, value)
+Fact = Tuple[str, str, str, str]
+
+
+def _sentence(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 18))).capitalize() + "."
+
+
+def _value(rng: random.Random) -> str:
+    return f"{rng.choice(WORDS)}-{rng.randint(100, 9999)}"
+
+
+def _sections(file_name: str, sections: int, rng: random.Random) -> Tuple[List[Tuple[str, List[str]]], List[Fact]]:
+    """
+    [(heading, paragraphs)] with one fact per section.
+    """
+    out, facts = [], []
+    for number in range(1, sections + 1):
+        topic = rng.choice(TOPICS)
+        attribute = rng.choice(ATTRIBUTES)
+        value = _value(rng)
+        facts.append((file_name, topic, attribute, value))
+
+        paragraphs = [" ".join(_sentence(rng) for _ in range(rng.randint(3, 7))) for _ in range(rng.randint(2, 4))]
+        fact = f"The {topic} {attribute} is {value}."
+        paragraphs.insert(rng.randint(0, len(paragraphs)), fact)
+        out.append((f"{number} {topic.title()} {rng.choice(WORDS).title()}", paragraphs))
+    return out, facts
+
+
+# -------- PDF --------
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _wrap(text: str, width: int = 90) -> List[str]:
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + 1 + len(word) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}".strip()
+    if line:
+        lines.append(line)
+    return lines
+
+
+def write_pdf(path: str, pages: List[List[str]]) -> None:
+    """
+    Minimal text-only PDF (Helvetica, one content stream per page), so no
+    PDF library is needed to generate one.
+    """
+    objects: List[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = add(b"")
+    kids = []
+    for lines in pages:
+        ops = ["BT /F1 10 Tf 40 800 Td 12 TL"]
+        ops += [f"({_pdf_escape(line)}) Tj T*" for line in lines]
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1", "replace")
+        content = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        kids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_id, font, content)
+        ))
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % k for k in kids), len(kids)
+    )
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def make_pdf(path: str, pages: int = 10, seed: int = 0) -> List[Fact]:
+    rng = random.Random(seed)
+    file_name = os.path.basename(path)
+    sections, facts = _sections(file_name, pages * 2, rng)
+
+    lines_per_page = 60
+    lines: List[str] = []
+    for heading, paragraphs in sections:
+        lines.append(heading)
+        for paragraph in paragraphs:
+            lines += _wrap(paragraph)
+            lines.append("")
+    page_lines = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)]
+    write_pdf(path, page_lines)
+    return facts
+
+
+# -------- DOCX --------
+def make_docx(path: str, sections: int = 10, seed: int = 0) -> List[Fact]:
+    from docx import Document
+
+    rng = random.Random(seed)
+    content, facts = _sections(os.path.basename(path), sections, rng)
+
+    document = Document()
+    for heading, paragraphs in content:
+        document.add_heading(heading, level=1)
+        for paragraph in paragraphs:
+            document.add_paragraph(paragraph)
+    document.save(path)
+    return facts
+
+
+# -------- XLSX --------
+def make_xlsx(path: str, rows: int = 500, seed: int = 0) -> List[Fact]:
+    from openpyxl import Workbook
+
+    rng = random.Random(seed)
+    file_name = os.path.basename(path)
+    facts = []
+
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = "Register"
+    sheet.append(["ID", "Topic", "Attribute", "Value", "Amount", "Notes"])
+    for row in range(1, rows + 1):
+        topic, attribute, value = rng.choice(TOPICS), rng.choice(ATTRIBUTES), _value(rng)
+        if row % 50 == 0:
+            facts.append((file_name, topic, attribute, value))
+        sheet.append([
+            f"R{row:05d}", topic, attribute, value,
+            round(rng.uniform(10, 10000), 2),
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 10))),
+        ])
+    workbook.save(path)
+    return facts
+
+
+def make_corpus(
+    directory: str,
+    pdf: int = 3,
+    docx: int = 3,
+    xlsx: int = 1,
+    pages: int = 10,
+    rows: int = 500,
+    seed: int = 0,
+) -> Dict[str, List[Fact]]:
+    """
+    Write the corpus into `directory`; returns {path: facts}.
+    """
+    os.makedirs(directory, exist_ok=True)
+    corpus: Dict[str, List[Fact]] = {}
+    for i in range(pdf):
+        path = os.path.join(directory, f"report_{i + 1:03d}.pdf")
+        corpus[path] = make_pdf(path, pages=pages, seed=seed * 1000 + i)
+    for i in range(docx):
+        path = os.path.join(directory, f"handbook_{i + 1:03d}.docx")
+        corpus[path] = make_docx(path, sections=pages * 2, seed=seed * 1000 + 100 + i)
+    for i in range(xlsx):
+        path = os.path.join(directory, f"register_{i + 1:03d}.xlsx")
+        corpus[path] = make_xlsx(path, rows=rows, seed=seed * 1000 + 200 + i)
+    return corpus
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("directory")
+    parser.add_argument("--pdf", type=int, default=3)
+    parser.add_argument("--docx", type=int, default=3)
+    parser.add_argument("--xlsx", type=int, default=1)
+    parser.add_argument("--pages", type=int, default=10, help="pages per PDF (DOCX get as many sections x2)")
+    parser.add_argument("--rows", type=int, default=500, help="rows per XLSX")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.directory, args.pdf, args.docx, args.xlsx, args.pages, args.rows, args.seed)
+    for path, facts in corpus.items():
+        print(f"[INFO] {path}: {os.path.getsize(path) / 1024:.0f} KB, {len(facts)} facts")
+
+
+if __name__ == "__main__":
+    main()
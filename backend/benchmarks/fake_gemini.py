@@ -0,0 +1,189 @@
+"""
+Local stand-in for the Gemini API, for exercising the LLM gateway.
+
+    cd backend
+    python benchmarks/fake_gemini.py --port 8765 --latency-ms 300 --error-rate 0.1
+    GEMINI_BASE_URL=http://127.0.0.1:8765 GEMINI_API_KEY=fake uvicorn main:app
+
+Serves generateContent and streamGenerateContent (?alt=sse) for any
+model. Latency, a slow tail, 429/503 errors and empty answers are
+injected at configurable rates; GET /stats reports what was served.
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Any, Dict
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass
+class FakeGeminiConfig:
+    latency_ms: float = 200.0
+    jitter_ms: float = 50.0
+    # Share of requests that take slow_ms instead (the tail hedging targets).
+    slow_rate: float = 0.0
+    slow_ms: float = 3000.0
+    # Share of requests answered with 429 / 503.
+    rate_limit_rate: float = 0.0
+    error_rate: float = 0.0
+    empty_rate: float = 0.0
+    stream_chunks: int = 5
+    seed: int = 0
+
+
+def _answer_text(prompt: str) -> str:
+    words = prompt.split()
+    return "Fake answer based on: " + " ".join(words[-12:])
+
+
+def _response(text: str, prompt: str, model: str) -> Dict[str, Any]:
+    prompt_tokens = len(prompt.split())
+    answer_tokens = len(text.split())
+    return {
+        "candidates": [{
+            "content": {"role": "model", "parts": [{"text": text}] if text else []},
+            "finishReason": "STOP",
+            "index": 0,
+        }],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": answer_tokens,
+            "totalTokenCount": prompt_tokens + answer_tokens,
+        },
+        "modelVersion": model,
+    }
+
+
+def _error(code: int, status: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=code,
+        content={"error": {"code": code, "message": f"fake {status}", "status": status}},
+    )
+
+
+def create_app(config: FakeGeminiConfig = None) -> FastAPI:
+    config = config or FakeGeminiConfig()
+    rng = random.Random(config.seed)
+    counts = {"requests": 0, "streams": 0, "rate_limited": 0, "errors": 0, "empty": 0, "slow": 0}
+    lock = threading.Lock()
+
+    app = FastAPI(title="Fake Gemini")
+
+    def count(name: str) -> None:
+        with lock:
+            counts[name] += 1
+
+    def draw() -> Dict[str, Any]:
+        with lock:
+            roll = rng.random()
+            slow = rng.random() < config.slow_rate
+            empty = rng.random() < config.empty_rate
+            jitter = rng.uniform(-config.jitter_ms, config.jitter_ms)
+        outcome = None
+        if roll < config.rate_limit_rate:
+            outcome = (429, "RESOURCE_EXHAUSTED")
+        elif roll < config.rate_limit_rate + config.error_rate:
+            outcome = (503, "UNAVAILABLE")
+        delay = config.slow_ms if slow else max(0.0, config.latency_ms + jitter)
+        return {"error": outcome, "delay": delay / 1000.0, "slow": slow, "empty": empty}
+
+    @app.get("/stats")
+    def stats():
+        with lock:
+            return {"config": asdict(config), **counts}
+
+    @app.post("/{version}/models/{target}")
+    async def generate(version: str, target: str, request: Request):
+        model, _, method = target.partition(":")
+        body = await request.json()
+        prompt = " ".join(
+            part.get("text", "")
+            for content in body.get("contents", [])
+            for part in content.get("parts", [])
+        )
+
+        count("requests")
+        plan = draw()
+        if plan["error"]:
+            await asyncio.sleep(plan["delay"] / 4)
+            count("rate_limited" if plan["error"][0] == 429 else "errors")
+            return _error(*plan["error"])
+        if plan["slow"]:
+            count("slow")
+
+        text = "" if plan["empty"] else _answer_text(prompt)
+        if plan["empty"]:
+            count("empty")
+
+        if method != "streamGenerateContent":
+            await asyncio.sleep(plan["delay"])
+            return _response(text, prompt, model)
+
+        count("streams")
+        words = text.split(" ") if text else []
+        pieces = max(1, min(config.stream_chunks, len(words) or 1))
+        step = max(1, -(-len(words) // pieces))
+
+        async def events():
+            # First token after half the latency, the rest spread over the remainder.
+            await asyncio.sleep(plan["delay"] / 2)
+            groups = [words[i:i + step] for i in range(0, len(words), step)] or [[]]
+            for i, group in enumerate(groups):
+                piece = " ".join(group) + (" " if i < len(groups) - 1 else "")
+                yield f"data: {json.dumps(_response(piece, prompt, model))}\r\n\r\n"
+                await asyncio.sleep(plan["delay"] / 2 / len(groups))
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+class FakeGeminiServer:
+    """
+    Runs the fake server on a background thread (for benchmarks):
+
+        with FakeGeminiServer(FakeGeminiConfig(latency_ms=100)) as server:
+            os.environ["GEMINI_BASE_URL"] = server.url
+    """
+
+    def __init__(self, config: FakeGeminiConfig = None, host: str = "127.0.0.1", port: int = 8765):
+        self.url = f"http://{host}:{port}"
+        self._server = uvicorn.Server(
+            uvicorn.Config(create_app(config), host=host, port=port, log_level="warning")
+        )
+        self._thread = threading.Thread(target=self._server.run, name="fake-gemini", daemon=True)
+
+    def __enter__(self) -> "FakeGeminiServer":
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    defaults = FakeGeminiConfig()
+    for name, value in asdict(defaults).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+
+    config = FakeGeminiConfig(**{name: getattr(args, name) for name in asdict(defaults)})
+    print(f"[INFO] Fake Gemini on http://{args.host}:{args.port} ({asdict(config)})")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
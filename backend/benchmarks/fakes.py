@@ -0,0 +1,273 @@
+"""
+In-process fakes for the external services, with injected latency.
+
+- FakeChromaClient stands in for chromadb.CloudClient. Collections are
+  in-process LocalCollections, and every call first sleeps like a round
+  trip to Chroma Cloud.
+- FakeGenaiClient stands in for google.genai.Client: models and
+  aio.models with generate_content / generate_content_stream.
+- HashEncoder is a bag-of-words hashing encoder. It stands in for the
+  SentenceTransformer when the real model shouldn't be measured, or
+  isn't installed.
+
+install_fake_chroma() has to run before vector_store creates its client,
+so call it before the first VectorStore() is constructed.
+"""
+import asyncio
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import types
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from local_store import LocalCollection  # noqa: E402
+
+
+class Latency:
+    """
+    Sleep of `ms` ± `jitter_ms`; with probability `tail_rate` `tail_ms`
+    instead (the slow tail).
+    """
+
+    def __init__(self, ms: float = 0.0, jitter_ms: float = 0.0, tail_rate: float = 0.0, tail_ms: float = 0.0, seed: int = 0):
+        self.ms = ms
+        self.jitter_ms = jitter_ms
+        self.tail_rate = tail_rate
+        self.tail_ms = tail_ms
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self) -> float:
+        with self._lock:
+            if self.tail_rate and self._rng.random() < self.tail_rate:
+                return self.tail_ms / 1000.0
+            jitter = self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, self.ms + jitter) / 1000.0
+
+    def sleep(self) -> None:
+        seconds = self.draw()
+        if seconds:
+            time.sleep(seconds)
+
+    async def sleep_async(self) -> None:
+        seconds = self.draw()
+        if seconds:
+            await asyncio.sleep(seconds)
+
+
+# -------- CHROMA --------
+class FakeChromaCollection:
+    def __init__(self, collection: LocalCollection, latency: Latency):
+        self._collection = collection
+        self._latency = latency
+        self.name = collection.name
+
+    def _call(self, method: str, *args, **kwargs):
+        self._latency.sleep()
+        return getattr(self._collection, method)(*args, **kwargs)
+
+    def add(self, **kwargs):
+        return self._call("add", **kwargs)
+
+    def upsert(self, **kwargs):
+        return self._call("upsert", **kwargs)
+
+    def update(self, **kwargs):
+        return self._call("update", **kwargs)
+
+    def delete(self, **kwargs):
+        return self._call("delete", **kwargs)
+
+    def get(self, **kwargs):
+        return self._call("get", **kwargs)
+
+    def query(self, **kwargs):
+        return self._call("query", **kwargs)
+
+    def count(self):
+        return self._call("count")
+
+
+class FakeChromaClient:
+    """
+    chromadb.CloudClient look-alike; accepts and ignores the credentials.
+    """
+
+    def __init__(self, latency: Optional[Latency] = None, path: Optional[str] = None, **credentials):
+        self.latency = latency or Latency()
+        self.path = path or tempfile.mkdtemp(prefix="fake_chroma_")
+        self._collections: Dict[str, FakeChromaCollection] = {}
+        self._lock = threading.Lock()
+
+    def get_or_create_collection(self, name: str, **kwargs) -> FakeChromaCollection:
+        self.latency.sleep()
+        with self._lock:
+            if name not in self._collections:
+                local = LocalCollection(name, os.path.join(self.path, name))
+                self._collections[name] = FakeChromaCollection(local, self.latency)
+            return self._collections[name]
+
+
+def install_fake_chroma(latency: Optional[Latency] = None, path: Optional[str] = None) -> FakeChromaClient:
+    """
+    Make `import chromadb` return a module whose CloudClient is the fake,
+    and point vector_store at the chroma backend. Returns the client.
+    """
+    client = FakeChromaClient(latency, path)
+    module = types.ModuleType("chromadb")
+    module.CloudClient = lambda **credentials: client
+    sys.modules["chromadb"] = module
+
+    import vector_store
+
+    vector_store.VECTOR_BACKEND = "chroma"
+    vector_store._client = None
+    vector_store._collections.clear()
+    return client
+
+
+# -------- GEMINI --------
+class _Response:
+    def __init__(self, text: str):
+        self.text = text
+
+
+def _fake_answer(contents: Any) -> str:
+    words = str(contents).split()
+    return "Based on the context: " + " ".join(words[-24:])
+
+
+class _Models:
+    def __init__(self, owner: "FakeGenaiClient"):
+        self._owner = owner
+
+    def generate_content(self, model: str, contents: Any, config: Any = None) -> _Response:
+        self._owner._count()
+        self._owner.latency.sleep()
+        return _Response(_fake_answer(contents))
+
+
+class _AsyncModels:
+    def __init__(self, owner: "FakeGenaiClient"):
+        self._owner = owner
+
+    async def generate_content(self, model: str, contents: Any, config: Any = None) -> _Response:
+        self._owner._count()
+        await self._owner.latency.sleep_async()
+        return _Response(_fake_answer(contents))
+
+    async def generate_content_stream(self, model: str, contents: Any, config: Any = None):
+        self._owner._count()
+        text = _fake_answer(contents)
+        latency = self._owner.latency.draw()
+        pieces = self._owner.stream_chunks
+
+        async def chunks():
+            words = text.split(" ")
+            step = max(1, -(-len(words) // pieces))
+            groups = [words[i:i + step] for i in range(0, len(words), step)]
+            # First token after half the latency, the rest over the remainder.
+            await asyncio.sleep(latency / 2)
+            for i, group in enumerate(groups):
+                yield _Response(" ".join(group) + (" " if i < len(groups) - 1 else ""))
+                await asyncio.sleep(latency / 2 / len(groups))
+
+        return chunks()
+
+
+class FakeGenaiClient:
+    def __init__(self, latency: Optional[Latency] = None, stream_chunks: int = 5):
+        self.latency = latency or Latency()
+        self.stream_chunks = max(1, stream_chunks)
+        self.models = _Models(self)
+        self.aio = types.SimpleNamespace(models=_AsyncModels(self))
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _count(self) -> None:
+        with self._lock:
+            self.calls += 1
+
+
+def install_fake_genai(latency: Optional[Latency] = None, stream_chunks: int = 5) -> FakeGenaiClient:
+    """
+    Route llm.py (and its gateway) to a FakeGenaiClient. Returns the client.
+    """
+    os.environ.setdefault("GEMINI_API_KEY", "fake")
+    import llm
+
+    client = FakeGenaiClient(latency, stream_chunks)
+    llm.client = client
+    llm.gateway.client = client
+    return client
+
+
+# -------- EMBEDDINGS --------
+class HashEncoder:
+    """
+    SentenceTransformer.encode look-alike: hashed bag of words, unit
+    length. Has no tokenizer, so token counts use the regex fallback.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _vector(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().split():
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            vector[int.from_bytes(digest, "little") % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, texts, show_progress_bar: bool = False, **kwargs):
+        if isinstance(texts, str):
+            return self._vector(texts)
+        return np.stack([self._vector(t) for t in texts]) if texts else np.zeros((0, self.dim), dtype=np.float32)
+
+
+def install_hash_encoder(dim: int = 384) -> HashEncoder:
+    import embeddings
+
+    encoder = HashEncoder(dim)
+    embeddings._model = encoder
+    return encoder
+
+
+def embedding_model_available() -> bool:
+    try:
+        import sentence_transformers  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def install_fakes(
+    chroma_latency: Optional[Latency] = None,
+    gemini_latency: Optional[Latency] = None,
+    fake_embeddings: bool = False,
+) -> Dict[str, Any]:
+    """
+    Install the Chroma and Gemini fakes, and the hash encoder if asked
+    (or if sentence-transformers isn't installed).
+    """
+    installed: Dict[str, Any] = {
+        "chroma": install_fake_chroma(chroma_latency),
+        "genai": install_fake_genai(gemini_latency),
+        "embeddings": "model",
+    }
+    if fake_embeddings or not embedding_model_available():
+        if not fake_embeddings:
+            print("[WARN] sentence-transformers is not installed; using the hash encoder")
+        install_hash_encoder()
+        installed["embeddings"] = "hash"
+    return installed
+
@@ -0,0 +1,103 @@
+"""
+Shared plumbing for the benchmark scripts: an isolated working
+directory, latency summaries and JSON result files.
+"""
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from typing import Any, Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def prepare_workdir(workdir: Optional[str] = None, env: Optional[Dict[str, str]] = None) -> str:
+    """
+    chdir into a scratch directory so every data/ path the backend uses
+    (documents, caches, catalog, indexes) starts empty, and set `env`.
+    Must run before backend modules are imported: they read their
+    configuration at import time.
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix="kv_bench_")
+    os.makedirs(os.path.join(workdir, "data", "documents"), exist_ok=True)
+    os.chdir(workdir)
+
+    defaults = {
+        "GEMINI_API_KEY": "fake",
+        "EMBEDDING_CACHE_PATH": "",
+        "EMBEDDING_WARMUP": "0",
+    }
+    for key, value in {**defaults, **(env or {})}.items():
+        os.environ[key] = str(value)
+    return workdir
+
+
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(p * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(seconds: List[float]) -> Dict[str, Any]:
+    """
+    Count, mean and p50/p95/p99/max of a list of durations, in ms.
+    """
+    values = sorted(seconds)
+    if not values:
+        return {"count": 0}
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return None if value is None else round(value * 1000, 3)
+
+    return {
+        "count": len(values),
+        "mean_ms": ms(sum(values) / len(values)),
+        "p50_ms": ms(percentile(values, 0.50)),
+        "p95_ms": ms(percentile(values, 0.95)),
+        "p99_ms": ms(percentile(values, 0.99)),
+        "max_ms": ms(values[-1]),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR, capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def write_results(name: str, results: Dict[str, Any], args: Any, out: Optional[str] = None) -> str:
+    """
+    Save results with enough context (commit, machine, arguments) to
+    compare runs across versions. Returns the path written.
+    """
+    created = datetime.datetime.now(datetime.timezone.utc)
+    if out is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out = os.path.join(RESULTS_DIR, f"{name}-{created:%Y%m%d-%H%M%S}.json")
+
+    payload = {
+        "benchmark": name,
+        "created_at": created.isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": vars(args) if args is not None else {},
+        "results": results,
+    }
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2)
+    print(f"[INFO] Results written to {out}")
+    return out
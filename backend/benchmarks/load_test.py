@@ -0,0 +1,309 @@
+"""
+End-to-end load test of the API against local fakes.
+
+    cd backend
+    python benchmarks/load_test.py --fake-embeddings
+    python benchmarks/load_test.py --questions 500 --concurrency 32 --stream --json
+
+Generates a synthetic PDF/DOCX/XLSX corpus, uploads it through /upload
+and waits for the ingest jobs, then fires a mix of FACTUAL, VAGUE,
+SUMMARY, COMPARISON and META questions at /ask (or /ask/stream) with a
+fixed concurrency. Chroma and Gemini are in-process fakes with injected
+latency and the app runs in this process (over ASGI, or a local socket
+with --stream), so runs are reproducible and need no credentials.
+
+Reports ingest throughput, per-intent p50/p95/p99 and throughput, and
+the per-stage breakdown from kv_stage_seconds; results are saved as JSON
+for compare_results.py.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import prepare_workdir, summarize, write_results  # noqa: E402
+
+STAGES = ("answer_cache", "intent", "retrieval", "embed_query", "vector_search", "lexical_search", "rerank", "llm")
+FINISHED = {"ingested", "unchanged", "skipped", "failed", "done"}
+
+# Share of each intent in the question mix.
+MIX = {"FACTUAL": 0.6, "VAGUE": 0.1, "SUMMARY": 0.1, "COMPARISON": 0.1, "META": 0.1}
+
+
+def build_questions(corpus: Dict[str, List[Tuple[str, str, str, str]]], count: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    files = [os.path.basename(path) for path in corpus]
+    facts = [fact for file_facts in corpus.values() for fact in file_facts]
+
+    def factual() -> str:
+        file_name, topic, attribute, _ = rng.choice(facts)
+        return rng.choice([
+            f"What is the {topic} {attribute}?",
+            f"What is the {topic} {attribute} in {file_name}?",
+            f"Who or what is listed as the {topic} {attribute} for this period?",
+        ])
+
+    def vague() -> str:
+        _, topic, attribute, _ = rng.choice(facts)
+        return f"{topic} {attribute}?"
+
+    def summary() -> str:
+        return rng.choice([f"Summarize {rng.choice(files)}", "Give me an overview of all documents"])
+
+    def comparison() -> str:
+        a, b = rng.sample(files, 2) if len(files) > 1 else (files[0], files[0])
+        return f"Compare {a} and {b}"
+
+    def meta() -> str:
+        return rng.choice(["Which files are uploaded?", "What files do I have?"])
+
+    makers = {"FACTUAL": factual, "VAGUE": vague, "SUMMARY": summary, "COMPARISON": comparison, "META": meta}
+    intents = rng.choices(list(MIX), weights=list(MIX.values()), k=count)
+    return [makers[intent]() for intent in intents]
+
+
+async def ingest(client, corpus: Dict[str, Any], poll_seconds: float, timeout: float) -> Dict[str, Any]:
+    """
+    Upload every file, then poll its job until it finishes.
+    """
+    started = time.perf_counter()
+    jobs = {}
+    for path in corpus:
+        with open(path, "rb") as f:
+            response = await client.post("/upload", files={"file": (os.path.basename(path), f.read())})
+        response.raise_for_status()
+        jobs[response.json()["job_id"]] = path
+
+    finished: Dict[str, Dict[str, Any]] = {}
+    deadline = time.monotonic() + timeout
+    while len(finished) < len(jobs) and time.monotonic() < deadline:
+        for job_id in jobs:
+            if job_id in finished:
+                continue
+            job = (await client.get(f"/jobs/{job_id}")).json()
+            if job["status"] in FINISHED:
+                finished[job_id] = job
+        await asyncio.sleep(poll_seconds)
+    elapsed = time.perf_counter() - started
+
+    statuses: Dict[str, int] = defaultdict(int)
+    stages: Dict[str, float] = defaultdict(float)
+    chunks = 0
+    for job in finished.values():
+        statuses[job["status"]] += 1
+        chunks += (job.get("result") or {}).get("chunks", 0) or 0
+        for entry in job["stages"]:
+            stages[entry["name"]] += entry["seconds"]
+
+    total_bytes = sum(os.path.getsize(path) for path in corpus)
+    return {
+        "files": len(jobs),
+        "timed_out": len(jobs) - len(finished),
+        "statuses": dict(statuses),
+        "chunks": chunks,
+        "wall_seconds": round(elapsed, 3),
+        "files_per_second": round(len(finished) / elapsed, 3),
+        "mb_per_second": round(total_bytes / 1e6 / elapsed, 3),
+        "job_seconds": summarize([job["total_seconds"] or 0.0 for job in finished.values()]),
+        "stage_seconds": {name: round(seconds, 3) for name, seconds in stages.items()},
+    }
+
+
+async def ask(client, question: str, stream: bool) -> Dict[str, Any]:
+    started = time.perf_counter()
+    if not stream:
+        response = await client.get("/ask", params={"q": question})
+        return {"seconds": time.perf_counter() - started, "ok": response.status_code == 200}
+
+    first_token = None
+    async with client.stream("GET", "/ask/stream", params={"q": question}) as response:
+        ok = response.status_code == 200
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+                if event == "token" and first_token is None:
+                    first_token = time.perf_counter() - started
+                elif event == "error":
+                    ok = False
+    return {"seconds": time.perf_counter() - started, "first_token": first_token, "ok": ok}
+
+
+async def run_questions(client, questions: List[str], concurrency: int, stream: bool) -> Dict[str, Any]:
+    from rag import detect_intent
+
+    semaphore = asyncio.Semaphore(concurrency)
+    samples: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+
+    async def one(question: str) -> None:
+        async with semaphore:
+            try:
+                sample = await ask(client, question, stream)
+            except Exception as e:
+                print(f"[WARN] Request failed: {e}")
+                sample = {"seconds": 0.0, "ok": False}
+        samples[detect_intent(question)].append(sample)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(q) for q in questions))
+    elapsed = time.perf_counter() - started
+
+    def report(group: List[Dict[str, Any]]) -> Dict[str, Any]:
+        ok = [s for s in group if s["ok"]]
+        out = {
+            "requests": len(group),
+            "errors": len(group) - len(ok),
+            "requests_per_second": round(len(group) / elapsed, 2),
+            "latency": summarize([s["seconds"] for s in ok]),
+        }
+        if stream:
+            out["first_token"] = summarize([s["first_token"] for s in ok if s.get("first_token") is not None])
+        return out
+
+    everything = [s for group in samples.values() for s in group]
+    return {
+        "wall_seconds": round(elapsed, 3),
+        "overall": report(everything),
+        "intents": {intent: report(group) for intent, group in sorted(samples.items())},
+    }
+
+
+@contextmanager
+def serve(app):
+    """
+    Run the app under uvicorn on a free local port, on a background
+    thread; yields its base URL.
+    """
+    import uvicorn
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="load-test-server", daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+
+async def run(args, corpus: Dict[str, Any], questions: List[str], base_url: Optional[str] = None) -> Dict[str, Any]:
+    import httpx
+
+    import main
+    from metrics import STAGE_SECONDS
+
+    # The ASGI transport buffers whole responses, so streaming runs go
+    # over a real socket to measure time to first token.
+    transport = None if base_url else httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url=base_url or "http://bench", timeout=None) as client:
+        print(f"[INFO] Ingesting {len(corpus)} files")
+        ingested = await ingest(client, corpus, args.poll_seconds, args.ingest_timeout)
+        print(f"[INFO] Asking {len(questions)} questions at concurrency {args.concurrency}")
+        answered = await run_questions(client, questions, args.concurrency, args.stream)
+    main.ingest_queue.shutdown()
+
+    return {
+        "ingest": ingested,
+        "questions": answered,
+        "stages": {stage: STAGE_SECONDS.snapshot(stage=stage) for stage in STAGES},
+        "llm": {k: v for k, v in main.gateway.stats().items() if not isinstance(v, dict)},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--fake-embeddings", action="store_true", help="hash encoder instead of the real model")
+    parser.add_argument("--chroma-latency-ms", type=float, default=20.0)
+    parser.add_argument("--chroma-jitter-ms", type=float, default=5.0)
+    parser.add_argument("--gemini-latency-ms", type=float, default=300.0)
+    parser.add_argument("--gemini-jitter-ms", type=float, default=100.0)
+    parser.add_argument("--gemini-tail-rate", type=float, default=0.0, help="share of calls taking --gemini-tail-ms")
+    parser.add_argument("--gemini-tail-ms", type=float, default=3000.0)
+    parser.add_argument("--pdf", type=int, default=3)
+    parser.add_argument("--docx", type=int, default=3)
+    parser.add_argument("--xlsx", type=int, default=1)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--stream", action="store_true", help="use /ask/stream and report time to first token")
+    parser.add_argument("--answer-cache", action="store_true", help="keep the answer cache on (off by default)")
+    parser.add_argument("--poll-seconds", type=float, default=0.05)
+    parser.add_argument("--ingest-timeout", type=float, default=600.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--out", help="results file (default: benchmarks/results/load-<time>.json)")
+    args = parser.parse_args()
+
+    workdir = prepare_workdir(env={"ANSWER_CACHE": "1" if args.answer_cache else "0"})
+
+    from corpus import make_corpus
+    from fakes import Latency, install_fakes
+
+    installed = install_fakes(
+        chroma_latency=Latency(args.chroma_latency_ms, args.chroma_jitter_ms, seed=args.seed),
+        gemini_latency=Latency(
+            args.gemini_latency_ms, args.gemini_jitter_ms,
+            tail_rate=args.gemini_tail_rate, tail_ms=args.gemini_tail_ms, seed=args.seed + 1,
+        ),
+        fake_embeddings=args.fake_embeddings,
+    )
+    corpus = make_corpus(
+        os.path.join(workdir, "corpus"), args.pdf, args.docx, args.xlsx,
+        pages=args.pages, rows=args.rows, seed=args.seed,
+    )
+    questions = build_questions(corpus, args.questions, args.seed)
+
+    if args.stream:
+        import main as app_module
+
+        with serve(app_module.app) as base_url:
+            results = asyncio.run(run(args, corpus, questions, base_url))
+    else:
+        results = asyncio.run(run(args, corpus, questions))
+    results["embeddings"] = installed["embeddings"]
+    results["gemini_calls"] = installed["genai"].calls
+
+    write_results("load", results, args, args.out)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    ingested = results["ingest"]
+    print(
+        f"\ningest   {ingested['files']} files, {ingested['chunks']} chunks in {ingested['wall_seconds']} s "
+        f"({ingested['files_per_second']} files/s, {ingested['mb_per_second']} MB/s) {ingested['statuses']}"
+    )
+    print(f"\n{'intent':<11} {'reqs':>5} {'errs':>5} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    answered = results["questions"]
+    for intent, r in [*answered["intents"].items(), ("ALL", answered["overall"])]:
+        latency = r["latency"]
+        print(
+            f"{intent:<11} {r['requests']:>5} {r['errors']:>5} {r['requests_per_second']:>7} "
+            f"{latency.get('p50_ms') or 0:>8.1f} {latency.get('p95_ms') or 0:>8.1f} {latency.get('p99_ms') or 0:>8.1f}"
+        )
+    print(f"\n{'stage':<15} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for stage, s in results["stages"].items():
+        if s["count"]:
+            print(f"{stage:<15} {s['count']:>6} {s['p50_ms']:>8.1f} {s['p95_ms']:>8.1f} {s['p99_ms']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Pipelined bulk writes into the vector store.
+
+Ingestion hands chunks to a BulkWriter as they come out of the chunker.
+Embedding runs on a pipeline thread while parsing continues, embedded
+batches are split into size-capped upserts, and a few writer threads
+push them concurrently with retry and backoff. Memory is bounded by the
+number of batches allowed in flight.
+"""
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import List, Dict, Any, Optional, Callable
+
+import numpy as np
+from dotenv import load_dotenv
+
+from embeddings import embed_texts
+from vector_store import VectorStore, VECTOR_WRITE_BATCH
+
+load_dotenv()
+
+# Concurrent upsert calls across all ingestions.
+VECTOR_WRITE_CONCURRENCY = int(os.getenv("VECTOR_WRITE_CONCURRENCY", "4"))
+# Embedding batches of one ingestion that may be embedded or written at once.
+VECTOR_WRITE_IN_FLIGHT = int(os.getenv("VECTOR_WRITE_IN_FLIGHT", "4"))
+VECTOR_WRITE_RETRIES = int(os.getenv("VECTOR_WRITE_RETRIES", "3"))
+VECTOR_WRITE_BACKOFF = float(os.getenv("VECTOR_WRITE_BACKOFF", "0.5"))
+
+_write_executor = ThreadPoolExecutor(
+    max_workers=max(1, VECTOR_WRITE_CONCURRENCY),
+    thread_name_prefix="vector-write",
+)
+# Hands batches to the embedding model so the ingest thread keeps parsing;
+# the model itself still runs on the embedding executor.
+_embed_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="ingest-embed")
+
+
+class BulkWriteError(Exception):
+    pass
+
+
+class BulkWriter:
+    """
+    Embeds and upserts chunks in the background for one ingestion.
+
+    submit() returns as soon as a batch is queued (blocking only when too
+    many batches are in flight); close() waits for everything and raises
+    BulkWriteError if a batch could not be written after retries.
+    """
+
+    def __init__(
+        self,
+        store: VectorStore,
+        lexical: Optional[Any] = None,
+        job: Optional[Any] = None,
+        embed_fn: Callable[[List[str]], np.ndarray] = embed_texts,
+        batch_size: int = VECTOR_WRITE_BATCH,
+        max_in_flight: int = VECTOR_WRITE_IN_FLIGHT,
+        retries: int = VECTOR_WRITE_RETRIES,
+        backoff: float = VECTOR_WRITE_BACKOFF,
+    ):
+        self.store = store
+        self.lexical = lexical
+        self.job = job
+        self.embed_fn = embed_fn
+        self.batch_size = max(1, batch_size)
+        self.retries = retries
+        self.backoff = backoff
+
+        self._slots = threading.BoundedSemaphore(max(1, max_in_flight))
+        self._lock = threading.Lock()
+        self._futures: List[Future] = []
+        self._errors: List[BaseException] = []
+        self._started = time.perf_counter()
+
+        self.chunks = 0
+        self.batches = 0
+        self.retried = 0
+        self.embed_seconds = 0.0
+        self.write_seconds = 0.0
+
+    # ---- pipeline ----
+    def submit(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        if not ids:
+            return
+        if self._errors:
+            raise BulkWriteError(str(self._errors[0])) from self._errors[0]
+
+        self._slots.acquire()
+        try:
+            future = _embed_executor.submit(self._embed_and_write, list(ids), list(texts), list(metadatas))
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._futures.append(future)
+
+    def _record(self, stage: str, seconds: float) -> None:
+        if self.job is not None:
+            self.job.record(stage, seconds)
+
+    def _embed_and_write(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        try:
+            started = time.perf_counter()
+            embeddings = self.embed_fn(texts)
+            seconds = time.perf_counter() - started
+            self._record("embedding", seconds)
+            with self._lock:
+                self.embed_seconds += seconds
+
+            writes = [
+                _write_executor.submit(
+                    self._write,
+                    ids[i:i + self.batch_size],
+                    embeddings[i:i + self.batch_size],
+                    texts[i:i + self.batch_size],
+                    metadatas[i:i + self.batch_size],
+                )
+                for i in range(0, len(ids), self.batch_size)
+            ]
+            for write in writes:
+                write.result()
+        except BaseException as e:
+            with self._lock:
+                self._errors.append(e)
+            raise
+        finally:
+            self._slots.release()
+
+    def _write(self, ids, embeddings, texts, metadatas) -> None:
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                self.store.upsert(
+                    ids=ids,
+                    embeddings=embeddings,
+                    documents=texts,
+                    metadatas=metadatas,
+                )
+                break
+            except Exception as e:
+                attempt += 1
+                if attempt > self.retries:
+                    print(f"[ERROR] Vector store write of {len(ids)} chunks failed: {e}")
+                    raise
+                delay = self.backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+                print(f"[WARN] Vector store write failed ({e}), retry {attempt} in {delay:.2f}s")
+                with self._lock:
+                    self.retried += 1
+                time.sleep(delay)
+
+        if self.lexical is not None:
+            self.lexical.add(ids=ids, texts=texts, metadatas=metadatas)
+
+        seconds = time.perf_counter() - started
+        self._record("storing", seconds)
+        with self._lock:
+            self.chunks += len(ids)
+            self.batches += 1
+            self.write_seconds += seconds
+
+    def close(self) -> Dict[str, Any]:
+        """
+        Wait for all submitted batches. Returns throughput stats.
+        """
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            try:
+                future.result()
+            except BaseException:
+                pass
+
+        if self._errors:
+            raise BulkWriteError(str(self._errors[0])) from self._errors[0]
+        return self.stats()
+
+    def stats(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self._started
+        return {
+            "chunks": self.chunks,
+            "batches": self.batches,
+            "retries": self.retried,
+            "embed_seconds": round(self.embed_seconds, 4),
+            "write_seconds": round(self.write_seconds, 4),
+            "elapsed_seconds": round(elapsed, 4),
+            "chunks_per_second": round(self.chunks / elapsed, 1) if elapsed > 0 else None,
+        }
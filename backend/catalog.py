@@ -0,0 +1,203 @@
+"""
+Catalog of ingested documents.
+
+One small record per file (doc_id, content hash, chunk count, ingest time,
+summary ID), kept in memory and persisted one row per file in SQLite.
+Listing files, answering META questions and resolving file references
+read this catalog instead of scanning collection metadata, so they cost
+the same however many chunks the vault holds. Ingestion writes only the
+rows it changes, so concurrent workers never drop each other's entries;
+each worker reloads its copy when another one has written.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Any
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Set CATALOG_PATH to an empty string to keep the catalog in memory only.
+CATALOG_PATH = os.getenv("CATALOG_PATH", "data/catalog.sqlite3")
+
+
+class DocumentCatalog:
+    def __init__(self, path: Optional[str] = CATALOG_PATH):
+        self.path = path or None
+        self._lock = threading.RLock()
+        self._documents: Dict[str, Dict[str, Any]] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._data_version: Optional[int] = None
+        # Bumped on every change so derived structures know to rebuild.
+        self.version = 0
+
+    # ---- persistence ----
+    def exists(self) -> bool:
+        return bool(self.path) and os.path.exists(self.path)
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self._db is None and self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                " file_name TEXT PRIMARY KEY,"
+                " record TEXT NOT NULL)"
+            )
+            db.commit()
+            self._db = db
+        return self._db
+
+    def load(self) -> None:
+        with self._lock:
+            db = self._connect()
+            if db is None:
+                return
+
+            # data_version changes whenever another connection commits.
+            self._data_version = db.execute("PRAGMA data_version").fetchone()[0]
+            self._documents = {
+                file_name: json.loads(record)
+                for file_name, record in db.execute("SELECT file_name, record FROM documents")
+            }
+            self.version += 1
+
+    def reload_if_changed(self) -> None:
+        """
+        Pick up writes made by another worker process.
+        """
+        with self._lock:
+            db = self._connect()
+            if db is not None and db.execute("PRAGMA data_version").fetchone()[0] != self._data_version:
+                self.load()
+
+    def _put(self, records: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            for record in records:
+                self._documents[record["file_name"]] = record
+            self.version += 1
+
+            db = self._connect()
+            if db is not None:
+                with db:
+                    db.executemany(
+                        "INSERT OR REPLACE INTO documents (file_name, record) VALUES (?, ?)",
+                        [(r["file_name"], json.dumps(r)) for r in records],
+                    )
+
+    # ---- updates ----
+    def upsert(
+        self,
+        file_name: str,
+        doc_id: str,
+        file_hash: str,
+        chunk_count: int,
+        summary_id: Optional[str] = None,
+        ingested_at: Optional[float] = None,
+        **extra: Any,
+    ) -> None:
+        self._put([{
+            "file_name": file_name,
+            "doc_id": doc_id,
+            "file_hash": file_hash,
+            "chunk_count": chunk_count,
+            "summary_id": summary_id,
+            "ingested_at": ingested_at if ingested_at is not None else time.time(),
+            **extra,
+        }])
+
+    def remove(self, file_name: str) -> None:
+        with self._lock:
+            if self._documents.pop(file_name, None) is None:
+                return
+            self.version += 1
+
+            db = self._connect()
+            if db is not None:
+                with db:
+                    db.execute("DELETE FROM documents WHERE file_name = ?", (file_name,))
+
+    # ---- reads ----
+    def get(self, file_name: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._documents.get(file_name)
+            return dict(entry) if entry else None
+
+    def file_names(self) -> List[str]:
+        with self._lock:
+            return sorted(self._documents)
+
+    def documents(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(self._documents[name]) for name in sorted(self._documents)]
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    # ---- bootstrap ----
+    def rebuild_from_store(self) -> None:
+        """
+        One-time scan of chunk and summary metadata, for vaults ingested
+        before the catalog existed.
+        """
+        from vector_store import VectorStore
+
+        documents: Dict[str, Dict[str, Any]] = {}
+        for meta in VectorStore().get(include=["metadatas"]):
+            file_name = meta.get("file_name")
+            if not file_name:
+                continue
+            entry = documents.setdefault(
+                file_name,
+                {
+                    "file_name": file_name,
+                    "doc_id": meta.get("doc_id"),
+                    "file_hash": meta.get("file_hash"),
+                    "chunk_count": 0,
+                    "summary_id": None,
+                    "ingested_at": None,
+                    "chunker": meta.get("chunker", "fixed"),
+                },
+            )
+            entry["chunk_count"] += 1
+
+        for meta in VectorStore(collection_name="knowledge_vault_summaries").get(include=["metadatas"]):
+            entry = documents.get(meta.get("file_name"))
+            if entry is not None:
+                entry["summary_id"] = meta["id"]
+
+        if documents:
+            self._put(list(documents.values()))
+        print(f"[INFO] Built document catalog with {len(documents)} files")
+
+
+_catalog: Optional[DocumentCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> DocumentCatalog:
+    """
+    Process-wide catalog: loaded from disk, or built once from the vector
+    store when no catalog file exists yet.
+    """
+    global _catalog
+
+    if _catalog is not None:
+        _catalog.reload_if_changed()
+        return _catalog
+
+    with _catalog_lock:
+        if _catalog is None:
+            catalog = DocumentCatalog()
+            if catalog.exists():
+                catalog.load()
+            else:
+                catalog.rebuild_from_store()
+            _catalog = catalog
+
+    return _catalog
@@ -0,0 +1,444 @@
+"""
+Chunking strategies.
+
+Every strategy is a generator over streamed (text, metadata) segments from
+loaders.iter_segments and yields (chunk text, chunk metadata):
+
+- fixed:     the original 500-character sliding window with 100 overlap
+- token:     sentence-packed chunks filling a token budget measured with
+             the embedding model's tokenizer, with a small sentence overlap
+- structure: paragraph- and heading-aware, token-budgeted; a heading
+             starts a new chunk and is repeated at the top of its chunks
+
+Row groups from tabular loaders (metadata "table") are handled the same
+way by every strategy: passed through whole, or split by rows with the
+headers repeated when they exceed the token budget.
+"""
+import os
+import re
+from typing import Iterable, Iterator, List, Dict, Any, Tuple, Optional, Callable
+
+from dotenv import load_dotenv
+
+from loaders import Segment
+
+load_dotenv()
+
+CHUNK_STRATEGY = os.getenv("CHUNK_STRATEGY", "structure").lower()
+# all-MiniLM-L6-v2 truncates at 256 tokens including [CLS]/[SEP].
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "250"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+
+Chunk = Tuple[str, Dict[str, Any]]
+
+# Loader-only metadata that is not stored with chunks.
+_TRANSIENT_KEYS = ("table", "row_numbers", "section")
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[A-Z0-9])")
+_FALLBACK_TOKEN = re.compile(r"\w+|[^\w\s]")
+_NUMBERED_HEADING = re.compile(r"^(\d+(\.\d+)*|[IVXLC]+|[A-Z])[.)]?\s+\S")
+
+
+# -------- TOKEN COUNTING --------
+_tokenizer = None
+_tokenizer_loaded = False
+
+
+def _get_tokenizer():
+    global _tokenizer, _tokenizer_loaded
+
+    if not _tokenizer_loaded:
+        try:
+            from embeddings import get_model
+
+            _tokenizer = getattr(get_model(), "tokenizer", None)
+        except Exception as e:
+            print(f"[WARN] Embedding tokenizer unavailable, estimating tokens: {e}")
+            _tokenizer = None
+        _tokenizer_loaded = True
+    return _tokenizer
+
+
+def count_tokens(text: str) -> int:
+    """
+    Tokens the embedding model will see for `text` (without special tokens).
+    """
+    tokenizer = _get_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+    return len(_FALLBACK_TOKEN.findall(text))
+
+
+def _token_spans(text: str) -> List[Tuple[int, int]]:
+    tokenizer = _get_tokenizer()
+    if tokenizer is not None and getattr(tokenizer, "is_fast", False):
+        encoded = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+        return [tuple(span) for span in encoded["offset_mapping"]]
+    return [m.span() for m in _FALLBACK_TOKEN.finditer(text)]
+
+
+def split_by_tokens(text: str, max_tokens: int) -> List[str]:
+    """
+    Hard split of a single over-long unit at token boundaries.
+    """
+    spans = _token_spans(text)
+    pieces = []
+    for start in range(0, len(spans), max_tokens):
+        window = spans[start:start + max_tokens]
+        piece = text[window[0][0]:window[-1][1]].strip()
+        if piece:
+            pieces.append(piece)
+    return pieces
+
+
+def _clean_meta(meta: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in meta.items() if k not in _TRANSIENT_KEYS}
+
+
+def _page_meta(metas: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    pages = [m["page"] for m in metas if "page" in m]
+    if not pages:
+        return {}
+    return {"page_start": min(pages), "page_end": max(pages)}
+
+
+# -------- TABLES --------
+def chunk_table(text: str, meta: Dict[str, Any], max_tokens: int = CHUNK_MAX_TOKENS) -> Iterator[Chunk]:
+    """
+    A row group as produced by loaders: title line, header line, rows.
+    Oversized groups are split by rows, repeating title and header.
+    """
+    text = text.strip()
+    base = _clean_meta(meta)
+
+    if count_tokens(text) <= max_tokens:
+        yield text, base
+        return
+
+    lines = text.split("\n")
+    head, rows = lines[:2], lines[2:]
+    row_numbers = meta.get("row_numbers") or []
+    sheet = meta.get("sheet")
+    head_tokens = count_tokens(head[-1])
+
+    group: List[int] = []
+    group_tokens = head_tokens
+
+    def render(indexes: List[int]) -> Chunk:
+        numbers = [row_numbers[i] for i in indexes if i < len(row_numbers)]
+        first, last = (numbers[0], numbers[-1]) if numbers else (base.get("row_start"), base.get("row_end"))
+        title = f"Sheet: {sheet} " if sheet else ""
+        body = "\n".join([f"{title}(rows {first}-{last})", head[-1]] + [rows[i] for i in indexes])
+        chunk_meta = dict(base)
+        if numbers:
+            chunk_meta.update({"row_start": first, "row_end": last})
+        return body, chunk_meta
+
+    for i, row in enumerate(rows):
+        row_tokens = count_tokens(row)
+        if group and group_tokens + row_tokens > max_tokens:
+            yield render(group)
+            group, group_tokens = [], head_tokens
+        group.append(i)
+        group_tokens += row_tokens
+
+    if group:
+        yield render(group)
+
+
+# -------- FIXED WINDOWS --------
+def _span_metadata(marks: List[Tuple[int, Dict[str, Any]]], start: int, end: int) -> Dict[str, Any]:
+    """
+    Page range covered by buffer[start:end], from segment start offsets.
+    """
+    return _page_meta(
+        meta
+        for i, (offset, meta) in enumerate(marks)
+        if offset < end and (i + 1 == len(marks) or marks[i + 1][0] > start)
+    )
+
+
+def chunk_fixed(
+    segments: Iterable[Segment],
+    chunk_size: int = 500,
+    overlap: int = 100,
+) -> Iterator[Chunk]:
+    """
+    Character sliding window over a stream of segments.
+
+    Windows are emitted as soon as enough text has arrived and consumed
+    text is dropped, so memory stays proportional to one window. Each
+    chunk carries the page range it spans when segments have pages.
+    """
+    step = chunk_size - overlap
+    buffer = ""
+    marks: List[Tuple[int, Dict[str, Any]]] = []
+    start = 0
+
+    def window(s: int):
+        chunk = buffer[s:s + chunk_size].strip()
+        return chunk, _span_metadata(marks, s, s + chunk_size)
+
+    def drain():
+        nonlocal buffer, marks, start
+        buffer = buffer.rstrip()
+        while start < len(buffer):
+            yield window(start)
+            start += step
+        buffer, marks, start = "", [], 0
+
+    for text, meta in segments:
+        text = text.replace("\x00", "")
+        if not text.strip():
+            continue
+
+        # Row groups from tabular loaders are already sized and must not
+        # be cut mid-row.
+        if meta.get("table"):
+            for chunk, chunk_meta in drain():
+                if chunk:
+                    yield chunk, chunk_meta
+            yield from chunk_table(text, meta)
+            continue
+
+        if not buffer:
+            text = text.lstrip()
+        else:
+            buffer += "\n"
+        marks.append((len(buffer), meta))
+        buffer += text
+
+        while start + chunk_size <= len(buffer):
+            chunk, chunk_meta = window(start)
+            if chunk:
+                yield chunk, chunk_meta
+            start += step
+
+        # Drop consumed text, keeping the segment the next window starts in.
+        if start:
+            keep = [i for i, (offset, _) in enumerate(marks) if offset <= start][-1:]
+            first = keep[0] if keep else 0
+            marks = [(offset - start, m) for offset, m in marks[first:]]
+            buffer = buffer[start:]
+            start = 0
+
+    for chunk, chunk_meta in drain():
+        if chunk:
+            yield chunk, chunk_meta
+
+
+# -------- TOKEN-BUDGETED PACKING --------
+class _Packer:
+    """
+    Packs text units into chunks that fill `max_tokens`, optionally
+    carrying the last units of a chunk over as overlap into the next.
+    """
+
+    def __init__(self, max_tokens: int, overlap_tokens: int = 0, joiner: str = "\n"):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.joiner = joiner
+        self.prefix = ""
+        self.prefix_tokens = 0
+        self.units: List[Tuple[str, int, Dict[str, Any]]] = []
+        self.tokens = 0
+        self.has_new = False
+
+    def set_prefix(self, prefix: str) -> None:
+        # A heading may take at most half the budget, leaving room for text.
+        limit = self.max_tokens // 2
+        if prefix and count_tokens(prefix) > limit:
+            pieces = split_by_tokens(prefix, limit) if limit > 0 else []
+            prefix = pieces[0] if pieces else ""
+        self.prefix = prefix
+        self.prefix_tokens = count_tokens(prefix) if prefix else 0
+
+    def _emit(self) -> Optional[Chunk]:
+        if not self.units or not self.has_new:
+            return None
+
+        body = self.joiner.join(text for text, _, _ in self.units)
+        text = f"{self.prefix}\n{body}" if self.prefix else body
+        meta = _page_meta(m for _, _, m in self.units)
+        if self.prefix:
+            meta["section"] = self.prefix[:200]
+        return text, meta
+
+    def flush(self, keep_overlap: bool = False) -> Optional[Chunk]:
+        chunk = self._emit()
+
+        carried: List[Tuple[str, int, Dict[str, Any]]] = []
+        if keep_overlap and self.overlap_tokens:
+            budget = self.overlap_tokens
+            for unit in reversed(self.units):
+                if unit[1] > budget:
+                    break
+                carried.insert(0, unit)
+                budget -= unit[1]
+
+        self.units = carried
+        self.tokens = sum(u[1] for u in carried)
+        self.has_new = False
+        return chunk
+
+    def add(self, text: str, meta: Dict[str, Any]) -> Iterator[Chunk]:
+        budget = max(1, self.max_tokens - self.prefix_tokens)
+        tokens = count_tokens(text)
+
+        if tokens <= budget:
+            yield from self._add_unit(text, tokens, budget, meta)
+            return
+
+        # Pieces are packed as they are, even if one re-tokenizes slightly
+        # over budget: splitting it again could go on forever.
+        for piece in split_by_tokens(text, budget):
+            yield from self._add_unit(piece, count_tokens(piece), budget, meta)
+
+    def _add_unit(self, text: str, tokens: int, budget: int, meta: Dict[str, Any]) -> Iterator[Chunk]:
+        if self.units and self.tokens + tokens > budget:
+            chunk = self.flush(keep_overlap=True)
+            if chunk:
+                yield chunk
+            # Overlap must still leave room for the new unit.
+            while self.units and self.tokens + tokens > budget:
+                self.tokens -= self.units.pop(0)[1]
+
+        self.units.append((text, tokens, meta))
+        self.tokens += tokens
+        self.has_new = True
+
+
+def _sentences(text: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_END.split(text) if s.strip()]
+
+
+def chunk_tokens(
+    segments: Iterable[Segment],
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+) -> Iterator[Chunk]:
+    """
+    Sentences packed to the embedding model's token budget.
+    """
+    packer = _Packer(max_tokens, overlap_tokens, joiner=" ")
+
+    for text, meta in segments:
+        text = text.replace("\x00", "")
+        if meta.get("table"):
+            chunk = packer.flush()
+            if chunk:
+                yield chunk
+            yield from chunk_table(text, meta, max_tokens)
+            continue
+
+        unit_meta = _clean_meta(meta)
+        for line in text.split("\n"):
+            for sentence in _sentences(line):
+                yield from packer.add(sentence, unit_meta)
+
+    chunk = packer.flush()
+    if chunk:
+        yield chunk
+
+
+# -------- STRUCTURE-AWARE --------
+def is_heading(line: str) -> bool:
+    """
+    Heuristic for heading lines in extracted PDF text.
+    """
+    line = line.strip()
+    if not line or len(line) > 80 or len(line.split()) > 10:
+        return False
+    if line[-1] in ".,;:!?":
+        return False
+    if not any(c.isalpha() for c in line):
+        return False
+    return line.isupper() or line.istitle() or bool(_NUMBERED_HEADING.match(line))
+
+
+def _blocks(text: str, section: Optional[str]) -> Iterator[Tuple[str, str]]:
+    """
+    ("heading", text) and ("paragraph", text) blocks. Consecutive lines
+    form a paragraph; blank lines and headings end it.
+    """
+    paragraph: List[str] = []
+
+    for line in text.split("\n"):
+        stripped = line.strip()
+        heading = stripped and (stripped == section or (section is None and is_heading(stripped)))
+
+        if not stripped or heading:
+            if paragraph:
+                yield "paragraph", "\n".join(paragraph)
+                paragraph = []
+            if heading:
+                yield "heading", stripped
+            continue
+
+        paragraph.append(stripped)
+
+    if paragraph:
+        yield "paragraph", "\n".join(paragraph)
+
+
+def chunk_structure(
+    segments: Iterable[Segment],
+    max_tokens: int = CHUNK_MAX_TOKENS,
+) -> Iterator[Chunk]:
+    """
+    Paragraphs packed to the token budget without crossing headings.
+
+    Segments from the DOCX loader carry their heading as "section"; for
+    PDF pages headings are detected heuristically. Paragraphs too long
+    for one chunk fall back to sentences, then to token splits.
+    """
+    packer = _Packer(max_tokens)
+
+    for text, meta in segments:
+        text = text.replace("\x00", "")
+        if meta.get("table"):
+            chunk = packer.flush()
+            if chunk:
+                yield chunk
+            packer.set_prefix("")
+            yield from chunk_table(text, meta, max_tokens)
+            continue
+
+        section = meta.get("section")
+        unit_meta = _clean_meta(meta)
+
+        for kind, block in _blocks(text, section):
+            if kind == "heading":
+                chunk = packer.flush()
+                if chunk:
+                    yield chunk
+                packer.set_prefix(block)
+                continue
+
+            if count_tokens(block) <= max_tokens - packer.prefix_tokens:
+                yield from packer.add(block, unit_meta)
+            else:
+                for sentence in _sentences(block.replace("\n", " ")):
+                    yield from packer.add(sentence, unit_meta)
+
+    chunk = packer.flush()
+    if chunk:
+        yield chunk
+
+
+# -------- REGISTRY --------
+CHUNKERS: Dict[str, Callable[[Iterable[Segment]], Iterator[Chunk]]] = {
+    "fixed": chunk_fixed,
+    "token": chunk_tokens,
+    "structure": chunk_structure,
+}
+
+
+def chunk_segments(segments: Iterable[Segment], strategy: Optional[str] = None) -> Iterator[Chunk]:
+    """
+    Chunk a segment stream with the configured (or given) strategy.
+    """
+    name = (strategy or CHUNK_STRATEGY).lower()
+    if name not in CHUNKERS:
+        raise ValueError(f"Unknown chunking strategy: {name}")
+    return CHUNKERS[name](segments)
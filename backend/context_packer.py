@@ -0,0 +1,176 @@
+"""
+Token-budgeted context for LLM prompts.
+
+Retrieved chunks (or summaries) arrive in relevance order. The packer
+takes them in that order until CONTEXT_MAX_TOKENS is reached, skipping
+near-duplicates of text already packed. Chunks from the same file that
+follow each other in the document are merged into one block with their
+shared overlap removed, so the prompt carries each passage once.
+"""
+import os
+import re
+from typing import List, Dict, Any, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from chunking import count_tokens, split_by_tokens
+
+load_dotenv()
+
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "1500"))
+# Word-shingle overlap (as a share of the smaller text) above which a
+# chunk counts as a near-duplicate of one already packed.
+CONTEXT_DUPLICATE_OVERLAP = float(os.getenv("CONTEXT_DUPLICATE_OVERLAP", "0.8"))
+
+SHINGLE_WORDS = 3
+# Longest chunk overlap looked for when stitching neighbours together,
+# and the shortest one trusted to be real overlap rather than chance.
+MAX_OVERLAP_CHARS = 1000
+MIN_OVERLAP_CHARS = 20
+# A truncated last block is only worth adding with at least this much room.
+MIN_TRUNCATED_TOKENS = 40
+
+_WORD = re.compile(r"\w+")
+
+
+def _shingles(text: str) -> set:
+    words = _WORD.findall(text.lower())
+    if len(words) < SHINGLE_WORDS:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def _duplicate_share(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def overlap_length(left: str, right: str) -> int:
+    """
+    Length of the longest suffix of `left` that is a prefix of `right`
+    (0 below MIN_OVERLAP_CHARS).
+    """
+    if not right:
+        return 0
+
+    tail = left[-MAX_OVERLAP_CHARS:]
+    start = max(0, len(tail) - len(right))
+    while True:
+        start = tail.find(right[0], start)
+        if start < 0 or len(tail) - start < MIN_OVERLAP_CHARS:
+            return 0
+        if right.startswith(tail[start:]):
+            return len(tail) - start
+        start += 1
+
+
+def _join(left: str, right: str) -> str:
+    overlap = overlap_length(left, right)
+    if overlap:
+        return left + right[overlap:]
+    return left.rstrip() + "\n" + right.lstrip()
+
+
+def _position(item: Dict[str, Any]) -> Optional[int]:
+    value = item.get("chunk_id")
+    return value if isinstance(value, int) else None
+
+
+class _Block:
+    """
+    One rendered context block: a chunk, or a run of neighbouring chunks
+    (positions first..last) of one file.
+    """
+
+    def __init__(self, item: Dict[str, Any], text: str):
+        self.file_name = item.get("file_name") or "unknown"
+        self.first = self.last = _position(item)
+        self.text = text
+        self.shingles = _shingles(text)
+        self.tokens = count_tokens(text)
+
+    def adjacent_to(self, file_name: str, position: int) -> bool:
+        return (
+            self.first is not None
+            and self.file_name == file_name
+            and (position == self.last + 1 or position == self.first - 1)
+        )
+
+
+def pack_context(
+    items: List[Dict[str, Any]],
+    max_tokens: Optional[int] = None,
+    label_separator: str = " ",
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Build the context string from `items` (dicts with "file_name", "text"
+    and, for chunks, an integer "chunk_id"), most relevant first.
+
+    Each block is rendered as "[file_name]<label_separator>text" and
+    blocks are separated by a blank line. Returns (context, stats); stats
+    include the packed token count and the sources actually used.
+    """
+    budget = CONTEXT_MAX_TOKENS if max_tokens is None else max_tokens
+    blocks: List[_Block] = []
+    used = 0
+    duplicates = merged = over_budget = truncated = 0
+
+    for item in items:
+        text = (item.get("text") or "").strip()
+        if not text:
+            continue
+
+        shingles = _shingles(text)
+        if any(_duplicate_share(shingles, b.shingles) >= CONTEXT_DUPLICATE_OVERLAP for b in blocks):
+            duplicates += 1
+            continue
+
+        # A neighbouring chunk of an already packed one extends that block.
+        position = _position(item)
+        neighbour = None
+        if position is not None:
+            file_name = item.get("file_name") or "unknown"
+            neighbour = next((b for b in blocks if b.adjacent_to(file_name, position)), None)
+
+        if neighbour is not None:
+            if position == neighbour.last + 1:
+                combined = _join(neighbour.text, text)
+            else:
+                combined = _join(text, neighbour.text)
+            extra = count_tokens(combined) - neighbour.tokens
+            if used + extra <= budget:
+                neighbour.first = min(neighbour.first, position)
+                neighbour.last = max(neighbour.last, position)
+                neighbour.text = combined
+                neighbour.shingles |= shingles
+                neighbour.tokens += extra
+                used += extra
+                merged += 1
+                continue
+
+        block = _Block(item, text)
+        if used + block.tokens > budget:
+            room = budget - used
+            if room < MIN_TRUNCATED_TOKENS:
+                over_budget += 1
+                continue
+            block = _Block(item, split_by_tokens(text, room)[0])
+            truncated += 1
+
+        blocks.append(block)
+        used += block.tokens
+
+    context = "\n\n".join(f"[{b.file_name}]{label_separator}{b.text}" for b in blocks)
+    sources = list(dict.fromkeys(b.file_name for b in blocks))
+
+    return context, {
+        "tokens": used,
+        "budget": budget,
+        "blocks": len(blocks),
+        "sources": sources,
+        "duplicates": duplicates,
+        "merged": merged,
+        "truncated": truncated,
+        "over_budget": over_budget,
+    }
@@ -0,0 +1,120 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Dict, Any, List, Sequence
+
+
+class EmbeddingBatcher:
+    """
+    Collects concurrent single-text encode requests and runs them through
+    one model call.
+
+    A batch closes when `max_batch_size` requests are waiting or
+    `max_wait_ms` has passed since its first request, whichever comes
+    first. While a batch is being encoded, new requests pile up for the
+    next one, so batching grows with load without extra waiting.
+    """
+
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], Sequence],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 2.0,
+    ):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+
+        # Metrics (set before the worker starts: _run updates them)
+        self.batches = 0
+        self.items = 0
+        self.max_seen_batch = 0
+        self.batch_size_counts: Dict[int, int] = {}
+        self._recent_waits: deque = deque(maxlen=1000)
+
+        self._thread = threading.Thread(
+            target=self._run, name="embedding-batcher", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        future: Future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def encode(self, text: str):
+        """
+        Blocking single-text encode that shares a model call with any
+        concurrent callers.
+        """
+        return self.submit(text).result()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+
+            # Identical concurrent texts are encoded once.
+            unique = list(dict.fromkeys(text for text, _, _ in batch))
+
+            try:
+                vectors = self.encode_fn(unique)
+                by_text = dict(zip(unique, vectors))
+                for text, future, _ in batch:
+                    future.set_result(by_text[text])
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+            with self._lock:
+                self.batches += 1
+                self.items += len(batch)
+                self.max_seen_batch = max(self.max_seen_batch, len(batch))
+                bucket = 1 << (len(batch) - 1).bit_length()
+                self.batch_size_counts[bucket] = self.batch_size_counts.get(bucket, 0) + 1
+                for _, _, enqueued in batch:
+                    self._recent_waits.append(started - enqueued)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._recent_waits)
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "mean_batch_size": round(self.items / self.batches, 2) if self.batches else None,
+                "max_batch_size": self.max_seen_batch,
+                # Batch sizes rounded up to the next power of two.
+                "batch_size_histogram": dict(sorted(self.batch_size_counts.items())),
+                "queue_depth": self._queue.qsize(),
+                "queue_wait_ms_p50": _percentile_ms(waits, 0.5),
+                "queue_wait_ms_p95": _percentile_ms(waits, 0.95),
+                "queue_wait_ms_max": _percentile_ms(waits, 1.0),
+            }
+
+
+def _percentile_ms(sorted_values: List[float], q: float):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return round(sorted_values[index] * 1000, 3)
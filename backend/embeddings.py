@@ -1,8 +1,198 @@
-from sentence_transformers import SentenceTransformer
-from typing import List
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Dict, Any
 
-model = SentenceTransformer("all-MiniLM-L6-v2")
+import numpy as np
+from dotenv import load_dotenv
+
+from embedding_cache import EmbeddingCache, cache_key
+from embedding_batcher import EmbeddingBatcher
+from metrics import span
+
+load_dotenv()
+
+MODEL_NAME = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+
+# Set EMBEDDING_CACHE_PATH to an empty string to keep the cache in memory only.
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "data/embedding_cache.sqlite3")
+EMBEDDING_CACHE_MEMORY = int(os.getenv("EMBEDDING_CACHE_MEMORY", "10000"))
+EMBEDDING_CACHE_DISK = int(os.getenv("EMBEDDING_CACHE_DISK", "200000"))
+
+_cache = EmbeddingCache(
+    path=EMBEDDING_CACHE_PATH or None,
+    max_memory_entries=EMBEDDING_CACHE_MEMORY,
+    max_disk_entries=EMBEDDING_CACHE_DISK,
+)
+
+# Model inference runs on its own small pool so CPU-bound encoding is
+# bounded and never occupies request-serving threads.
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "1"))
+# Large inputs are encoded in slices of this size so queued query
+# embeddings never wait behind a whole document.
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+_encode_executor = ThreadPoolExecutor(
+    max_workers=max(1, EMBEDDING_THREADS),
+    thread_name_prefix="embed",
+)
+
+# Concurrent query embeddings are micro-batched into one model call.
+EMBEDDING_QUERY_BATCH = int(os.getenv("EMBEDDING_QUERY_BATCH", "32"))
+EMBEDDING_QUERY_WAIT_MS = float(os.getenv("EMBEDDING_QUERY_WAIT_MS", "2"))
+
+_model = None
+_model_lock = threading.Lock()
+_load_seconds: Optional[float] = None
+_rss_before_load: Optional[int] = None
+_rss_after_load: Optional[int] = None
+
+
+def _resident_memory_bytes() -> Optional[int]:
+    """
+    Current resident set size of this process, or None if unavailable.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+
+    try:
+        import resource
+
+        # ru_maxrss is KiB on Linux, bytes on macOS; peak rather than current.
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if os.uname().sysname == "Darwin" else rss * 1024
+    except (ImportError, OSError):
+        return None
+
+
+def get_model():
+    """
+    Return the process-wide SentenceTransformer, loading it on first use.
+    """
+    global _model, _load_seconds, _rss_before_load, _rss_after_load
+
+    if _model is not None:
+        return _model
+
+    with _model_lock:
+        if _model is None:
+            from sentence_transformers import SentenceTransformer
+
+            _rss_before_load = _resident_memory_bytes()
+            start = time.perf_counter()
+            model = SentenceTransformer(MODEL_NAME)
+            _load_seconds = time.perf_counter() - start
+            _rss_after_load = _resident_memory_bytes()
+            _model = model
+
+            print(
+                f"[INFO] Loaded embedding model {MODEL_NAME} "
+                f"in {_load_seconds:.2f}s "
+                f"(rss {_format_mb(_rss_after_load)})"
+            )
+
+    return _model
+
+
+def warmup() -> Dict[str, Any]:
+    """
+    Load the model eagerly (e.g. from a startup hook) and run one encode
+    so the first real request doesn't pay for lazy initialisation.
+    """
+    get_model().encode(["warmup"], show_progress_bar=False)
+    return engine_stats()
+
+
+def is_loaded() -> bool:
+    return _model is not None
+
+
+def engine_stats() -> Dict[str, Any]:
+    """
+    Load time and memory figures, used to size workers.
+    """
+    model_bytes = None
+    if _rss_before_load is not None and _rss_after_load is not None:
+        model_bytes = _rss_after_load - _rss_before_load
+
+    return {
+        "model": MODEL_NAME,
+        "loaded": is_loaded(),
+        "load_seconds": round(_load_seconds, 3) if _load_seconds is not None else None,
+        "rss_bytes": _resident_memory_bytes(),
+        "model_rss_bytes": model_bytes,
+        "cache": _cache.stats(),
+        "query_batcher": _query_batcher.stats(),
+    }
+
+
+def _format_mb(n: Optional[int]) -> str:
+    return "n/a" if n is None else f"{n / (1024 * 1024):.0f} MB"
+
+
+def _encode(texts: List[str]):
+    return get_model().encode(texts, show_progress_bar=False)
+
+
+def embed_texts(texts: List[str]) -> np.ndarray:
+    """
+    Embed texts, serving repeats from the embedding cache and only
+    running the model on texts it hasn't seen.
+
+    Returns a (len(texts), dim) float32 array; vectors stay NumPy arrays
+    all the way into the vector store.
+    """
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    keys = [cache_key(MODEL_NAME, t) for t in texts]
+    cached = _cache.get_many(keys)
+
+    missing: Dict[str, str] = {}
+    for key, text in zip(keys, texts):
+        if key not in cached and key not in missing:
+            missing[key] = text
+
+    if missing:
+        pending = list(missing.values())
+        vectors = []
+        for start in range(0, len(pending), EMBEDDING_BATCH_SIZE):
+            batch = pending[start:start + EMBEDDING_BATCH_SIZE]
+            vectors.extend(_encode_executor.submit(_encode, batch).result())
+        computed = dict(zip(missing.keys(), vectors))
+        _cache.put_many(computed)
+        cached.update(computed)
+
+    return np.stack([cached[key] for key in keys]).astype(np.float32, copy=False)
+
+
+def _encode_on_executor(texts: List[str]):
+    return _encode_executor.submit(_encode, texts).result()
+
+
+_query_batcher = EmbeddingBatcher(
+    encode_fn=_encode_on_executor,
+    max_batch_size=EMBEDDING_QUERY_BATCH,
+    max_wait_ms=EMBEDDING_QUERY_WAIT_MS,
+)
+
+
+def embed_query(text: str) -> np.ndarray:
+    """
+    Embed a single query string as a float32 vector. Cache misses from
+    concurrent requests share one batched model call.
+    """
+    with span("embed_query"):
+        key = cache_key(MODEL_NAME, text)
+        cached = _cache.get_many([key])
+        if key in cached:
+            return cached[key]
+
+        vector = np.asarray(_query_batcher.encode(text), dtype=np.float32)
+        _cache.put_many({key: vector})
+        return vector
 
-def embed_texts(texts: List[str]) -> List[List[float]]:
-    embeddings = model.encode(texts, show_progress_bar=False)
-    return embeddings.tolist()
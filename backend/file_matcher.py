@@ -0,0 +1,173 @@
+"""
+Find which catalogued file a question refers to.
+
+An Aho-Corasick automaton over every file name and stem (plus the stem
+with "_"/"-" read as spaces) scans the question once, whatever the number
+of files. Matches must sit on word boundaries and the longest one wins,
+so "q3_report" beats "report" and "t.pdf" does not match inside "tpdf".
+A name shared by several files only resolves if something longer
+disambiguates it.
+"""
+import os
+import re
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple
+
+# Stems shorter than this are too likely to be ordinary words.
+MIN_STEM_LENGTH = 3
+
+_SEPARATORS = re.compile(r"[_\-]+")
+
+
+def _is_word_char(c: str) -> bool:
+    return c.isalnum()
+
+
+def patterns_for(file_name: str) -> Set[str]:
+    name = file_name.lower()
+    stem = os.path.splitext(name)[0]
+
+    patterns = {name}
+    if len(stem) >= MIN_STEM_LENGTH:
+        patterns.add(stem)
+        spaced = " ".join(_SEPARATORS.sub(" ", stem).split())
+        if len(spaced) >= MIN_STEM_LENGTH:
+            patterns.add(spaced)
+    return patterns
+
+
+class FileMatcher:
+    def __init__(self, file_names: List[str]):
+        # Trie as parallel lists: goto transitions, failure links and the
+        # patterns (by length) ending at each node.
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        self._files: Dict[str, Set[str]] = {}
+
+        for file_name in file_names:
+            for pattern in patterns_for(file_name):
+                self._files.setdefault(pattern, set()).add(file_name)
+
+        self._patterns = list(self._files)
+        for index, pattern in enumerate(self._patterns):
+            self._insert(pattern, index)
+        self._build_links()
+
+    def __len__(self) -> int:
+        return len(self._patterns)
+
+    def _insert(self, pattern: str, index: int) -> None:
+        node = 0
+        for c in pattern:
+            nxt = self._goto[node].get(c)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][c] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append(index)
+
+    def _build_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for c, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and c not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(c, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def find_all(self, text: str) -> List[Tuple[int, int, str]]:
+        """
+        (start, end, pattern) for every word-bounded match in `text`.
+        """
+        text = text.lower()
+        matches = []
+        node = 0
+        for i, c in enumerate(text):
+            while node and c not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(c, 0)
+
+            for index in self._out[node]:
+                pattern = self._patterns[index]
+                start = i - len(pattern) + 1
+                before = text[start - 1] if start > 0 else " "
+                after = text[i + 1] if i + 1 < len(text) else " "
+                if _is_word_char(pattern[0]) and _is_word_char(before):
+                    continue
+                if _is_word_char(pattern[-1]) and _is_word_char(after):
+                    continue
+                matches.append((start, i + 1, pattern))
+        return matches
+
+    def match(self, text: str) -> Optional[str]:
+        """
+        The file the longest match names, or None if there is no match or
+        the longest matches point at different files.
+        """
+        best: Optional[Set[str]] = None
+        best_len = 0
+        for start, end, pattern in self.find_all(text):
+            length = end - start
+            files = self._files[pattern]
+            if length > best_len:
+                best, best_len = set(files), length
+            elif length == best_len and best is not None:
+                best |= files
+
+        if best and len(best) == 1:
+            return next(iter(best))
+        return None
+
+
+# Catalogs up to this size are recompiled inline (a few milliseconds);
+# larger ones in the background while the previous matcher keeps serving.
+INLINE_REBUILD_FILES = 1000
+
+_matcher: Optional[FileMatcher] = None
+_matcher_version: Optional[int] = None
+_matcher_lock = threading.Lock()
+_rebuilding = False
+
+
+def _rebuild(catalog) -> None:
+    global _matcher, _matcher_version, _rebuilding
+
+    try:
+        version = catalog.version
+        matcher = FileMatcher(catalog.file_names())
+        _matcher, _matcher_version = matcher, version
+    finally:
+        _rebuilding = False
+
+
+def get_file_matcher() -> FileMatcher:
+    """
+    Matcher over the current catalog, recompiled when the catalog changes.
+    """
+    global _rebuilding
+    from catalog import get_catalog
+
+    catalog = get_catalog()
+    if _matcher_version == catalog.version:
+        return _matcher
+
+    if _matcher is None or len(catalog) <= INLINE_REBUILD_FILES:
+        with _matcher_lock:
+            if _matcher_version != catalog.version:
+                _rebuild(catalog)
+        return _matcher
+
+    with _matcher_lock:
+        if not _rebuilding:
+            _rebuilding = True
+            threading.Thread(target=_rebuild, args=(catalog,), name="file-matcher", daemon=True).start()
+    return _matcher
@@ -1,81 +1,302 @@
 import os
-import uuid
-from typing import List
+import time
+from contextlib import nullcontext
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple
 
-from embeddings import embed_texts
 from vector_store import VectorStore
+from bulk_writer import BulkWriter, BulkWriteError
 from summaries import DocumentSummaryStore
-from loaders import load_file   # ✅ NEW
+from llm_gateway import LLMUnavailableError
+from loaders import iter_segments, Segment   # ✅ NEW
+from chunking import chunk_segments, chunk_fixed, CHUNK_STRATEGY
+from lexical_index import get_lexical_index
+from catalog import get_catalog
+from utils import file_sha256, chunk_id_for, doc_id_for, mark_vault_changed
+
+# New chunks are embedded and stored in batches of this size while the
+# rest of the document is still being parsed.
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+
+MIN_TEXT_LENGTH = 50
+
+# Row groups per sheet that feed the document summary.
+TABLE_SUMMARY_GROUPS = int(os.getenv("TABLE_SUMMARY_GROUPS", "20"))
 
 
 # -------- TEXT CHUNKING --------
 def chunk_text(text: str, chunk_size: int = 500, overlap: int = 100) -> List[str]:
-    chunks = []
-    start = 0
-    text = text.replace("\x00", "").strip()
+    return [chunk for chunk, _ in chunk_fixed([(text, {})], chunk_size, overlap)]
 
-    while start < len(text):
-        end = start + chunk_size
-        chunk = text[start:end].strip()
 
-        if chunk:
-            chunks.append(chunk)
+# -------- GENERIC FILE INGESTION --------
+def _stage(job, name: str):
+    """
+    Timing scope for one pipeline stage; a no-op outside background jobs.
+    """
+    return job.stage(name) if job is not None else nullcontext()
 
-        start += chunk_size - overlap
 
-    return chunks
+def _timed(iterable: Iterable, job, name: str, exclude: Optional[str] = None) -> Iterator:
+    """
+    Charge the time spent producing each item to `name`, minus time the
+    same pull spent in the `exclude` stage (an upstream generator).
+    """
+    iterator = iter(iterable)
+    while True:
+        before = job.seconds(exclude) if job is not None and exclude else 0.0
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            item = StopIteration
+        if job is not None:
+            upstream = job.seconds(exclude) - before if exclude else 0.0
+            job.record(name, max(0.0, time.perf_counter() - started - upstream))
+        if item is StopIteration:
+            return
+        yield item
 
 
-# -------- GENERIC FILE INGESTION --------
-def ingest_file(path: str) -> None:
-    if not os.path.exists(path):
-        print(f"[ERROR] File not found: {path}")
+def _purge_previous_version(file_name: str, existing_ids: Iterable[str], store, lexical, catalog) -> None:
+    """
+    Remove the chunks, lexical postings, summary and catalog entry of an
+    earlier version of a file whose new version is skipped, so the old
+    content stops being served.
+    """
+    existing_ids = list(existing_ids)
+    if not existing_ids and catalog.get(file_name) is None:
         return
 
-    try:
-        full_text = load_file(path)   # ✅ GENERIC LOADER
-    except Exception as e:
-        print(f"[ERROR] Failed to read {path}: {e}")
-        return
+    store.delete(ids=existing_ids)
+    lexical.remove(existing_ids)
+    DocumentSummaryStore().remove(file_name)
+    catalog.remove(file_name)
+    mark_vault_changed()
+    print(f"[INFO] Removed the previous version of {file_name}")
 
-    if len(full_text.strip()) < 50:
-        print(f"[WARN] {os.path.basename(path)} has very little text. Skipping.")
-        return
 
-    chunks = chunk_text(full_text)
-    if not chunks:
-        return
+def ingest_file(path: str, job: Optional[Any] = None) -> Dict[str, Any]:
+    """
+    Parse, chunk, embed and store one file, then summarize it.
 
-    doc_id = str(uuid.uuid4())
+    Files and chunks are keyed by content hash: an unchanged file is
+    skipped, and for a changed file only new chunks are embedded while
+    chunks that disappeared are deleted. Parsing, chunking, embedding and
+    storing are streamed, so large files are written in batches while
+    later pages are still being parsed.
+
+    `job` (a jobs.IngestJob) receives per-stage timings when the file is
+    ingested in the background. Returns a small status dict.
+    """
     file_name = os.path.basename(path)
 
-    embeddings = embed_texts(chunks)
+    if not os.path.exists(path):
+        print(f"[ERROR] File not found: {path}")
+        return {"file_name": file_name, "status": "failed", "reason": "file not found"}
+
     store = VectorStore()
+    catalog = get_catalog()
 
-    metadatas = [
-        {
+    with _stage(job, "hashing"):
+        file_hash = file_sha256(path)
+        entry = catalog.get(file_name)
+
+    # Chunks written before chunking strategies existed used fixed windows;
+    # switching CHUNK_STRATEGY re-chunks a file the next time it is uploaded.
+    if (
+        entry
+        and entry.get("file_hash") == file_hash
+        and entry.get("chunker", "fixed") == CHUNK_STRATEGY
+    ):
+        print(f"[INFO] {file_name} is unchanged. Skipping.")
+        return {
+            "file_name": file_name,
+            "status": "unchanged",
+            "doc_id": entry.get("doc_id"),
+            "chunks": entry.get("chunk_count", 0),
+        }
+
+    # Only a new or changed file needs its current chunk IDs.
+    with _stage(job, "hashing"):
+        existing = store.get(file_name=file_name, include=["metadatas"])
+
+    doc_id = doc_id_for(file_name, file_hash)
+    existing_ids = {e["id"] for e in existing}
+    lexical = get_lexical_index()
+    # Embeds and writes new chunks in the background while parsing goes on.
+    writer = BulkWriter(store, lexical=lexical, job=job)
+
+    # Identical chunks within a file collapse onto one content-hash ID.
+    # Only chunks still waiting to be embedded keep their text in memory.
+    chunk_ids: Dict[str, int] = {}
+    chunk_metas: List[Dict[str, Any]] = []
+    new_ids: List[str] = []
+    pending: List[Tuple[str, str]] = []
+    text_parts: List[str] = []
+    table_groups: Dict[str, int] = {}
+
+    def metadata_for(cid: str) -> Dict[str, Any]:
+        i = chunk_ids[cid]
+        return {
             "doc_id": doc_id,
             "file_name": file_name,
             "source": file_name,
             "chunk_id": i,
+            "file_hash": file_hash,
+            "chunker": CHUNK_STRATEGY,
+            **chunk_metas[i],
         }
-        for i in range(len(chunks))
-    ]
 
-    store.add(
-        embeddings=embeddings,
-        documents=chunks,
-        metadatas=metadatas,
-    )
+    def flush_pending() -> None:
+        if not pending:
+            return
 
-    summary_store = DocumentSummaryStore()
-    summary_store.add_summary(
-        doc_id=doc_id,
+        ids = [cid for cid, _ in pending]
+        writer.submit(
+            ids=ids,
+            texts=[text for _, text in pending],
+            metadatas=[metadata_for(cid) for cid in ids],
+        )
+        new_ids.extend(ids)
+        pending.clear()
+
+    def collect(segments: Iterable[Segment]) -> Iterator[Segment]:
+        """
+        Keep the text the summary is built from. Tables contribute only
+        their first row groups per sheet, so huge sheets don't have to be
+        held in memory.
+        """
+        for text, meta in segments:
+            if meta.get("table"):
+                sheet = meta.get("sheet", "")
+                table_groups[sheet] = table_groups.get(sheet, 0) + 1
+                if table_groups[sheet] <= TABLE_SUMMARY_GROUPS:
+                    text_parts.append(text)
+            else:
+                text_parts.append(text)
+            yield text, meta
+
+    segments = _timed(collect(iter_segments(path)), job, "parsing")   # ✅ GENERIC LOADER
+
+    try:
+        for chunk, meta in _timed(chunk_segments(segments), job, "chunking", exclude="parsing"):
+            cid = chunk_id_for(file_name, chunk)
+            if cid in chunk_ids:
+                continue
+
+            chunk_ids[cid] = len(chunk_metas)
+            chunk_metas.append(meta)
+
+            if cid not in existing_ids:
+                pending.append((cid, chunk))
+                # A full batch implies far more than MIN_TEXT_LENGTH of text.
+                if len(pending) >= INGEST_BATCH_SIZE:
+                    flush_pending()
+    except BulkWriteError as e:
+        # An earlier batch failed to store; the file itself parsed fine.
+        print(f"[ERROR] Failed to store chunks of {path}: {e}")
+        try:
+            writer.close()
+        except BulkWriteError:
+            pass
+        return {"file_name": file_name, "status": "failed", "reason": f"failed to store chunks: {e}"}
+    except Exception as e:
+        print(f"[ERROR] Failed to read {path}: {e}")
+        try:
+            writer.close()
+        except BulkWriteError:
+            pass
+        return {"file_name": file_name, "status": "failed", "reason": f"failed to read: {e}"}
+
+    full_text = "\n".join(text_parts)
+
+    # Nothing has been submitted to the writer unless new_ids is non-empty.
+    if not new_ids and len(full_text.strip()) < MIN_TEXT_LENGTH:
+        print(f"[WARN] {file_name} has very little text. Skipping.")
+        _purge_previous_version(file_name, existing_ids, store, lexical, catalog)
+        return {"file_name": file_name, "status": "skipped", "reason": "too little text"}
+
+    if not chunk_ids:
+        _purge_previous_version(file_name, existing_ids, store, lexical, catalog)
+        return {"file_name": file_name, "status": "skipped", "reason": "no chunks"}
+
+    try:
+        flush_pending()
+        with _stage(job, "writing"):
+            write_stats = writer.close()
+    except BulkWriteError as e:
+        print(f"[ERROR] Failed to store chunks of {path}: {e}")
+        try:
+            writer.close()
+        except BulkWriteError:
+            pass
+        return {"file_name": file_name, "status": "failed", "reason": f"failed to store chunks: {e}"}
+
+    kept_ids = [cid for cid in chunk_ids if cid in existing_ids]
+    stale_ids = [cid for cid in existing_ids if cid not in chunk_ids]
+
+    with _stage(job, "storing"):
+        store.update_metadata(
+            ids=kept_ids,
+            metadatas=[metadata_for(cid) for cid in kept_ids],
+        )
+        store.delete(ids=stale_ids)
+
+        lexical.update_metadata(
+            ids=kept_ids,
+            metadatas=[metadata_for(cid) for cid in kept_ids],
+        )
+        lexical.remove(stale_ids)
+
+    try:
+        with _stage(job, "summarizing"):
+            summary_store = DocumentSummaryStore()
+            summary_id = summary_store.add_summary(
+                doc_id=doc_id,
+                file_name=file_name,
+                full_text=full_text,
+            )
+    except LLMUnavailableError as e:
+        # The chunks are stored, but the catalog keeps the previous hash, so
+        # uploading the file again retries the summary (and nothing else).
+        print(f"[ERROR] Summary of {file_name} failed: {e}")
+        mark_vault_changed()
+        return {
+            "file_name": file_name,
+            "status": "failed",
+            "reason": f"failed to summarize: {e}",
+            "retryable": True,
+            "doc_id": doc_id,
+            "chunks": len(chunk_ids),
+        }
+
+    catalog.upsert(
         file_name=file_name,
-        full_text=full_text,
+        doc_id=doc_id,
+        file_hash=file_hash,
+        chunk_count=len(chunk_ids),
+        summary_id=summary_id,
+        chunker=CHUNK_STRATEGY,
     )
 
-    print(f"[INFO] Ingested {len(chunks)} chunks from {file_name}")
+    # Cached answers may be based on the previous version of the vault.
+    mark_vault_changed()
+
+    print(
+        f"[INFO] Ingested {file_name}: {len(new_ids)} new, "
+        f"{len(kept_ids)} unchanged, {len(stale_ids)} removed chunks "
+        f"({write_stats['chunks_per_second']} chunks/s written)"
+    )
+    return {
+        "file_name": file_name,
+        "status": "ingested",
+        "doc_id": doc_id,
+        "chunks": len(chunk_ids),
+        "new_chunks": len(new_ids),
+        "unchanged_chunks": len(kept_ids),
+        "removed_chunks": len(stale_ids),
+        "write": write_stats,
+    }
 
 
 # -------- MULTI-FILE INGESTION --------
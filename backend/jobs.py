@@ -0,0 +1,201 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List
+
+from dotenv import load_dotenv
+
+from metrics import counter, histogram
+
+load_dotenv()
+
+# Files ingested at the same time (each holds a worker thread of its own,
+# separate from the pool that serves /ask).
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "1"))
+# Jobs waiting or running before /upload starts refusing work.
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "32"))
+# Finished jobs kept around for polling.
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "500"))
+
+
+INGEST_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+INGEST_JOBS = counter("kv_ingest_jobs_total", "Finished ingestion jobs by status.", labels=("status",))
+INGEST_SECONDS = histogram("kv_ingest_seconds", "Running time of ingestion jobs.", buckets=INGEST_BUCKETS)
+INGEST_STAGE_SECONDS = histogram(
+    "kv_ingest_stage_seconds",
+    "Time per ingestion job spent in each stage.",
+    labels=("stage",),
+    buckets=INGEST_BUCKETS,
+)
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class IngestJob:
+    """
+    Status of one background ingestion, with per-stage timings.
+    """
+
+    def __init__(self, path: str):
+        self.id = uuid.uuid4().hex
+        self.path = path
+        self.file_name = os.path.basename(path)
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.current_stage: Optional[str] = None
+        self.stages: List[Dict[str, Any]] = []
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        # Embedding and storing are recorded from bulk-writer threads.
+        self._lock = threading.Lock()
+
+    def _entry(self, name: str) -> Dict[str, Any]:
+        with self._lock:
+            for entry in self.stages:
+                if entry["name"] == name:
+                    return entry
+            entry = {"name": name, "started_at": time.time(), "seconds": 0.0}
+            self.stages.append(entry)
+            return entry
+
+    def record(self, name: str, seconds: float) -> None:
+        """
+        Add time to a stage. Streamed stages (parsing, chunking, embedding
+        and storing overlap) accumulate across many small steps.
+        """
+        entry = self._entry(name)
+        with self._lock:
+            entry["seconds"] = round(entry["seconds"] + seconds, 4)
+
+    def seconds(self, name: str) -> float:
+        for entry in self.stages:
+            if entry["name"] == name:
+                return entry["seconds"]
+        return 0.0
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Record the wall time spent in one pipeline stage.
+        """
+        self._entry(name)
+        previous, self.current_stage = self.current_stage, name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+            self.current_stage = previous
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.id,
+            "file_name": self.file_name,
+            "status": self.status,
+            "stage": self.current_stage,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "queued_seconds": round((self.started_at or end) - self.created_at, 4),
+            "total_seconds": (
+                round(end - self.started_at, 4) if self.started_at else None
+            ),
+            "stages": [dict(s) for s in list(self.stages)],
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class IngestQueue:
+    """
+    Bounded background queue that runs ingest_file off the request path.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = INGEST_CONCURRENCY,
+        max_pending: int = INGEST_QUEUE_SIZE,
+        history: int = INGEST_JOB_HISTORY,
+    ):
+        self.max_pending = max_pending
+        self.history = history
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, concurrency),
+            thread_name_prefix="ingest",
+        )
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, path: str) -> IngestJob:
+        job = IngestJob(path)
+
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFullError("Ingestion queue is full, try again later")
+            self._pending += 1
+            self._jobs[job.id] = job
+            self._trim()
+
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _trim(self) -> None:
+        finished = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None
+        ]
+        for job_id in finished[: max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
+
+    def _run(self, job: IngestJob) -> None:
+        # Imported here so importing jobs.py doesn't pull in the ingest stack.
+        from ingest import ingest_file
+
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.result = ingest_file(job.path, job=job)
+            job.status = job.result.get("status", "done")
+            if job.status == "failed":
+                job.error = job.result.get("reason")
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            print(f"[ERROR] Ingestion job {job.id} failed: {e}")
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._pending -= 1
+            _observe(job)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"pending": self._pending, "tracked_jobs": len(self._jobs)}
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _observe(job: IngestJob) -> None:
+    INGEST_JOBS.inc(status=job.status)
+    INGEST_SECONDS.observe(job.finished_at - job.started_at)
+    for entry in list(job.stages):
+        INGEST_STAGE_SECONDS.observe(entry["seconds"], stage=entry["name"])
+
+
+ingest_queue = IngestQueue()
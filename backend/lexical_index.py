@@ -0,0 +1,342 @@
+"""
+In-process BM25 index over chunk text, kept next to the chunk collection.
+
+Dense retrieval misses exact identifiers (employee IDs, part numbers,
+codes); this index catches them from in-memory posting lists. Chunks are
+persisted one row each in SQLite, and every add, removal or metadata
+change also appends the chunk ID to a change log. Writes only touch the
+chunks they change, and each worker merges the others' changes into its
+postings by replaying the log past the last change it has seen, so
+concurrent ingests and migrations never overwrite each other.
+"""
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Any, Iterable, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Set LEXICAL_INDEX_PATH to an empty string to keep the index in memory only.
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "data/lexical_index.sqlite3")
+
+# Change-log rows kept for other workers to catch up from; a worker that
+# falls further behind reloads the whole index instead.
+_CHANGE_LOG_ROWS = 100_000
+_TRIM_EVERY = 1_000
+# SQLite's default limit on bound parameters is 999.
+_SQL_BATCH = 500
+
+# Whole identifiers like "emp-1023" or "v2.3_final" plus their parts.
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_./:][a-z0-9]+)*")
+_PART = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset(
+    """
+    a an and are as at be by can could did do does for from had has have how
+    i in is it its me my of on or our please show tell that the their them
+    there these this those to was we were what when where which who why will
+    with you your about into than then
+    """.split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        parts = _PART.findall(token)
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if p not in STOPWORDS)
+    return tokens
+
+
+def _batched(items: List[Any]) -> Iterable[List[Any]]:
+    for start in range(0, len(items), _SQL_BATCH):
+        yield items[start:start + _SQL_BATCH]
+
+
+class BM25Index:
+    def __init__(self, path: Optional[str] = LEXICAL_INDEX_PATH, k1: float = 1.5, b: float = 0.75):
+        self.path = path or None
+        self.k1 = k1
+        self.b = b
+
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._doc_len: Dict[str, int] = {}
+        self._docs: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        self._total_len = 0
+        self._db: Optional[sqlite3.Connection] = None
+        # Last change-log row reflected in memory.
+        self._seq = 0
+        self._writes_since_trim = 0
+
+    # ---- persistence ----
+    def exists(self) -> bool:
+        return bool(self.path) and os.path.exists(self.path)
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self._db is None and self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # isolation_level=None: transactions are opened explicitly below.
+            db = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                " id TEXT PRIMARY KEY,"
+                " text TEXT NOT NULL,"
+                " meta TEXT NOT NULL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS changes ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " id TEXT NOT NULL)"
+            )
+            self._db = db
+        return self._db
+
+    def _last_seq(self, db: sqlite3.Connection) -> int:
+        return db.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+    def load(self) -> None:
+        """
+        Rebuild the in-memory postings from every stored chunk.
+        """
+        with self._lock:
+            db = self._connect()
+            if db is None:
+                return
+
+            # Read the log position first: changes committed while the rows
+            # are read are replayed again later, which is harmless.
+            seq = self._last_seq(db)
+            self._postings, self._doc_len, self._docs, self._total_len = {}, {}, {}, 0
+            for doc_id, text, meta in db.execute("SELECT id, text, meta FROM chunks"):
+                self._index_one(doc_id, text, json.loads(meta))
+            self._seq = seq
+
+    def _catch_up(self, db: sqlite3.Connection) -> None:
+        """
+        Apply changes other workers logged since self._seq, re-reading the
+        current row of each changed chunk.
+        """
+        last = self._last_seq(db)
+        if last == self._seq:
+            return
+
+        first = db.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+        if first is None or first > self._seq + 1:
+            # Trimmed past what this worker has seen.
+            self.load()
+            return
+
+        changed = [
+            row[0] for row in db.execute(
+                "SELECT DISTINCT id FROM changes WHERE seq > ? AND seq <= ?", (self._seq, last)
+            )
+        ]
+        for ids in _batched(changed):
+            rows = {
+                doc_id: (text, meta)
+                for doc_id, text, meta in db.execute(
+                    f"SELECT id, text, meta FROM chunks WHERE id IN ({','.join('?' * len(ids))})", ids
+                )
+            }
+            for doc_id in ids:
+                self._remove_one(doc_id)
+                if doc_id in rows:
+                    text, meta = rows[doc_id]
+                    self._index_one(doc_id, text, json.loads(meta))
+        self._seq = last
+
+    def reload_if_changed(self) -> None:
+        """
+        Pick up writes made by another worker process.
+        """
+        with self._lock:
+            db = self._connect()
+            if db is not None:
+                self._catch_up(db)
+
+    def _write(self, apply, statements: List[Tuple[str, List[Tuple]]], ids: List[str]) -> None:
+        """
+        Catch up, apply one change in memory and persist it with its
+        change-log rows, all while holding SQLite's write lock so no other
+        worker's change can land in between.
+        """
+        with self._lock:
+            db = self._connect()
+            if db is None:
+                apply()
+                return
+
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                self._catch_up(db)
+                for sql, rows in statements:
+                    db.executemany(sql, rows)
+                db.executemany("INSERT INTO changes (id) VALUES (?)", [(doc_id,) for doc_id in ids])
+                seq = self._last_seq(db)
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+            apply()
+            self._seq = seq
+
+            self._writes_since_trim += len(ids)
+            if self._writes_since_trim >= _TRIM_EVERY:
+                self._writes_since_trim = 0
+                db.execute("DELETE FROM changes WHERE seq <= ?", (seq - _CHANGE_LOG_ROWS,))
+
+    # ---- updates ----
+    def _index_one(self, doc_id: str, text: str, meta: Dict[str, Any]) -> None:
+        tokens = tokenize(text)
+        for term, tf in Counter(tokens).items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+        self._doc_len[doc_id] = len(tokens)
+        self._total_len += len(tokens)
+        self._docs[doc_id] = (text, dict(meta))
+
+    def _remove_one(self, doc_id: str) -> None:
+        entry = self._docs.pop(doc_id, None)
+        if entry is None:
+            return
+
+        for term in set(tokenize(entry[0])):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_len -= self._doc_len.pop(doc_id, 0)
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        entries = list(zip(ids, texts, metadatas))
+        if not entries:
+            return
+
+        def apply():
+            for doc_id, text, meta in entries:
+                self._remove_one(doc_id)
+                self._index_one(doc_id, text, meta)
+
+        self._write(
+            apply,
+            [(
+                "INSERT OR REPLACE INTO chunks (id, text, meta) VALUES (?, ?, ?)",
+                [(doc_id, text, json.dumps(meta)) for doc_id, text, meta in entries],
+            )],
+            [doc_id for doc_id, _, _ in entries],
+        )
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        entries = list(zip(ids, metadatas))
+        if not entries:
+            return
+
+        def apply():
+            for doc_id, meta in entries:
+                if doc_id in self._docs:
+                    self._docs[doc_id] = (self._docs[doc_id][0], dict(meta))
+
+        self._write(
+            apply,
+            [(
+                "UPDATE chunks SET meta = ? WHERE id = ?",
+                [(json.dumps(meta), doc_id) for doc_id, meta in entries],
+            )],
+            [doc_id for doc_id, _ in entries],
+        )
+
+    def remove(self, ids: Iterable[str]) -> None:
+        ids = list(ids)
+        if not ids:
+            return
+
+        def apply():
+            for doc_id in ids:
+                self._remove_one(doc_id)
+
+        self._write(apply, [("DELETE FROM chunks WHERE id = ?", [(doc_id,) for doc_id in ids])], ids)
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    # ---- search ----
+    def search(self, query: str, k: int = 5, file_name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Top-k chunks by BM25 score, optionally restricted to one file.
+        """
+        with self._lock:
+            n = len(self._docs)
+            if not n:
+                return []
+
+            avg_len = self._total_len / n
+            scores: Dict[str, float] = {}
+
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+
+                df = len(postings)
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                for doc_id, tf in postings.items():
+                    if file_name and self._docs[doc_id][1].get("file_name") != file_name:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avg_len)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+            top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [
+                {"id": doc_id, "text": self._docs[doc_id][0], "score": score, **self._docs[doc_id][1]}
+                for doc_id, score in top
+            ]
+
+
+_index: Optional[BM25Index] = None
+_index_lock = threading.Lock()
+
+
+def get_lexical_index() -> BM25Index:
+    """
+    Process-wide index: loaded from disk, or built once from the chunk
+    collection when no index file exists yet (e.g. a pre-existing vault).
+    """
+    global _index
+
+    if _index is not None:
+        _index.reload_if_changed()
+        return _index
+
+    with _index_lock:
+        if _index is None:
+            index = BM25Index()
+            if index.exists():
+                index.load()
+            else:
+                from vector_store import VectorStore
+
+                chunks = VectorStore().get()
+                index.add(
+                    ids=[c["id"] for c in chunks],
+                    texts=[c["text"] or "" for c in chunks],
+                    metadatas=[
+                        {k: v for k, v in c.items() if k not in ("id", "text")}
+                        for c in chunks
+                    ],
+                )
+            _index = index
+
+    return _index
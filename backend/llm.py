@@ -1,31 +1,44 @@
 import os
+from typing import AsyncIterator
 from dotenv import load_dotenv
 from google import genai
+from google.genai import types
+
+from llm_gateway import LLMGateway
 
 load_dotenv()
 
+# GEMINI_BASE_URL points the client at another endpoint, e.g. the fake
+# server in benchmarks/fake_gemini.py.
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL") or None
+
 # Initialize Gemini client
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+client = genai.Client(
+    api_key=os.getenv("GEMINI_API_KEY"),
+    http_options=types.HttpOptions(base_url=GEMINI_BASE_URL) if GEMINI_BASE_URL else None,
+)
+
+GEMINI_MODEL = "gemini-2.5-flash-lite"
+
+NOT_FOUND = "Not found in Knowledge Vault."
+
+gateway = LLMGateway(client, GEMINI_MODEL)
 
 
 def _call_gemini(prompt: str) -> str:
     """
-    Internal Gemini call with safety fallback.
+    Internal Gemini call. An empty answer becomes NOT_FOUND; a Gemini
+    that can't be reached raises LLMUnavailableError.
     """
-    try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash-lite",
-            contents=prompt,
-        )
-
-        if response and response.text:
-            return response.text.strip()
+    return gateway.generate(prompt) or NOT_FOUND
 
-        return "Not found in Knowledge Vault."
 
-    except Exception as e:
-        print(f"[LLM ERROR] {e}")
-        return "Not found in Knowledge Vault."
+async def _call_gemini_async(prompt: str) -> str:
+    """
+    Non-blocking _call_gemini through the genai async client, so waiting
+    on Gemini doesn't hold a worker thread.
+    """
+    return await gateway.generate_async(prompt) or NOT_FOUND
 
 
 def generate_answer(prompt: str) -> str:
@@ -35,6 +48,25 @@ def generate_answer(prompt: str) -> str:
     return _call_gemini(prompt)
 
 
+async def generate_answer_async(prompt: str) -> str:
+    return await _call_gemini_async(prompt)
+
+
+async def stream_answer_async(prompt: str) -> AsyncIterator[str]:
+    """
+    Generate a grounded answer, yielding text as Gemini produces it.
+    Yields NOT_FOUND if the answer is empty; raises LLMUnavailableError
+    if Gemini can't be reached.
+    """
+    produced = False
+    async for piece in gateway.stream_async(prompt):
+        produced = True
+        yield piece
+
+    if not produced:
+        yield NOT_FOUND
+
+
 def generate_summary(text: str) -> str:
     """
     Generate a concise document summary.
@@ -54,3 +86,44 @@ Summary:
 """.strip()
 
     return _call_gemini(prompt)
+
+
+def generate_section_summary(text: str) -> str:
+    """
+    Summarize one section of a large document (map step).
+    """
+    prompt = f"""
+Summarize the following section of a larger document in 3–5 bullet points.
+Keep names, numbers and definitions exactly as written.
+Do NOT add information not present in the text.
+
+Section:
+----------------
+{text}
+----------------
+
+Summary:
+""".strip()
+
+    return _call_gemini(prompt)
+
+
+def combine_summaries(section_summaries: str) -> str:
+    """
+    Merge section summaries into one document summary (reduce step).
+    """
+    prompt = f"""
+The following are summaries of consecutive sections of one document.
+Combine them into a single summary of the whole document in 5–7 bullet points.
+Focus on key topics and definitions.
+Do NOT add information not present in the summaries.
+
+Section summaries:
+----------------
+{section_summaries}
+----------------
+
+Summary:
+""".strip()
+
+    return _call_gemini(prompt)
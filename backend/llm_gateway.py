@@ -0,0 +1,560 @@
+"""
+Gateway in front of every Gemini call.
+
+Calls from request threads, ingestion threads and the event loop share
+one concurrency cap and one token-bucket rate limit, both off unless
+configured (set them from the Gemini quota). Transient failures
+(429, 5xx, timeouts, dropped connections) are retried with jittered
+exponential backoff inside a per-call deadline; each attempt has its own
+timeout. With hedging on, an attempt still running past the observed p95
+latency gets a second identical request and the first answer wins.
+
+A call either returns Gemini's text ("" for a genuinely empty answer) or
+raises LLMUnavailableError, so callers can tell "the model had nothing to
+say" apart from "the model could not be reached".
+"""
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+import httpx
+from dotenv import load_dotenv
+from google.genai import errors, types
+
+from metrics import histogram
+
+load_dotenv()
+
+# Gemini calls in flight; 0 = no cap.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "0"))
+# Requests per second and burst size; LLM_RATE_LIMIT=0 disables the limit.
+# A quota of N requests per minute means LLM_RATE_LIMIT=N/60.
+LLM_RATE_LIMIT = float(os.getenv("LLM_RATE_LIMIT", "0"))
+LLM_RATE_BURST = int(os.getenv("LLM_RATE_BURST", "20"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "3"))
+LLM_BACKOFF = float(os.getenv("LLM_BACKOFF", "0.5"))
+# Whole-call deadline (queueing and retries included) and per-attempt timeout.
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_ATTEMPT_TIMEOUT = float(os.getenv("LLM_ATTEMPT_TIMEOUT", "30"))
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0").lower() in {"1", "true", "yes"}
+# Latency samples needed before the p95 is trusted for hedging.
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+
+# Seconds; upper bounds of the latency histogram buckets.
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0)
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class LLMUnavailableError(Exception):
+    """
+    Gemini could not produce an answer: retries exhausted, deadline
+    passed, or a non-retryable request error.
+    """
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, errors.APIError):
+        return error.code in RETRYABLE_STATUS
+    return isinstance(error, (TimeoutError, asyncio.TimeoutError, httpx.TransportError, ConnectionError))
+
+
+def _describe(error: BaseException) -> str:
+    # Timeouts stringify to "".
+    return str(error) or type(error).__name__
+
+
+# -------- CONCURRENCY + RATE --------
+class _Slots:
+    """
+    Counting semaphore shared by threads and coroutines. Waiters are
+    served first come, first served, whichever side they are on. With
+    size 0 nobody waits; calls in flight are only counted.
+    """
+
+    def __init__(self, size: int):
+        self.size = max(0, size)
+        self._capacity = self.size or sys.maxsize
+        self._free = self._capacity
+        self._lock = threading.Lock()
+        self._waiters: Deque[Any] = deque()
+
+    def in_use(self) -> int:
+        with self._lock:
+            return self._capacity - self._free
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self._free > 0 and not self._waiters:
+                self._free -= 1
+                return True
+            return False
+
+    def acquire(self, timeout: float) -> bool:
+        with self._lock:
+            if self._free > 0 and not self._waiters:
+                self._free -= 1
+                return True
+            event = threading.Event()
+            self._waiters.append(event)
+
+        if event.wait(max(0.0, timeout)):
+            return True
+        with self._lock:
+            if event in self._waiters:
+                self._waiters.remove(event)
+                return False
+        # Granted between the timeout and taking the lock.
+        return True
+
+    async def acquire_async(self, timeout: float) -> bool:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._free > 0 and not self._waiters:
+                self._free -= 1
+                return True
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+
+        future = waiter[1]
+        try:
+            await asyncio.wait_for(asyncio.shield(future), max(0.0, timeout))
+            return True
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    granted = False
+                else:
+                    granted = True
+            if granted:
+                # The slot is already on its way; take it, then give it
+                # back if this call was cancelled.
+                await future
+                if isinstance(e, asyncio.CancelledError):
+                    self.release()
+                    raise
+                return True
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return False
+
+    def release(self) -> None:
+        with self._lock:
+            if not self._waiters:
+                self._free += 1
+                return
+            waiter = self._waiters.popleft()
+
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+            return
+
+        loop, future = waiter
+        try:
+            loop.call_soon_threadsafe(self._grant, future)
+        except RuntimeError:
+            # The waiter's loop is gone; pass the slot on.
+            self.release()
+
+    def _grant(self, future: "asyncio.Future") -> None:
+        if future.done():
+            self.release()
+        else:
+            future.set_result(True)
+
+
+class TokenBucket:
+    """
+    `rate` requests per second with bursts up to `burst`. reserve() takes
+    a token now and returns how long to wait before using it.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait: float) -> Optional[float]:
+        """
+        Seconds to wait for a token, or None (nothing reserved) if that
+        would take longer than `max_wait`.
+        """
+        if self.rate <= 0:
+            return 0.0
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+            wait_for = max(0.0, (1.0 - self._tokens) / self.rate)
+            if wait_for > max_wait:
+                return None
+            self._tokens -= 1.0
+            return wait_for
+
+    def try_take(self) -> bool:
+        return self.reserve(0.0) is not None
+
+
+# -------- GATEWAY --------
+class LLMGateway:
+    def __init__(
+        self,
+        client,
+        model: str,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        rate_limit: float = LLM_RATE_LIMIT,
+        rate_burst: int = LLM_RATE_BURST,
+        retries: int = LLM_RETRIES,
+        backoff: float = LLM_BACKOFF,
+        timeout: float = LLM_TIMEOUT,
+        attempt_timeout: float = LLM_ATTEMPT_TIMEOUT,
+        hedge: bool = LLM_HEDGE,
+    ):
+        self.client = client
+        self.model = model
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.attempt_timeout = attempt_timeout
+        self.hedge = hedge
+
+        self._slots = _Slots(max_concurrency)
+        self._bucket = TokenBucket(rate_limit, rate_burst)
+        # Sync calls run here only when hedging needs two in parallel.
+        self._hedge_executor = ThreadPoolExecutor(
+            max_workers=max(2, 2 * max_concurrency) if max_concurrency > 0 else 32,
+            thread_name_prefix="llm-hedge",
+        )
+
+        # Per successful Gemini request (what hedging compares against),
+        # and per call including queueing, rate limiting and retries.
+        self.latency = histogram(
+            "kv_llm_request_seconds", "Latency of successful Gemini requests.", buckets=LATENCY_BUCKETS
+        )
+        self.call_latency = histogram(
+            "kv_llm_call_seconds", "Latency of gateway calls, queueing and retries included.", buckets=LATENCY_BUCKETS
+        )
+        self.first_token_latency = histogram(
+            "kv_llm_first_token_seconds", "Time to the first streamed token.", buckets=LATENCY_BUCKETS
+        )
+        self._lock = threading.Lock()
+        self._counters = {
+            "calls": 0,
+            "succeeded": 0,
+            "empty": 0,
+            "failed": 0,
+            "retries": 0,
+            "timeouts": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "rate_limit_wait_seconds": 0.0,
+        }
+
+    # ---- bookkeeping ----
+    def _count(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self._counters[name] += amount
+
+    def _config(self, seconds: float) -> types.GenerateContentConfig:
+        return types.GenerateContentConfig(
+            http_options=types.HttpOptions(timeout=max(1, int(seconds * 1000)))
+        )
+
+    def _attempt_budget(self, deadline: float) -> float:
+        return min(self.attempt_timeout, deadline - time.monotonic())
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.hedge:
+            return None
+        return self.latency.percentile(0.95, LLM_HEDGE_MIN_SAMPLES)
+
+    def _backoff_delay(self, attempt: int) -> float:
+        return self.backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+
+    def _give_up(self, error: BaseException, deadline: float, attempt: int, delay: float) -> bool:
+        if not is_retryable(error) or attempt > self.retries:
+            return True
+        return time.monotonic() + delay >= deadline
+
+    def _fail(self, reason: str, error: Optional[BaseException] = None) -> LLMUnavailableError:
+        self._count("failed")
+        if error is not None:
+            reason = f"{reason}: {_describe(error)}"
+        print(f"[LLM ERROR] {reason}")
+        return LLMUnavailableError(reason)
+
+    def _finish(self, text: Optional[str], started: float) -> str:
+        self.call_latency.observe(time.monotonic() - started)
+        text = (text or "").strip()
+        self._count("succeeded")
+        if not text:
+            self._count("empty")
+        return text
+
+    @staticmethod
+    def _text(response) -> str:
+        # response.text raises or is None when there is no text part.
+        try:
+            return (response.text if response else "") or ""
+        except ValueError:
+            return ""
+
+    # ---- sync ----
+    def _call_once(self, prompt: str, seconds: float) -> str:
+        started = time.monotonic()
+        response = self.client.models.generate_content(
+            model=self.model,
+            contents=prompt,
+            config=self._config(seconds),
+        )
+        self.latency.observe(time.monotonic() - started)
+        return self._text(response)
+
+    def _attempt(self, prompt: str, deadline: float) -> str:
+        seconds = self._attempt_budget(deadline)
+        hedge_after = self._hedge_delay()
+        if hedge_after is None or hedge_after >= seconds:
+            return self._call_once(prompt, seconds)
+
+        primary = self._hedge_executor.submit(self._call_once, prompt, seconds)
+        done, _ = wait([primary], timeout=hedge_after)
+        if done or not self._take_hedge_capacity():
+            return primary.result()
+
+        self._count("hedges")
+        hedge = self._hedge_executor.submit(self._call_once, prompt, self._attempt_budget(deadline))
+        hedge.add_done_callback(lambda _: self._slots.release())
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._count("hedge_wins")
+                    return future.result()
+        return primary.result()
+
+    def _take_hedge_capacity(self) -> bool:
+        # A hedge never queues: it needs a free slot and a token right now.
+        if not self._slots.try_acquire():
+            return False
+        if not self._bucket.try_take():
+            self._slots.release()
+            return False
+        return True
+
+    def generate(self, prompt: str) -> str:
+        """
+        Blocking generate_content through the gateway.
+        """
+        self._count("calls")
+        started = time.monotonic()
+        deadline = started + self.timeout
+
+        if not self._slots.acquire(deadline - time.monotonic()):
+            self._count("timeouts")
+            raise self._fail("timed out waiting for a free LLM slot")
+
+        try:
+            attempt = 0
+            while True:
+                wait_for = self._bucket.reserve(deadline - time.monotonic())
+                if wait_for is None:
+                    self._count("timeouts")
+                    raise self._fail("rate limit wait exceeds the deadline")
+                if wait_for:
+                    self._count("rate_limit_wait_seconds", wait_for)
+                    time.sleep(wait_for)
+
+                try:
+                    return self._finish(self._attempt(prompt, deadline), started)
+                except Exception as e:
+                    attempt += 1
+                    if isinstance(e, (TimeoutError, httpx.TimeoutException)):
+                        self._count("timeouts")
+                    delay = self._backoff_delay(attempt)
+                    if self._give_up(e, deadline, attempt, delay):
+                        raise self._fail(f"Gemini call failed after {attempt} attempt(s)", e) from e
+                    print(f"[WARN] Gemini call failed ({_describe(e)}), retry {attempt} in {delay:.2f}s")
+                    self._count("retries")
+                    time.sleep(delay)
+        finally:
+            self._slots.release()
+
+    # ---- async ----
+    async def _call_once_async(self, prompt: str, seconds: float) -> str:
+        started = time.monotonic()
+        response = await asyncio.wait_for(
+            self.client.aio.models.generate_content(
+                model=self.model,
+                contents=prompt,
+                config=self._config(seconds),
+            ),
+            timeout=seconds,
+        )
+        self.latency.observe(time.monotonic() - started)
+        return self._text(response)
+
+    async def _attempt_async(self, prompt: str, deadline: float) -> str:
+        seconds = self._attempt_budget(deadline)
+        hedge_after = self._hedge_delay()
+        primary = asyncio.ensure_future(self._call_once_async(prompt, seconds))
+        if hedge_after is None or hedge_after >= seconds:
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+        if done or not self._take_hedge_capacity():
+            return await primary
+
+        self._count("hedges")
+        hedge = asyncio.ensure_future(self._call_once_async(prompt, self._attempt_budget(deadline)))
+        hedge.add_done_callback(lambda _: self._slots.release())
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if future is hedge:
+                            self._count("hedge_wins")
+                        return future.result()
+            return primary.result()
+        finally:
+            for future in (primary, hedge):
+                future.cancel()
+
+    async def generate_async(self, prompt: str) -> str:
+        """
+        generate() for the event loop; waiting never holds a thread.
+        """
+        self._count("calls")
+        started = time.monotonic()
+        deadline = started + self.timeout
+
+        if not await self._slots.acquire_async(deadline - time.monotonic()):
+            self._count("timeouts")
+            raise self._fail("timed out waiting for a free LLM slot")
+
+        try:
+            attempt = 0
+            while True:
+                wait_for = self._bucket.reserve(deadline - time.monotonic())
+                if wait_for is None:
+                    self._count("timeouts")
+                    raise self._fail("rate limit wait exceeds the deadline")
+                if wait_for:
+                    self._count("rate_limit_wait_seconds", wait_for)
+                    await asyncio.sleep(wait_for)
+
+                try:
+                    return self._finish(await self._attempt_async(prompt, deadline), started)
+                except Exception as e:
+                    attempt += 1
+                    if isinstance(e, (asyncio.TimeoutError, httpx.TimeoutException)):
+                        self._count("timeouts")
+                    delay = self._backoff_delay(attempt)
+                    if self._give_up(e, deadline, attempt, delay):
+                        raise self._fail(f"Gemini call failed after {attempt} attempt(s)", e) from e
+                    print(f"[WARN] Gemini call failed ({_describe(e)}), retry {attempt} in {delay:.2f}s")
+                    self._count("retries")
+                    await asyncio.sleep(delay)
+        finally:
+            self._slots.release()
+
+    async def stream_async(self, prompt: str) -> AsyncIterator[str]:
+        """
+        Streaming generate_content. Attempts are retried only until the
+        first piece of text arrives; after that a failure ends the stream
+        with LLMUnavailableError. Yields nothing for an empty answer.
+        """
+        self._count("calls")
+        started = time.monotonic()
+        deadline = started + self.timeout
+
+        if not await self._slots.acquire_async(deadline - time.monotonic()):
+            self._count("timeouts")
+            raise self._fail("timed out waiting for a free LLM slot")
+
+        try:
+            attempt = 0
+            produced = False
+            while True:
+                wait_for = self._bucket.reserve(deadline - time.monotonic())
+                if wait_for is None:
+                    self._count("timeouts")
+                    raise self._fail("rate limit wait exceeds the deadline")
+                if wait_for:
+                    self._count("rate_limit_wait_seconds", wait_for)
+                    await asyncio.sleep(wait_for)
+
+                try:
+                    attempt_started = time.monotonic()
+                    seconds = self._attempt_budget(deadline)
+                    stream = await asyncio.wait_for(
+                        self.client.aio.models.generate_content_stream(
+                            model=self.model,
+                            contents=prompt,
+                            config=self._config(seconds),
+                        ),
+                        timeout=seconds,
+                    )
+                    pieces = stream.__aiter__()
+                    while True:
+                        remaining = deadline - time.monotonic()
+                        if not produced:
+                            remaining = min(remaining, seconds)
+                        try:
+                            chunk = await asyncio.wait_for(pieces.__anext__(), timeout=max(0.0, remaining))
+                        except StopAsyncIteration:
+                            break
+                        text = self._text(chunk)
+                        if text:
+                            if not produced:
+                                self.first_token_latency.observe(time.monotonic() - started)
+                            produced = True
+                            yield text
+
+                    self.latency.observe(time.monotonic() - attempt_started)
+                    self.call_latency.observe(time.monotonic() - started)
+                    self._count("succeeded")
+                    if not produced:
+                        self._count("empty")
+                    return
+                except Exception as e:
+                    attempt += 1
+                    if isinstance(e, (asyncio.TimeoutError, httpx.TimeoutException)):
+                        self._count("timeouts")
+                    delay = self._backoff_delay(attempt)
+                    if produced or self._give_up(e, deadline, attempt, delay):
+                        raise self._fail(f"Gemini stream failed after {attempt} attempt(s)", e) from e
+                    print(f"[WARN] Gemini stream failed ({_describe(e)}), retry {attempt} in {delay:.2f}s")
+                    self._count("retries")
+                    await asyncio.sleep(delay)
+        finally:
+            self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        counters["rate_limit_wait_seconds"] = round(counters["rate_limit_wait_seconds"], 3)
+        return {
+            "model": self.model,
+            **counters,
+            "in_flight": self._slots.in_use(),
+            "max_concurrency": self._slots.size,
+            "hedging": self.hedge,
+            "latency": self.latency.snapshot(),
+            "call_latency": self.call_latency.snapshot(),
+            "first_token_latency": self.first_token_latency.snapshot(),
+        }
@@ -1,16 +1,103 @@
+import csv
+import multiprocessing
 import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Tuple, Dict, Any, List, Optional
+
 import pandas as pd
 from docx import Document
 from pypdf import PdfReader
+from dotenv import load_dotenv
 
+load_dotenv()
 
-def load_pdf(path: str) -> str:
+# PDFs with at least this many pages are split into page ranges and
+# parsed in a process pool; smaller ones aren't worth the hand-off.
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "40"))
+PDF_PAGES_PER_SHARD = int(os.getenv("PDF_PAGES_PER_SHARD", "20"))
+PDF_PARSE_PROCESSES = int(os.getenv("PDF_PARSE_PROCESSES", str(max(1, (os.cpu_count() or 2) // 2))))
+
+# Spreadsheet rows are grouped into chunks of at most this many characters
+# (and TABLE_MAX_ROWS rows), each repeating the column headers.
+TABLE_CHUNK_CHARS = int(os.getenv("TABLE_CHUNK_CHARS", "1000"))
+TABLE_MAX_ROWS = int(os.getenv("TABLE_MAX_ROWS", "50"))
+
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+TABLE_EXTENSIONS = {".xlsx", ".xls", ".csv"}
+
+# (text, metadata) pieces of a document, in reading order.
+Segment = Tuple[str, Dict[str, Any]]
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    global _pdf_pool
+
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            # Spawned, not forked: forking a process that already runs
+            # server, ingest and model threads can copy held locks.
+            _pdf_pool = ProcessPoolExecutor(
+                max_workers=PDF_PARSE_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pdf_pool
+
+
+def shutdown_pdf_pool() -> None:
+    """
+    Stop the PDF worker processes, if they were started.
+    """
+    global _pdf_pool
+
+    with _pdf_pool_lock:
+        pool, _pdf_pool = _pdf_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _extract_page_range(path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """
+    Worker-side: text of pages [start, end) as (1-based page number, text).
+    """
     reader = PdfReader(path)
-    text = ""
-    for page in reader.pages:
-        if page.extract_text():
-            text += page.extract_text() + "\n"
-    return text
+    return [
+        (i + 1, reader.pages[i].extract_text() or "")
+        for i in range(start, end)
+    ]
+
+
+def iter_pdf_pages(path: str) -> Iterator[Tuple[int, str]]:
+    """
+    Yield (page number, text) in page order as soon as each page (or page
+    range, for large PDFs parsed in parallel) is extracted.
+    """
+    reader = PdfReader(path)
+    page_count = len(reader.pages)
+
+    if page_count < PDF_PARALLEL_MIN_PAGES or PDF_PARSE_PROCESSES <= 1:
+        for i, page in enumerate(reader.pages):
+            yield i + 1, page.extract_text() or ""
+        return
+
+    pool = _get_pdf_pool()
+    futures = [
+        pool.submit(_extract_page_range, path, start, min(start + PDF_PAGES_PER_SHARD, page_count))
+        for start in range(0, page_count, PDF_PAGES_PER_SHARD)
+    ]
+
+    try:
+        for future in futures:
+            yield from future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def load_pdf(path: str) -> str:
+    return "\n".join(text for _, text in iter_pdf_pages(path) if text)
 
 
 def load_docx(path: str) -> str:
@@ -18,13 +105,174 @@ def load_docx(path: str) -> str:
     return "\n".join(p.text for p in doc.paragraphs if p.text.strip())
 
 
+def _is_docx_heading(paragraph) -> bool:
+    style = (paragraph.style.name if paragraph.style is not None else "") or ""
+    return style.startswith("Heading") or style == "Title"
+
+
+def iter_docx_sections(path: str) -> Iterator[Segment]:
+    """
+    One segment per heading section. The heading is the first line of the
+    segment and is also carried as "section"; paragraphs are separated by
+    blank lines so chunkers can keep them intact.
+    """
+    doc = Document(path)
+    section: Optional[str] = None
+    paragraphs: List[str] = []
+
+    def render() -> Segment:
+        meta: Dict[str, Any] = {"section": section} if section else {}
+        lines = ([section] if section else []) + paragraphs
+        return "\n\n".join(lines), meta
+
+    for p in doc.paragraphs:
+        text = p.text.strip()
+        if not text:
+            continue
+
+        if _is_docx_heading(p):
+            if paragraphs or section:
+                yield render()
+            section, paragraphs = text, []
+            continue
+
+        paragraphs.append(text)
+
+    if paragraphs or section:
+        yield render()
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return ""
+    return " ".join(str(value).split())
+
+
+def _row_groups(
+    rows: Iterator[Tuple[int, List[Any]]],
+    sheet: Optional[str],
+) -> Iterator[Segment]:
+    """
+    Turn (row number, values) pairs into row-group segments. The first
+    non-empty row is the header and is repeated at the top of every group.
+    """
+    header: Optional[List[str]] = None
+    group: List[str] = []
+    numbers: List[int] = []
+    group_chars = 0
+    first_row = last_row = 0
+
+    def render() -> Segment:
+        title = f"Sheet: {sheet} " if sheet else ""
+        text = f"{title}(rows {first_row}-{last_row})\n" + " | ".join(header) + "\n" + "\n".join(group)
+        meta: Dict[str, Any] = {
+            "table": True,
+            "row_start": first_row,
+            "row_end": last_row,
+            "row_numbers": list(numbers),
+        }
+        if sheet:
+            meta["sheet"] = sheet
+        return text, meta
+
+    for row_number, values in rows:
+        cells = [_cell(v) for v in values]
+        if not any(cells):
+            continue
+
+        if header is None:
+            header = [c or f"column_{i + 1}" for i, c in enumerate(cells)]
+            continue
+
+        line = " | ".join(cells)
+        if group and (group_chars + len(line) > TABLE_CHUNK_CHARS or len(group) >= TABLE_MAX_ROWS):
+            yield render()
+            group, numbers, group_chars = [], [], 0
+
+        if not group:
+            first_row = row_number
+        group.append(line)
+        numbers.append(row_number)
+        group_chars += len(line) + 1
+        last_row = row_number
+
+    if group:
+        yield render()
+
+
+def iter_xlsx_row_groups(path: str) -> Iterator[Segment]:
+    """
+    Stream an .xlsx workbook sheet by sheet in openpyxl read-only mode,
+    so memory stays flat however many rows it has.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            rows = enumerate(sheet.iter_rows(values_only=True), start=1)
+            yield from _row_groups(rows, sheet.title)
+    finally:
+        workbook.close()
+
+
+def iter_xls_row_groups(path: str) -> Iterator[Segment]:
+    """
+    Legacy .xls has no streaming reader; load one sheet at a time.
+    """
+    sheet_names = pd.ExcelFile(path).sheet_names
+    for sheet_name in sheet_names:
+        df = pd.read_excel(path, sheet_name=sheet_name, header=None, dtype=object)
+        rows = (
+            (i + 1, [None if pd.isna(v) else v for v in values])
+            for i, values in enumerate(df.itertuples(index=False, name=None))
+        )
+        yield from _row_groups(rows, str(sheet_name))
+
+
+def iter_csv_row_groups(path: str) -> Iterator[Segment]:
+    with open(path, newline="", encoding="utf-8-sig", errors="replace") as f:
+        yield from _row_groups(enumerate(csv.reader(f), start=1), None)
+
+
+def iter_table_row_groups(path: str) -> Iterator[Segment]:
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return iter_csv_row_groups(path)
+    if ext == ".xls":
+        return iter_xls_row_groups(path)
+    return iter_xlsx_row_groups(path)
+
+
 def load_excel(path: str) -> str:
-    sheets = pd.read_excel(path, sheet_name=None)
-    text = ""
-    for sheet_name, df in sheets.items():
-        text += f"\nSheet: {sheet_name}\n"
-        text += df.astype(str).to_string(index=False)
-    return text
+    return "\n".join(text for text, _ in iter_table_row_groups(path))
+
+
+def iter_segments(path: str) -> Iterator[Segment]:
+    """
+    Stream a document as (text, metadata) segments. PDFs yield one segment
+    per page with its page number, so chunking can start while later pages
+    are still being parsed. Spreadsheets and CSV yield ready-made row-group
+    segments (marked "table") with sheet and row-range metadata. DOCX
+    files yield one segment per heading section.
+    """
+    ext = os.path.splitext(path)[1].lower()
+
+    if ext == ".pdf":
+        for page, text in iter_pdf_pages(path):
+            if text:
+                yield text, {"page": page}
+        return
+
+    if ext in TABLE_EXTENSIONS:
+        yield from iter_table_row_groups(path)
+        return
+
+    if ext == ".docx":
+        yield from iter_docx_sections(path)
+        return
+
+    yield load_file(path), {}
 
 
 def load_file(path: str) -> str:
@@ -34,7 +282,7 @@ def load_file(path: str) -> str:
         return load_pdf(path)
     if ext == ".docx":
         return load_docx(path)
-    if ext in [".xlsx", ".xls"]:
+    if ext in TABLE_EXTENSIONS:
         return load_excel(path)
 
     raise ValueError(f"Unsupported file type: {ext}")
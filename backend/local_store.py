@@ -0,0 +1,1156 @@
+"""
+In-process vector backend.
+
+LocalCollection mirrors the subset of chromadb's Collection API that the
+rest of the backend uses (add / upsert / update / get / query / count /
+delete), so VectorStore, DocumentSummaryStore and rag.py work against it
+unchanged. Vectors live in one contiguous float32 matrix; search is exact
+brute force, or HNSW when hnswlib is installed and enabled.
+PartitionedCollection keeps one such collection per file, each with its
+own graph once it reaches HNSW_MIN_ROWS; smaller partitions are searched
+exactly, and unfiltered queries merge the results of every partition.
+"""
+import hashlib
+import heapq
+import json
+import os
+import shutil
+import threading
+from typing import List, Dict, Optional, Any, Iterable
+
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:  # optional dependency
+    hnswlib = None
+
+
+# Below this many rows brute force is faster than maintaining a graph.
+HNSW_MIN_ROWS = 5000
+
+# Marks a query that is not pinned to one partition.
+_ALL = object()
+
+# Quantized collections score this many candidates per requested result
+# approximately before re-scoring them at full precision.
+RESCORE_FACTOR = int(os.getenv("LOCAL_VECTOR_RESCORE", "8"))
+# Rows converted back to float32 at a time while scanning quantized codes.
+SCAN_BLOCK_ROWS = 8192
+
+VECTOR_DTYPES = ("float32", "float16", "int8")
+
+
+# -------- QUANTIZATION --------
+def quantize(vectors: np.ndarray, dtype: str):
+    """
+    Scalar-quantize rows of `vectors`. int8 uses one symmetric scale per
+    row; returns (codes, scales) with scales None for float16.
+    """
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+
+    scales = np.abs(vectors).max(axis=1) / 127.0 if len(vectors) else np.zeros(0)
+    scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales
+
+
+def _smallest(values: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k smallest values, in ascending order.
+    """
+    if k < values.shape[0]:
+        top = np.argpartition(values, k - 1)[:k]
+    else:
+        top = np.arange(values.shape[0])
+    return top[np.argsort(values[top])]
+
+
+# -------- WHERE FILTERS --------
+def _match_condition(value: Any, condition: Any) -> bool:
+    if not isinstance(condition, dict):
+        return value == condition
+
+    for op, expected in condition.items():
+        if op == "$eq" and value != expected:
+            return False
+        if op == "$ne" and value == expected:
+            return False
+        if op == "$in" and value not in expected:
+            return False
+        if op == "$nin" and value in expected:
+            return False
+        if op in ("$gt", "$gte", "$lt", "$lte"):
+            if value is None:
+                return False
+            if op == "$gt" and not value > expected:
+                return False
+            if op == "$gte" and not value >= expected:
+                return False
+            if op == "$lt" and not value < expected:
+                return False
+            if op == "$lte" and not value <= expected:
+                return False
+    return True
+
+
+def matches_where(metadata: Dict, where: Optional[Dict]) -> bool:
+    """
+    Evaluate a Chroma-style `where` filter against one metadata dict.
+    """
+    if not where:
+        return True
+
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, c) for c in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, c) for c in condition):
+                return False
+        elif not _match_condition(metadata.get(key), condition):
+            return False
+    return True
+
+
+# -------- COLLECTION --------
+class _Rows:
+    """
+    Array that grows by appending rows. Capacity doubles, so n appended
+    rows cost O(n) copying in total; `array` is a view of the filled part.
+    """
+
+    def __init__(self, dtype):
+        self.dtype = dtype
+        self.n = 0
+        self._buffer: Optional[np.ndarray] = None
+
+    @property
+    def array(self) -> Optional[np.ndarray]:
+        return None if self._buffer is None else self._buffer[:self.n]
+
+    def append(self, rows: np.ndarray) -> np.ndarray:
+        rows = np.asarray(rows, dtype=self.dtype)
+        needed = self.n + len(rows)
+        if self._buffer is None or needed > len(self._buffer):
+            capacity = max(needed, 2 * (0 if self._buffer is None else len(self._buffer)), 64)
+            buffer = np.empty((capacity,) + rows.shape[1:], dtype=self.dtype)
+            if self.n:
+                buffer[:self.n] = self._buffer[:self.n]
+            self._buffer = buffer
+        self._buffer[self.n:needed] = rows
+        self.n = needed
+        return self.array
+
+    def reset(self, rows: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        self._buffer, self.n = None, 0
+        return self.append(rows) if rows is not None and len(rows) else None
+
+
+class LocalCollection:
+    """
+    A single named collection persisted under `path`.
+
+    Writes are appended: new vectors go to the end of a raw float32 file,
+    and new records and metadata changes to a JSON-lines log next to the
+    records.json snapshot. Overwritten vectors are rewritten in place.
+    Only deletes, or a log grown past the snapshot, rewrite the files.
+
+    With dtype "float16" or "int8" only quantized codes are kept in
+    memory; the float32 vectors stay on disk (memory-mapped) and are read
+    only to re-score the best approximate candidates of each query.
+    """
+
+    def __init__(self, name: str, path: str, index_type: str = "flat", dtype: str = "float32"):
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unknown vector dtype: {dtype}")
+
+        self.name = name
+        self.path = path
+        self.index_type = index_type
+        self.dtype = dtype
+
+        self._lock = threading.RLock()
+        self._ids: List[str] = []
+        self._documents: List[Optional[str]] = []
+        self._metadatas: List[Dict] = []
+        self._row_of: Dict[str, int] = {}
+        self._dim: Optional[int] = None
+        self._vector_rows = _Rows(np.float32)
+        self._norm_rows = _Rows(np.float32)
+        self._code_rows = _Rows(np.float16 if dtype == "float16" else np.int8)
+        self._scale_rows = _Rows(np.float32)
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._codes: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+
+        # Files of the current snapshot generation.
+        self._generation = 0
+        self._snapshot_bytes = 0
+        self._log_bytes = 0
+
+        self._hnsw = None
+        self._hnsw_dirty = True
+        # field -> value -> rows, built lazily for equality filters
+        self._eq_indexes: Dict[str, Dict[Any, List[int]]] = {}
+
+        self._load()
+
+    # ---- persistence ----
+    def _records_file(self) -> str:
+        return os.path.join(self.path, "records.json")
+
+    def _vectors_file(self, generation: Optional[int] = None) -> str:
+        generation = self._generation if generation is None else generation
+        return os.path.join(self.path, f"vectors-{generation}.f32")
+
+    def _log_file(self, generation: Optional[int] = None) -> str:
+        generation = self._generation if generation is None else generation
+        return os.path.join(self.path, f"records-{generation}.log")
+
+    def _files(self) -> List[str]:
+        return [self._records_file(), self._vectors_file(), self._log_file()]
+
+    def _load(self) -> None:
+        records_file = self._records_file()
+        if not os.path.exists(records_file):
+            return
+
+        with open(records_file, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        self._snapshot_bytes = os.path.getsize(records_file)
+
+        self._ids = records["ids"]
+        self._documents = records["documents"]
+        self._metadatas = records["metadatas"]
+
+        if "generation" not in records:
+            # Written before the append-only layout: one vectors.npy.
+            legacy = os.path.join(self.path, "vectors.npy")
+            self._row_of = {id_: i for i, id_ in enumerate(self._ids)}
+            if self._ids:
+                self._set_vectors(np.ascontiguousarray(np.load(legacy), dtype=np.float32))
+            self._compact()
+            if os.path.exists(legacy):
+                os.remove(legacy)
+            return
+
+        self._generation = records["generation"]
+        self._dim = records["dim"]
+        self._replay_log()
+        self._row_of = {id_: i for i, id_ in enumerate(self._ids)}
+
+        # Rows appended to the vectors file whose records never made it
+        # into the log (an interrupted write) are cut off.
+        vectors_file = self._vectors_file()
+        n = len(self._ids)
+        row_bytes = 4 * (self._dim or 0)
+        if os.path.exists(vectors_file) and os.path.getsize(vectors_file) > n * row_bytes:
+            os.truncate(vectors_file, n * row_bytes)
+
+        if n:
+            if self.quantized:
+                self._map_vectors()
+            else:
+                vectors = np.fromfile(vectors_file, dtype=np.float32).reshape(n, self._dim)
+                self._vectors = self._vector_rows.reset(vectors)
+            self._refresh_derived()
+
+    def _replay_log(self) -> None:
+        log_file = self._log_file()
+        if not os.path.exists(log_file):
+            return
+
+        good = 0
+        with open(log_file, "rb") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # a torn last line from an interrupted write
+                if "append" in entry:
+                    added = entry["append"]
+                    self._ids.extend(added["ids"])
+                    self._documents.extend(added["documents"])
+                    self._metadatas.extend(added["metadatas"])
+                else:
+                    changed = entry["set"]
+                    for j, row in enumerate(changed["rows"]):
+                        if changed.get("documents") is not None:
+                            self._documents[row] = changed["documents"][j]
+                        if changed.get("metadatas") is not None:
+                            self._metadatas[row] = changed["metadatas"][j]
+                good += len(line)
+
+        if good < os.path.getsize(log_file):
+            os.truncate(log_file, good)
+        self._log_bytes = good
+
+    @property
+    def quantized(self) -> bool:
+        return self.dtype != "float32"
+
+    def _map_vectors(self) -> None:
+        self._vector_rows.reset(None)
+        n = len(self._ids)
+        if n:
+            self._vectors = np.memmap(self._vectors_file(), dtype=np.float32, mode="r", shape=(n, self._dim))
+        else:
+            self._vectors = np.zeros((0, self._dim or 0), dtype=np.float32)
+
+    def _set_vectors(self, vectors: np.ndarray) -> None:
+        """
+        Replace the whole float32 matrix (in memory; the caller persists).
+        """
+        self._dim = vectors.shape[1] if vectors.ndim == 2 else self._dim
+        self._vectors = self._vector_rows.reset(vectors)
+        if self._vectors is None:
+            self._vectors = np.zeros((0, self._dim or 0), dtype=np.float32)
+        self._refresh_derived()
+
+    def _derive(self, block: np.ndarray):
+        """
+        (norms, codes, scales) of some float32 rows; codes and scales are
+        None unless the collection is quantized.
+        """
+        block = np.asarray(block, dtype=np.float32)
+        norms = np.einsum("ij,ij->i", block, block)
+        if not self.quantized:
+            return norms, None, None
+        codes, scales = quantize(block, self.dtype)
+        return norms, codes, scales
+
+    def _append_derived(self, block: np.ndarray) -> None:
+        norms, codes, scales = self._derive(block)
+        self._norms = self._norm_rows.append(norms)
+        if codes is not None:
+            self._codes = self._code_rows.append(codes)
+        if scales is not None:
+            self._scales = self._scale_rows.append(scales)
+
+    def _refresh_derived(self) -> None:
+        """
+        Recompute norms (and quantized codes) from the float32 vectors,
+        block by block so a memory-mapped matrix is never fully resident.
+        """
+        for rows in (self._norm_rows, self._code_rows, self._scale_rows):
+            rows.reset(None)
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._codes = self._scales = None
+
+        n = self._vectors.shape[0]
+        for start in range(0, n, SCAN_BLOCK_ROWS):
+            self._append_derived(self._vectors[start:start + SCAN_BLOCK_ROWS])
+
+    def _append_log(self, entry: Dict[str, Any]) -> None:
+        line = (json.dumps(entry) + "\n").encode("utf-8")
+        with open(self._log_file(), "ab") as f:
+            f.write(line)
+        self._log_bytes += len(line)
+        # Replaying a log much larger than the snapshot would slow loading.
+        if self._log_bytes > max(1 << 20, self._snapshot_bytes):
+            self._compact()
+
+    def _compact(self, keep: Optional[List[int]] = None) -> None:
+        """
+        Write a new snapshot generation (only rows `keep`, if given):
+        vectors file, empty log, then records.json as the commit point.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        old_files = [self._vectors_file(), self._log_file()]
+        generation = self._generation + 1
+        rows = list(range(len(self._ids))) if keep is None else keep
+
+        with open(self._vectors_file(generation), "wb") as f:
+            for start in range(0, len(rows), SCAN_BLOCK_ROWS):
+                block = rows[start:start + SCAN_BLOCK_ROWS]
+                f.write(np.ascontiguousarray(self._vectors[block], dtype=np.float32).tobytes())
+        open(self._log_file(generation), "wb").close()
+
+        if keep is not None:
+            self._ids = [self._ids[i] for i in keep]
+            self._documents = [self._documents[i] for i in keep]
+            self._metadatas = [self._metadatas[i] for i in keep]
+            self._row_of = {id_: i for i, id_ in enumerate(self._ids)}
+
+        records_file = self._records_file()
+        tmp = records_file + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "generation": generation,
+                    "dim": self._dim,
+                    "ids": self._ids,
+                    "documents": self._documents,
+                    "metadatas": self._metadatas,
+                },
+                f,
+            )
+        os.replace(tmp, records_file)
+
+        self._generation = generation
+        self._snapshot_bytes = os.path.getsize(records_file)
+        self._log_bytes = 0
+
+        if keep is not None:
+            if self.quantized:
+                self._map_vectors()
+                self._refresh_derived()
+            else:
+                self._set_vectors(np.ascontiguousarray(self._vectors[keep], dtype=np.float32))
+        elif self.quantized:
+            self._map_vectors()
+
+        for file in old_files:
+            try:
+                os.remove(file)
+            except OSError:
+                pass  # missing, or still mapped on platforms that refuse
+
+    # ---- writes ----
+    def _as_matrix(self, embeddings) -> np.ndarray:
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        if self._dim is not None and matrix.shape[1] != self._dim:
+            raise ValueError(
+                f"Embedding dimension {matrix.shape[1]} does not match "
+                f"collection dimension {self._dim}"
+            )
+        return matrix
+
+    def _append(self, ids: List[str], matrix: np.ndarray, documents: List, metadatas: List[Dict]) -> None:
+        start = len(self._ids)
+        if self._dim is None:
+            self._dim = matrix.shape[1]
+            self._compact()
+
+        with open(self._vectors_file(), "ab") as f:
+            f.write(np.ascontiguousarray(matrix, dtype=np.float32).tobytes())
+
+        self._ids.extend(ids)
+        self._documents.extend(documents)
+        self._metadatas.extend(metadatas)
+        for offset, id_ in enumerate(ids):
+            self._row_of[id_] = start + offset
+
+        if self.quantized:
+            self._map_vectors()
+        else:
+            self._vectors = self._vector_rows.append(matrix)
+        # Only the appended rows are quantized.
+        self._append_derived(matrix)
+        self._hnsw_add(np.arange(start, start + len(ids)), matrix)
+
+        for field, index in self._eq_indexes.items():
+            for offset, meta in enumerate(metadatas):
+                index.setdefault(meta.get(field), []).append(start + offset)
+
+        self._append_log({"append": {"ids": ids, "documents": documents, "metadatas": metadatas}})
+
+    def _overwrite_vectors(self, rows: List[int], matrix: np.ndarray) -> None:
+        """
+        Rewrite existing rows in place, on disk and in memory.
+        """
+        row_bytes = 4 * self._dim
+        with open(self._vectors_file(), "r+b") as f:
+            for row, vector in zip(rows, matrix):
+                f.seek(row * row_bytes)
+                f.write(np.ascontiguousarray(vector, dtype=np.float32).tobytes())
+
+        if not self.quantized:
+            self._vectors[rows] = matrix
+        norms, codes, scales = self._derive(matrix)
+        self._norms[rows] = norms
+        if codes is not None:
+            self._codes[rows] = codes
+        if scales is not None:
+            self._scales[rows] = scales
+        self._hnsw_add(np.asarray(rows, dtype=np.int64), matrix)
+
+    def _write(
+        self,
+        ids: List[str],
+        embeddings,
+        metadatas: Optional[List[Dict]],
+        documents: Optional[List[str]],
+        allow_existing: bool,
+    ) -> None:
+        matrix = self._as_matrix(embeddings)
+        if len(ids) != matrix.shape[0]:
+            raise ValueError("ids and embeddings must have the same length")
+
+        metadatas = metadatas or [{} for _ in ids]
+        documents = documents or [None for _ in ids]
+
+        with self._lock:
+            new_rows, existing_rows, positions = [], [], {}
+            for i, id_ in enumerate(ids):
+                row = self._row_of.get(id_)
+                if row is None and id_ in positions:
+                    # Repeated within the call: the last one wins.
+                    new_rows[positions[id_]] = i
+                elif row is None:
+                    positions[id_] = len(new_rows)
+                    new_rows.append(i)
+                elif not allow_existing:
+                    raise ValueError(f"ID already exists: {id_}")
+                else:
+                    existing_rows.append((row, i))
+
+            if existing_rows:
+                rows = [row for row, _ in existing_rows]
+                self._overwrite_vectors(rows, matrix[[i for _, i in existing_rows]])
+                for row, i in existing_rows:
+                    self._documents[row] = documents[i]
+                    self._metadatas[row] = dict(metadatas[i])
+                self._eq_indexes = {}
+                self._append_log({"set": {
+                    "rows": rows,
+                    "documents": [documents[i] for _, i in existing_rows],
+                    "metadatas": [dict(metadatas[i]) for _, i in existing_rows],
+                }})
+
+            if new_rows:
+                self._append(
+                    [ids[i] for i in new_rows],
+                    matrix[new_rows],
+                    [documents[i] for i in new_rows],
+                    [dict(metadatas[i]) for i in new_rows],
+                )
+
+    def add(self, ids, embeddings, metadatas=None, documents=None) -> None:
+        self._write(list(ids), embeddings, metadatas, documents, allow_existing=False)
+
+    def upsert(self, ids, embeddings, metadatas=None, documents=None) -> None:
+        self._write(list(ids), embeddings, metadatas, documents, allow_existing=True)
+
+    def update(self, ids, embeddings=None, metadatas=None, documents=None) -> None:
+        with self._lock:
+            found = [(self._row_of[id_], i) for i, id_ in enumerate(ids) if id_ in self._row_of]
+            if not found:
+                return
+
+            rows = [row for row, _ in found]
+            if embeddings is not None:
+                self._overwrite_vectors(rows, self._as_matrix([embeddings[i] for _, i in found]))
+            if metadatas is not None:
+                for row, i in found:
+                    self._metadatas[row] = dict(metadatas[i])
+                self._eq_indexes = {}
+            if documents is not None:
+                for row, i in found:
+                    self._documents[row] = documents[i]
+
+            if documents is not None or metadatas is not None:
+                self._append_log({"set": {
+                    "rows": rows,
+                    "documents": [documents[i] for _, i in found] if documents is not None else None,
+                    "metadatas": [dict(metadatas[i]) for _, i in found] if metadatas is not None else None,
+                }})
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None) -> None:
+        with self._lock:
+            rows = set(self._select_rows(ids=ids, where=where))
+            if not rows:
+                return
+
+            self._compact(keep=[i for i in range(len(self._ids)) if i not in rows])
+            # Rows are renumbered, so the graph is rebuilt on the next query.
+            self._hnsw_dirty = True
+            self._eq_indexes = {}
+
+    # ---- reads ----
+    def count(self) -> int:
+        return len(self._ids)
+
+    def _equality_rows(self, where: Dict) -> Optional[List[int]]:
+        """
+        Fast path for single-field equality filters such as
+        {"file_name": {"$eq": name}}: answered from a cached value index.
+        """
+        if len(where) != 1:
+            return None
+
+        field, condition = next(iter(where.items()))
+        if field.startswith("$"):
+            return None
+        if isinstance(condition, dict):
+            if list(condition) != ["$eq"]:
+                return None
+            condition = condition["$eq"]
+
+        index = self._eq_indexes.get(field)
+        if index is None:
+            index = {}
+            for row, meta in enumerate(self._metadatas):
+                index.setdefault(meta.get(field), []).append(row)
+            self._eq_indexes[field] = index
+        return index.get(condition, [])
+
+    def _select_rows(
+        self,
+        ids: Optional[Iterable[str]] = None,
+        where: Optional[Dict] = None,
+    ) -> List[int]:
+        if ids is None and where:
+            rows = self._equality_rows(where)
+            if rows is not None:
+                return list(rows)
+
+        if ids is not None:
+            rows = [self._row_of[id_] for id_ in ids if id_ in self._row_of]
+        else:
+            rows = range(len(self._ids))
+
+        if where:
+            rows = [r for r in rows if matches_where(self._metadatas[r], where)]
+        return list(rows)
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        include = include or ["documents", "metadatas"]
+
+        with self._lock:
+            rows = self._select_rows(ids=ids, where=where)
+            if offset:
+                rows = rows[offset:]
+            if limit is not None:
+                rows = rows[:limit]
+
+            result: Dict[str, Any] = {"ids": [self._ids[r] for r in rows]}
+            result["documents"] = (
+                [self._documents[r] for r in rows] if "documents" in include else None
+            )
+            result["metadatas"] = (
+                [dict(self._metadatas[r]) for r in rows] if "metadatas" in include else None
+            )
+            result["embeddings"] = (
+                np.array(self._vectors[rows], dtype=np.float32) if "embeddings" in include else None
+            )
+        return result
+
+    def _ensure_hnsw(self) -> None:
+        if not self._hnsw_dirty and self._hnsw is not None:
+            return
+
+        n, dim = self._vectors.shape
+        index = hnswlib.Index(space="l2", dim=dim)
+        index.init_index(max_elements=n, ef_construction=200, M=16)
+        index.add_items(self._vectors, np.arange(n))
+        index.set_ef(64)
+        self._hnsw = index
+        self._hnsw_dirty = False
+
+    def _hnsw_add(self, rows: np.ndarray, matrix: np.ndarray) -> None:
+        """
+        Insert appended rows into an already built graph, growing it by
+        doubling. Rewritten rows are re-added under their label, which
+        hnswlib treats as an in-place update.
+        """
+        if self._hnsw is None or self._hnsw_dirty or not len(rows):
+            return
+
+        capacity = self._hnsw.get_max_elements()
+        needed = int(rows.max()) + 1
+        if needed > capacity:
+            self._hnsw.resize_index(max(needed, 2 * capacity))
+        self._hnsw.add_items(np.asarray(matrix, dtype=np.float32), rows)
+
+    def _search(self, query: np.ndarray, rows: Optional[np.ndarray], k: int):
+        """
+        Top-k rows for one query: the HNSW graph for unfiltered queries on
+        a large enough collection with LOCAL_VECTOR_INDEX=hnsw, exact
+        _top_k otherwise.
+        """
+        use_hnsw = (
+            self.index_type == "hnsw"
+            and hnswlib is not None
+            and rows is None
+            and len(self._ids) >= HNSW_MIN_ROWS
+        )
+        if not use_hnsw:
+            return self._top_k(query, rows, k)
+
+        self._ensure_hnsw()
+        labels, dists = self._hnsw.knn_query(query, k=min(k, len(self._ids)))
+        return labels[0].astype(np.int64), dists[0]
+
+    def _approx_dot(self, query: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        """
+        query . vector for every row from the quantized codes, converting
+        at most SCAN_BLOCK_ROWS codes to float32 at a time.
+        """
+        n = self._codes.shape[0] if rows is None else len(rows)
+        dots = np.empty(n, dtype=np.float32)
+        for start in range(0, n, SCAN_BLOCK_ROWS):
+            block_rows = slice(start, start + SCAN_BLOCK_ROWS) if rows is None else rows[start:start + SCAN_BLOCK_ROWS]
+            dots[start:start + SCAN_BLOCK_ROWS] = self._codes[block_rows].astype(np.float32) @ query
+        if self._scales is not None:
+            dots *= self._scales if rows is None else self._scales[rows]
+        return dots
+
+    def _top_k(self, query: np.ndarray, rows: Optional[np.ndarray], k: int):
+        """
+        Squared-L2 top-k (Chroma's default distance) over `rows`, or over
+        the whole matrix when rows is None. Quantized collections pick
+        candidates from the codes and re-score them exactly.
+        """
+        n = self._vectors.shape[0] if rows is None else len(rows)
+        k = min(k, n)
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        query = np.asarray(query, dtype=np.float32)
+        query_norm = float(query @ query)
+        norms = self._norms if rows is None else self._norms[rows]
+
+        if not self.quantized:
+            vectors = self._vectors if rows is None else self._vectors[rows]
+            distances = norms - 2.0 * (vectors @ query) + query_norm
+            top = _smallest(distances, k)
+            found = top if rows is None else rows[top]
+            return found, np.maximum(distances[top], 0.0)
+
+        approx = norms - 2.0 * self._approx_dot(query, rows) + query_norm
+        candidates = _smallest(approx, min(n, k * max(1, RESCORE_FACTOR)))
+        candidates = np.sort(candidates if rows is None else rows[candidates])
+
+        # Sorted rows keep reads from the memory-mapped file sequential.
+        exact = self._norms[candidates] - 2.0 * (np.asarray(self._vectors[candidates]) @ query) + query_norm
+        top = _smallest(exact, k)
+        return candidates[top], np.maximum(exact[top], 0.0)
+
+    def memory_bytes(self) -> int:
+        """
+        Resident size of the search structures (excluding memory-mapped
+        full-precision vectors).
+        """
+        size = self._norms.nbytes
+        if self.quantized:
+            size += self._codes.nbytes if self._codes is not None else 0
+            size += self._scales.nbytes if self._scales is not None else 0
+        else:
+            size += self._vectors.nbytes
+        return size
+
+    def query(
+        self,
+        query_embeddings,
+        n_results: int = 10,
+        where: Optional[Dict] = None,
+        include: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        include = include or ["documents", "metadatas", "distances"]
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+
+        out: Dict[str, Any] = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+
+        with self._lock:
+            rows = None
+            if where:
+                rows = np.asarray(self._select_rows(where=where), dtype=np.int64)
+
+            for query in queries:
+                if not self._ids:
+                    found, dists = np.zeros(0, dtype=np.int64), np.zeros(0)
+                else:
+                    found, dists = self._search(query, rows, n_results)
+
+                out["ids"].append([self._ids[r] for r in found])
+                out["documents"].append([self._documents[r] for r in found])
+                out["metadatas"].append([dict(self._metadatas[r]) for r in found])
+                out["distances"].append([float(d) for d in dists])
+
+        for key in ("documents", "metadatas", "distances"):
+            if key not in include:
+                out[key] = None
+        return out
+
+
+# -------- PARTITIONED COLLECTION --------
+def _partition_dir(value: Any) -> str:
+    return hashlib.sha1(json.dumps(value).encode("utf-8")).hexdigest()[:16]
+
+
+class PartitionedCollection:
+    """
+    A collection split into one small LocalCollection per value of a
+    metadata key (file_name for chunks). Queries filtered on that key go
+    straight to its partition, so a file-scoped search costs nothing
+    related to the rest of the vault; other queries fan out and merge.
+    Deleting everything for a key value drops its partition.
+    """
+
+    def __init__(self, name: str, path: str, key: str, index_type: str = "flat", dtype: str = "float32"):
+        self.name = name
+        self.path = path
+        self.key = key
+        self.index_type = index_type
+        self.dtype = dtype
+
+        self._lock = threading.RLock()
+        self._partitions: Dict[Any, LocalCollection] = {}
+        self._partition_of: Dict[str, Any] = {}
+
+        self._load()
+
+    # ---- persistence ----
+    def _manifest_file(self) -> str:
+        return os.path.join(self.path, "partitions.json")
+
+    def _open(self, value: Any) -> LocalCollection:
+        return LocalCollection(
+            name=f"{self.name}/{value}",
+            path=os.path.join(self.path, "partitions", _partition_dir(value)),
+            index_type=self.index_type,
+            dtype=self.dtype,
+        )
+
+    def _load(self) -> None:
+        manifest = self._manifest_file()
+        if os.path.exists(manifest):
+            with open(manifest, "r", encoding="utf-8") as f:
+                values = json.load(f)["values"]
+            for value in values:
+                partition = self._open(value)
+                self._partitions[value] = partition
+                for id_ in partition._ids:
+                    self._partition_of[id_] = value
+            return
+
+        # A collection written before partitioning: split it once.
+        if os.path.exists(os.path.join(self.path, "records.json")):
+            flat = LocalCollection(self.name, self.path, self.index_type, self.dtype)
+            records = flat.get(include=["documents", "metadatas", "embeddings"])
+            if records["ids"]:
+                self.upsert(
+                    ids=records["ids"],
+                    embeddings=records["embeddings"],
+                    metadatas=records["metadatas"],
+                    documents=records["documents"],
+                )
+            self._persist_manifest()
+            for file in flat._files():
+                if os.path.exists(file):
+                    os.remove(file)
+            print(f"[INFO] Split {self.name} into {len(self._partitions)} partitions")
+
+    def _persist_manifest(self) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        tmp = self._manifest_file() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"key": self.key, "values": list(self._partitions)}, f)
+        os.replace(tmp, self._manifest_file())
+
+    def _drop(self, value: Any) -> None:
+        partition = self._partitions.pop(value, None)
+        if partition is None:
+            return
+        for id_ in partition._ids:
+            self._partition_of.pop(id_, None)
+        shutil.rmtree(partition.path, ignore_errors=True)
+        self._persist_manifest()
+
+    # ---- routing ----
+    def _route(self, where: Optional[Dict]):
+        """
+        Split a filter into (partition value, remaining filter) when it
+        pins the partition key to one value; value is _ALL otherwise.
+        """
+        if not where:
+            return _ALL, None
+
+        conditions = where["$and"] if list(where) == ["$and"] else [{k: v} for k, v in where.items()]
+        value, rest = _ALL, []
+        for condition in conditions:
+            if value is _ALL and list(condition) == [self.key]:
+                expected = condition[self.key]
+                if not isinstance(expected, dict):
+                    value = expected
+                    continue
+                if list(expected) == ["$eq"]:
+                    value = expected["$eq"]
+                    continue
+            rest.append(condition)
+
+        if value is _ALL:
+            return _ALL, where
+        if not rest:
+            return value, None
+        return value, rest[0] if len(rest) == 1 else {"$and": rest}
+
+    def _targets(self, value: Any) -> List[LocalCollection]:
+        if value is _ALL:
+            return list(self._partitions.values())
+        partition = self._partitions.get(value)
+        return [partition] if partition is not None else []
+
+    # ---- writes ----
+    def _write(self, ids, embeddings, metadatas, documents, allow_existing: bool) -> None:
+        ids = list(ids)
+        metadatas = metadatas or [{} for _ in ids]
+        documents = documents or [None for _ in ids]
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+
+        groups: Dict[Any, List[int]] = {}
+        for i, meta in enumerate(metadatas):
+            groups.setdefault(meta.get(self.key), []).append(i)
+
+        with self._lock:
+            created = False
+            for value, rows in groups.items():
+                # An ID whose key value changed leaves its old partition.
+                moved = [ids[i] for i in rows if self._partition_of.get(ids[i], value) != value]
+                if moved and not allow_existing:
+                    raise ValueError(f"ID already exists: {moved[0]}")
+                if moved:
+                    self.delete(ids=moved)
+
+                partition = self._partitions.get(value)
+                if partition is None:
+                    partition = self._partitions[value] = self._open(value)
+                    created = True
+
+                partition._write(
+                    [ids[i] for i in rows],
+                    embeddings[rows],
+                    [metadatas[i] for i in rows],
+                    [documents[i] for i in rows],
+                    allow_existing,
+                )
+                for i in rows:
+                    self._partition_of[ids[i]] = value
+
+            if created:
+                self._persist_manifest()
+
+    def add(self, ids, embeddings, metadatas=None, documents=None) -> None:
+        self._write(ids, embeddings, metadatas, documents, allow_existing=False)
+
+    def upsert(self, ids, embeddings, metadatas=None, documents=None) -> None:
+        self._write(ids, embeddings, metadatas, documents, allow_existing=True)
+
+    def update(self, ids, embeddings=None, metadatas=None, documents=None) -> None:
+        with self._lock:
+            by_partition: Dict[Any, List[int]] = {}
+            for i, id_ in enumerate(ids):
+                if id_ in self._partition_of:
+                    by_partition.setdefault(self._partition_of[id_], []).append(i)
+
+            for value, rows in by_partition.items():
+                moved = [
+                    i for i in rows
+                    if metadatas is not None and metadatas[i].get(self.key, value) != value
+                ]
+                if moved:
+                    # Changing the key means moving rows between partitions.
+                    records = self._partitions[value].get(
+                        ids=[ids[i] for i in moved],
+                        include=["documents", "metadatas", "embeddings"],
+                    )
+                    for j, i in enumerate(moved):
+                        if embeddings is not None:
+                            records["embeddings"][j] = embeddings[i]
+                        if documents is not None:
+                            records["documents"][j] = documents[i]
+                    self.delete(ids=records["ids"])
+                    self.upsert(
+                        ids=records["ids"],
+                        embeddings=records["embeddings"],
+                        metadatas=[metadatas[i] for i in moved],
+                        documents=records["documents"],
+                    )
+
+                stay = [i for i in rows if i not in moved]
+                if stay:
+                    self._partitions[value].update(
+                        ids=[ids[i] for i in stay],
+                        embeddings=[embeddings[i] for i in stay] if embeddings is not None else None,
+                        metadatas=[metadatas[i] for i in stay] if metadatas is not None else None,
+                        documents=[documents[i] for i in stay] if documents is not None else None,
+                    )
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None) -> None:
+        with self._lock:
+            if ids is not None:
+                by_partition: Dict[Any, List[str]] = {}
+                for id_ in ids:
+                    if id_ in self._partition_of:
+                        by_partition.setdefault(self._partition_of[id_], []).append(id_)
+                for value, part_ids in by_partition.items():
+                    partition = self._partitions[value]
+                    partition.delete(ids=part_ids, where=where)
+                    for id_ in part_ids:
+                        if id_ not in partition._row_of:
+                            self._partition_of.pop(id_, None)
+                    if not partition.count():
+                        self._drop(value)
+                return
+
+            value, rest = self._route(where)
+            if value is not _ALL and rest is None:
+                self._drop(value)
+                return
+
+            values = list(self._partitions) if value is _ALL else [value]
+            for v in values:
+                partition = self._partitions.get(v)
+                if partition is None:
+                    continue
+                before = set(partition._ids)
+                partition.delete(where=rest)
+                for id_ in before - set(partition._ids):
+                    self._partition_of.pop(id_, None)
+                if not partition.count():
+                    self._drop(v)
+
+    # ---- reads ----
+    def count(self) -> int:
+        return len(self._partition_of)
+
+    def memory_bytes(self) -> int:
+        return sum(p.memory_bytes() for p in self._partitions.values())
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        include = include or ["documents", "metadatas"]
+
+        with self._lock:
+            if ids is not None:
+                wanted = {self._partition_of[i] for i in ids if i in self._partition_of}
+                targets = [self._partitions[v] for v in wanted]
+                value, rest = _ALL, where
+            else:
+                value, rest = self._route(where)
+                targets = self._targets(value)
+
+            parts = [t.get(ids=ids, where=rest, include=include) for t in targets]
+
+        result: Dict[str, Any] = {"ids": [i for p in parts for i in p["ids"]]}
+        for field in ("documents", "metadatas"):
+            result[field] = [x for p in parts for x in p[field]] if field in include else None
+        if "embeddings" in include:
+            matrices = [p["embeddings"] for p in parts if len(p["embeddings"])]
+            result["embeddings"] = np.concatenate(matrices) if matrices else np.zeros((0, 0), dtype=np.float32)
+        else:
+            result["embeddings"] = None
+
+        start = offset or 0
+        end = start + limit if limit is not None else None
+        if start or end is not None:
+            for field in ("ids", "documents", "metadatas", "embeddings"):
+                if result[field] is not None:
+                    result[field] = result[field][start:end]
+        return result
+
+    def query(
+        self,
+        query_embeddings,
+        n_results: int = 10,
+        where: Optional[Dict] = None,
+        include: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        include = include or ["documents", "metadatas", "distances"]
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+
+        out: Dict[str, Any] = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+
+        with self._lock:
+            value, rest = self._route(where)
+            targets = [t for t in self._targets(value) if t._ids]
+
+            # Pinned to one partition: that partition answers on its own.
+            if len(targets) == 1 or (value is not _ALL):
+                if not targets:
+                    return {
+                        "ids": [[] for _ in queries],
+                        **{k: ([[] for _ in queries] if k in include else None)
+                           for k in ("documents", "metadatas", "distances")},
+                    }
+                return targets[0].query(queries, n_results=n_results, where=rest, include=include)
+
+            for query in queries:
+                # Merge (distance, partition, row) candidates and only
+                # materialize the final top-k.
+                candidates = []
+                for partition in targets:
+                    rows = None
+                    if rest:
+                        rows = np.asarray(partition._select_rows(where=rest), dtype=np.int64)
+                        if not len(rows):
+                            continue
+                    found, dists = partition._search(query, rows, n_results)
+                    candidates.extend(zip(dists.tolist(), [partition] * len(found), found.tolist()))
+
+                top = heapq.nsmallest(n_results, candidates, key=lambda c: c[0])
+                out["ids"].append([p._ids[r] for _, p, r in top])
+                out["documents"].append([p._documents[r] for _, p, r in top])
+                out["metadatas"].append([dict(p._metadatas[r]) for _, p, r in top])
+                out["distances"].append([float(d) for d, _, _ in top])
+
+        for key in ("documents", "metadatas", "distances"):
+            if key not in include:
+                out[key] = None
+        return out
+
+
+# -------- CLIENT --------
+class LocalClient:
+    """
+    Stand-in for chromadb's client: hands out persisted LocalCollections.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        index_type: str = "flat",
+        partitions: Optional[Dict[str, str]] = None,
+        dtype: str = "float32",
+    ):
+        self.path = path
+        self.index_type = index_type
+        self.dtype = dtype
+        # collection name -> metadata key it is partitioned by
+        self.partitions = partitions or {}
+        self._collections: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def get_or_create_collection(self, name: str):
+        with self._lock:
+            if name not in self._collections:
+                path = os.path.join(self.path, name)
+                if name in self.partitions:
+                    self._collections[name] = PartitionedCollection(
+                        name=name,
+                        path=path,
+                        key=self.partitions[name],
+                        index_type=self.index_type,
+                        dtype=self.dtype,
+                    )
+                else:
+                    self._collections[name] = LocalCollection(
+                        name=name,
+                        path=path,
+                        index_type=self.index_type,
+                        dtype=self.dtype,
+                    )
+            return self._collections[name]
@@ -1,9 +1,22 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from ingest import ingest_files
-from rag import ask_question
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from jobs import ingest_queue, QueueFullError
+from rag import ask_question_async, stream_question
+from llm import gateway
+from llm_gateway import LLMUnavailableError
+from embeddings import warmup, engine_stats
+from reranker import reranker, RERANK_ENABLED, warmup as warmup_reranker
+from catalog import get_catalog
+from loaders import shutdown_pdf_pool
+from answer_cache import answer_cache
+from metrics import counter, histogram, register_stats, render, start_request_timing, server_timing
+import json
 import shutil
 import os
+import threading
+import time
 from typing import Optional
 
 app = FastAPI(title="Knowledge Vault API")
@@ -15,6 +28,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
 DOCS_DIR = "data/documents"
@@ -22,12 +36,89 @@ os.makedirs(DOCS_DIR, exist_ok=True)
 
 ALLOWED_EXTENSIONS = {".pdf", ".docx", ".xlsx", ".xls", ".csv"}
 
+REQUESTS = counter("kv_http_requests_total", "HTTP requests by route and status.", labels=("route", "status"))
+REQUEST_SECONDS = histogram("kv_http_request_seconds", "HTTP request latency by route.", labels=("route",))
+
+register_stats("embedding", engine_stats, exclude=("batch_size_histogram",))
+register_stats("answer_cache", answer_cache.stats)
+register_stats("rerank", reranker.stats)
+register_stats("llm", gateway.stats, exclude=("latency", "call_latency", "first_token_latency"))
+register_stats("ingest_queue", ingest_queue.stats)
+register_stats("catalog", lambda: {"documents": len(get_catalog())})
+
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    """
+    Count and time every request. With `X-Timing: 1` the response carries
+    a Server-Timing header with the request's stage breakdown.
+    """
+    timings = start_request_timing() if request.headers.get("x-timing") == "1" else None
+    started = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - started
+
+    route = request.scope.get("route")
+    path = getattr(route, "path", "unmatched")
+    REQUESTS.inc(route=path, status=response.status_code)
+    REQUEST_SECONDS.observe(elapsed, route=path)
+
+    if timings is not None:
+        response.headers["Server-Timing"] = server_timing(timings, total=elapsed)
+    return response
+
+
+# Set EMBEDDING_WARMUP=1 to load the embedding model right after startup
+# (in the background, so the server starts accepting requests immediately).
+EMBEDDING_WARMUP = os.getenv("EMBEDDING_WARMUP", "0").lower() in {"1", "true", "yes"}
+
+
+@app.on_event("startup")
+def warmup_embeddings():
+    if EMBEDDING_WARMUP:
+        threading.Thread(target=warmup, name="embedding-warmup", daemon=True).start()
+    # The first reranked question would otherwise pay the model load
+    # inside its RERANK_BUDGET_MS.
+    if RERANK_ENABLED:
+        threading.Thread(target=warmup_reranker, name="rerank-warmup", daemon=True).start()
+
+
+@app.on_event("startup")
+def load_catalog():
+    # Builds the catalog from the vector store once if there is none yet.
+    try:
+        get_catalog()
+    except Exception as e:
+        print(f"[ERROR] Failed to load document catalog: {e}")
+
+
+@app.on_event("shutdown")
+def stop_ingest_queue():
+    ingest_queue.shutdown()
+    shutdown_pdf_pool()
+
+
 @app.get("/")
 def root():
-    return {"status": "Knowledge Vault API running"}
+    return {
+        "status": "Knowledge Vault API running",
+        "embedding": engine_stats(),
+        "rerank": reranker.stats(),
+        "llm": gateway.stats(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
+
 
+def _save_upload(file: UploadFile, path: str) -> None:
+    with open(path, "wb") as f:
+        shutil.copyfileobj(file.file, f)
 
-@app.post("/upload")
+
+@app.post("/upload", status_code=202)
 async def upload(file: UploadFile = File(...)):
     # Basic validation
 
@@ -38,35 +129,72 @@ async def upload(file: UploadFile = File(...)):
     path = os.path.join(DOCS_DIR, file.filename)
 
     try:
-        with open(path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
+        await run_in_threadpool(_save_upload, file, path)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {e}")
 
-    ingest_files([path])
+    # Parsing, embedding and summarizing run in the background ingest queue;
+    # poll /jobs/{job_id} for progress.
+    try:
+        job = ingest_queue.submit(path)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
     return {
-        "status": "uploaded and indexed",
-        "filename": file.filename
+        "status": "queued",
+        "filename": file.filename,
+        "job_id": job.id,
     }
 
 
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = ingest_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return job.to_dict()
+
+
 @app.get("/ask")
-def ask(q: str):
+async def ask(q: str):
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+
+    try:
+        return await ask_question_async(q)
+    except LLMUnavailableError:
+        # Not "Not found": the answer may well be in the vault.
+        raise HTTPException(status_code=503, detail="Answer generation is temporarily unavailable")
+
+
+@app.get("/ask/stream")
+async def ask_stream(q: str):
+    """
+    Server-Sent Events version of /ask: `meta` (sources, confidence) as soon
+    as retrieval is done, then `token` events as Gemini generates, then
+    `done`. A `replace` event means the text so far was filtered for safety.
+    """
     if not q.strip():
         raise HTTPException(status_code=400, detail="Query cannot be empty")
 
-    return ask_question(q)
+    async def events():
+        try:
+            async for event, data in stream_question(q):
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        except LLMUnavailableError:
+            yield f"event: error\ndata: {json.dumps({'detail': 'Answer generation is temporarily unavailable'})}\n\n"
+        except Exception as e:
+            print(f"[ERROR] Streaming answer failed: {e}")
+            yield f"event: error\ndata: {json.dumps({'detail': 'Failed to generate answer'})}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.get("/files")
 def list_files():
-    if not os.path.exists(DOCS_DIR):
-        return []
-
-    return [
-        f for f in os.listdir(DOCS_DIR)
-        if os.path.isfile(os.path.join(DOCS_DIR, f))
-        and os.path.splitext(f)[1].lower() in ALLOWED_EXTENSIONS
-    ]
-
+    return get_catalog().file_names()
@@ -0,0 +1,297 @@
+"""
+Process-wide metrics: counters, histograms and timing spans, rendered in
+the Prometheus text format on /metrics.
+
+    with span("vector_search"):
+        ...
+
+records the duration in kv_stage_seconds{stage="vector_search"} and, when
+the current request asked for it (X-Timing: 1), in that request's timing
+breakdown, which main.py returns as a Server-Timing header. The stats()
+dicts of caches, batchers and the LLM gateway are exported as gauges.
+"""
+import math
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+# Seconds; upper bounds of the default histogram buckets.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+_PERCENTILE_WINDOW = 500
+
+LabelValues = Tuple[str, ...]
+
+
+def _label_text(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_label_text(self.labels, k)} {_number(v)}" for k, v in values]
+        return lines
+
+
+class _Series:
+    def __init__(self, buckets: Tuple[float, ...], window: int):
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.recent: Deque[float] = deque(maxlen=window)
+
+
+class Histogram:
+    """
+    Cumulative bucket counts for export, plus a window of recent samples
+    per label set for in-process percentiles.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+        window: int = _PERCENTILE_WINDOW,
+    ):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self.window = window
+        self._series: Dict[LabelValues, _Series] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def observe(self, seconds: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(self.buckets, self.window)
+            series.counts[bisect_left(self.buckets, seconds)] += 1
+            series.sum += seconds
+            series.recent.append(seconds)
+
+    def percentile(self, p: float, min_samples: int = 1, **labels) -> Optional[float]:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            if series is None or len(series.recent) < max(1, min_samples):
+                return None
+            ordered = sorted(series.recent)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    def snapshot(self, **labels) -> Dict[str, Any]:
+        """
+        Count, sum and recent p50/p95/p99 (ms) of one label set.
+        """
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            count = sum(series.counts) if series else 0
+            total = series.sum if series else 0.0
+
+        def ms(p: float) -> Optional[float]:
+            value = self.percentile(p, **labels)
+            return None if value is None else round(value * 1000, 1)
+
+        return {
+            "count": count,
+            "sum_seconds": round(total, 4),
+            "p50_ms": ms(0.5),
+            "p95_ms": ms(0.95),
+            "p99_ms": ms(0.99),
+        }
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = sorted((k, list(s.counts), s.sum) for k, s in self._series.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, counts, total in series:
+            running = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                running += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labels, key, le)} {running}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, key)} {running}")
+        return lines
+
+
+def _flatten(prefix: str, stats: Dict[str, Any], exclude: Iterable[str]) -> Iterable[Tuple[str, float]]:
+    for key, value in stats.items():
+        if key in exclude:
+            continue
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            yield from _flatten(name, value, exclude)
+        elif isinstance(value, bool):
+            yield name, int(value)
+        elif isinstance(value, (int, float)):
+            yield name, value
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._stats: List[Tuple[str, Callable[[], Dict[str, Any]], Tuple[str, ...]]] = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as {type(metric).__name__}")
+            return metric
+
+    def counter(self, name: str, help_text: str, labels: Iterable[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help_text, labels)
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labels: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, labels, buckets)
+
+    def register_stats(self, prefix: str, stats_fn: Callable[[], Dict[str, Any]], exclude: Iterable[str] = ()) -> None:
+        """
+        Export the numeric leaves of stats_fn() as kv_<prefix>_<key> gauges.
+        """
+        with self._lock:
+            self._stats = [s for s in self._stats if s[0] != prefix]
+            self._stats.append((prefix, stats_fn, tuple(exclude)))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            stats = list(self._stats)
+
+        lines: List[str] = []
+        for metric in metrics:
+            lines += metric.render()
+
+        for prefix, stats_fn, exclude in stats:
+            try:
+                values = list(_flatten(f"kv_{prefix}", stats_fn(), exclude))
+            except Exception as e:
+                print(f"[WARN] Collecting {prefix} stats failed: {e}")
+                continue
+            for name, value in values:
+                name = re.sub(r"[^a-zA-Z0-9_]", "_", name)
+                lines += [f"# TYPE {name} gauge", f"{name} {_number(value)}"]
+
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help_text: str, labels: Iterable[str] = ()) -> Counter:
+    return REGISTRY.counter(name, help_text, labels)
+
+
+def histogram(name: str, help_text: str, labels: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.histogram(name, help_text, labels, buckets)
+
+
+def register_stats(prefix: str, stats_fn: Callable[[], Dict[str, Any]], exclude: Iterable[str] = ()) -> None:
+    REGISTRY.register_stats(prefix, stats_fn, exclude)
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+# -------- SPANS --------
+STAGE_SECONDS = histogram(
+    "kv_stage_seconds",
+    "Time spent in one stage of answering a question.",
+    labels=("stage",),
+)
+
+# The current request's (stage, seconds) list, when it asked for timings.
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+
+def start_request_timing() -> List[Tuple[str, float]]:
+    """
+    Collect spans of the current request (and of work it hands to
+    threads with a copied context) into the returned list.
+    """
+    timings: List[Tuple[str, float]] = []
+    _request_timings.set(timings)
+    return timings
+
+
+def record_span(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def span(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(stage, time.perf_counter() - started)
+
+
+def server_timing(timings: List[Tuple[str, float]], total: Optional[float] = None) -> str:
+    """
+    Server-Timing header value; repeated stages are summed, in first-seen order.
+    """
+    merged: Dict[str, float] = {}
+    for stage, seconds in list(timings):
+        merged[stage] = merged.get(stage, 0.0) + seconds
+    parts = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in merged.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts)
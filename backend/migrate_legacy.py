@@ -0,0 +1,299 @@
+"""
+Migrate the legacy FAISS index (data/faiss_index/meta.pkl) into the
+current vector store.
+
+    cd backend
+    python migrate_legacy.py                       # migrate, then summarize
+    python migrate_legacy.py --skip-summaries      # chunks only
+    python migrate_legacy.py --restart             # ignore the checkpoint
+
+meta.pkl holds a list of {"text", "source", "embedding"} records. They are
+written in batches under content-hash chunk IDs with their stored
+embeddings, so nothing is re-embedded; "source" paths become the
+file_name metadata retrieval filters on. Progress is checkpointed after
+every batch and an interrupted run continues where it stopped. Only run
+this on a meta.pkl you trust: unpickling executes code.
+"""
+import argparse
+import json
+import os
+import pickle
+import sys
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from vector_store import VectorStore
+from summaries import DocumentSummaryStore
+from lexical_index import get_lexical_index
+from catalog import get_catalog
+from embeddings import embed_texts
+from utils import chunk_id_for, doc_id_for, file_sha256, text_sha256, mark_vault_changed
+
+load_dotenv()
+
+LEGACY_META_PATH = "data/faiss_index/meta.pkl"
+DOCS_DIR = "data/documents"
+
+# Cosine similarity a stored vector must have with a fresh embedding of
+# its text for the legacy index to count as the same embedding model.
+MODEL_CHECK_SIMILARITY = 0.99
+
+LEGACY_CHUNKER = "legacy"
+
+
+# -------- READING --------
+def iter_legacy_records(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Records from meta.pkl in order. Handles one pickled list (the legacy
+    format) as well as several pickles appended to one file. Records are
+    released from the list once yielded.
+    """
+    with open(path, "rb") as f:
+        while True:
+            try:
+                obj = pickle.load(f)
+            except EOFError:
+                return
+
+            if isinstance(obj, dict):
+                yield obj
+                continue
+
+            for i in range(len(obj)):
+                record, obj[i] = obj[i], None
+                yield record
+
+
+def source_to_file_name(source: str) -> str:
+    return os.path.basename(source.replace("\\", "/"))
+
+
+# -------- CHECKPOINT --------
+def _checkpoint_path(meta_path: str) -> str:
+    return os.path.join(os.path.dirname(meta_path) or ".", "migration_checkpoint.json")
+
+
+def _source_stamp(meta_path: str) -> Dict[str, Any]:
+    stat = os.stat(meta_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def load_checkpoint(meta_path: str) -> Optional[Dict[str, Any]]:
+    path = _checkpoint_path(meta_path)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    if state.get("source") != _source_stamp(meta_path):
+        print("[WARN] meta.pkl changed since the last run; starting over")
+        return None
+    return state
+
+
+def save_checkpoint(meta_path: str, state: Dict[str, Any]) -> None:
+    path = _checkpoint_path(meta_path)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+
+# -------- MIGRATION --------
+def _document_ids(file_name: str) -> Tuple[str, str]:
+    """
+    (doc_id, file_hash): keyed by the original file's hash when it is
+    still in DOCS_DIR, otherwise a stable ID derived from the name.
+    """
+    original = os.path.join(DOCS_DIR, file_name)
+    if os.path.isfile(original):
+        file_hash = file_sha256(original)
+        return doc_id_for(file_name, file_hash), file_hash
+
+    doc_id = text_sha256(f"legacy\x00{file_name}")
+    return doc_id, doc_id
+
+
+def check_embedding_model(record: Dict[str, Any]) -> float:
+    """
+    Cosine similarity between a stored legacy vector and the current
+    model's embedding of the same text.
+    """
+    stored = np.asarray(record["embedding"], dtype=np.float32)
+    fresh = embed_texts([record["text"]])[0]
+    if stored.shape != fresh.shape:
+        return 0.0
+    return float(stored @ fresh / (np.linalg.norm(stored) * np.linalg.norm(fresh) or 1.0))
+
+
+def _migrated_ids(store: VectorStore, file_name: str, entry: Dict[str, Any]) -> set:
+    """
+    Chunk IDs of a file already counted by the checkpoint, read back from
+    the store after a resume. Chunks stored by a batch whose checkpoint
+    was never written have a higher chunk_id and are migrated again.
+    """
+    return {
+        chunk["id"]
+        for chunk in store.get(file_name=file_name, include=["metadatas"])
+        if chunk.get("doc_id") == entry["doc_id"] and chunk.get("chunk_id", 0) < entry["chunks"]
+    }
+
+
+def migrate(
+    meta_path: str = LEGACY_META_PATH,
+    batch_size: int = 256,
+    skip_summaries: bool = False,
+    restart: bool = False,
+    force: bool = False,
+) -> Dict[str, Any]:
+    state = None if restart else load_checkpoint(meta_path)
+    if state is None:
+        state = {"source": _source_stamp(meta_path), "records_done": 0, "files": {}, "summarized": []}
+    elif state["records_done"]:
+        print(f"[INFO] Resuming after {state['records_done']} records")
+
+    store = VectorStore()
+    lexical = get_lexical_index()
+    files: Dict[str, Dict[str, Any]] = state["files"]
+    seen: Dict[str, set] = {}
+
+    batch: List[Tuple[str, str, np.ndarray, Dict[str, Any]]] = []
+    consumed = state["records_done"]
+    checked = force
+
+    def flush() -> None:
+        if batch:
+            ids = [b[0] for b in batch]
+            texts = [b[1] for b in batch]
+            metadatas = [b[3] for b in batch]
+
+            store.upsert(
+                ids=ids,
+                embeddings=np.stack([b[2] for b in batch]),
+                documents=texts,
+                metadatas=metadatas,
+            )
+            lexical.add(ids=ids, texts=texts, metadatas=metadatas)
+            batch.clear()
+
+        state["records_done"] = consumed
+        save_checkpoint(meta_path, state)
+        print(f"[INFO] Migrated {consumed} records")
+
+    for position, record in enumerate(iter_legacy_records(meta_path)):
+        if position < state["records_done"]:
+            continue
+        consumed = position + 1
+
+        text = (record.get("text") or "").replace("\x00", "")
+        if not text.strip() or record.get("embedding") is None:
+            continue
+
+        if not checked:
+            similarity = check_embedding_model(record)
+            if similarity < MODEL_CHECK_SIMILARITY:
+                raise SystemExit(
+                    f"[ERROR] Stored embeddings don't match the current embedding model "
+                    f"(cosine {similarity:.3f}); rerun with --force to migrate anyway"
+                )
+            checked = True
+
+        file_name = source_to_file_name(record.get("source") or "unknown")
+        entry = files.get(file_name)
+        if entry is None:
+            doc_id, file_hash = _document_ids(file_name)
+            entry = files[file_name] = {"doc_id": doc_id, "file_hash": file_hash, "chunks": 0}
+        if file_name not in seen:
+            seen[file_name] = _migrated_ids(store, file_name, entry) if entry["chunks"] else set()
+
+        # Identical chunks within a file collapse onto one ID, as in ingest.
+        cid = chunk_id_for(file_name, text)
+        if cid in seen[file_name]:
+            continue
+        seen[file_name].add(cid)
+
+        batch.append((
+            cid,
+            text,
+            np.asarray(record["embedding"], dtype=np.float32),
+            {
+                "doc_id": entry["doc_id"],
+                "file_name": file_name,
+                "source": file_name,
+                "chunk_id": entry["chunks"],
+                "file_hash": entry["file_hash"],
+                "chunker": LEGACY_CHUNKER,
+            },
+        ))
+        entry["chunks"] += 1
+
+        if len(batch) >= batch_size:
+            flush()
+
+    flush()
+
+    # -------- CATALOG + SUMMARIES --------
+    catalog = get_catalog()
+    summary_store = None if skip_summaries else DocumentSummaryStore()
+
+    for file_name, entry in files.items():
+        summary_id = None
+        if summary_store is not None:
+            if file_name in state["summarized"]:
+                summary_id = entry["doc_id"]
+            else:
+                chunks = sorted(
+                    store.get(file_name=file_name),
+                    key=lambda c: c.get("chunk_id", 0),
+                )
+                full_text = "\n".join(c["text"] or "" for c in chunks)
+                print(f"[INFO] Summarizing {file_name}")
+                summary_id = summary_store.add_summary(
+                    doc_id=entry["doc_id"],
+                    file_name=file_name,
+                    full_text=full_text,
+                )
+                if summary_id is not None:
+                    state["summarized"].append(file_name)
+                    save_checkpoint(meta_path, state)
+
+        catalog.upsert(
+            file_name=file_name,
+            doc_id=entry["doc_id"],
+            file_hash=entry["file_hash"],
+            chunk_count=entry["chunks"],
+            summary_id=summary_id,
+            chunker=LEGACY_CHUNKER,
+        )
+
+    mark_vault_changed()
+    print(f"[INFO] Migration complete: {consumed} records, {len(files)} files")
+    return state
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Migrate the legacy FAISS meta.pkl into the vector store.")
+    parser.add_argument("--meta", default=LEGACY_META_PATH, help="path to meta.pkl")
+    parser.add_argument("--batch-size", type=int, default=256, help="records written per batch")
+    parser.add_argument("--skip-summaries", action="store_true", help="don't generate document summaries")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    parser.add_argument("--force", action="store_true", help="skip the embedding-model check")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.meta):
+        print(f"[ERROR] Legacy metadata not found: {args.meta}")
+        sys.exit(1)
+
+    migrate(
+        meta_path=args.meta,
+        batch_size=args.batch_size,
+        skip_summaries=args.skip_summaries,
+        restart=args.restart,
+        force=args.force,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,50 @@
 import os
-from typing import Optional, Dict, Any, List
-from sentence_transformers import SentenceTransformer
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, AsyncIterator, Tuple
 from vector_store import VectorStore
-from llm import generate_answer
+from llm import generate_answer, generate_answer_async, stream_answer_async
 from summaries import DocumentSummaryStore
-
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+from embeddings import embed_query
+from lexical_index import get_lexical_index
+from answer_cache import answer_cache, ANSWER_CACHE_ENABLED
+from catalog import get_catalog
+from file_matcher import FileMatcher, get_file_matcher
+from context_packer import pack_context
+from metrics import span, counter, histogram
+from reranker import reranker, relevance, RERANK_ENABLED, RERANK_CANDIDATES
 
 SIMILARITY_THRESHOLD = 1.2
 
+# Minimum BM25 score for a lexical hit to be considered at all, the
+# constant of reciprocal rank fusion, and the confidence reported when
+# only lexical hits were found (they carry no embedding distance).
+LEXICAL_MIN_SCORE = float(os.getenv("LEXICAL_MIN_SCORE", "1.0"))
+RRF_K = 60
+LEXICAL_ONLY_CONFIDENCE = 0.5
+
+# Retrieval (vector store calls, waiting on embeddings) for async callers.
+# Generation doesn't need a thread: it awaits the async Gemini client.
+RETRIEVAL_THREADS = int(os.getenv("RETRIEVAL_THREADS", "32"))
+_retrieval_executor = ThreadPoolExecutor(
+    max_workers=RETRIEVAL_THREADS,
+    thread_name_prefix="retrieval",
+)
+
 summary_store = DocumentSummaryStore()
 
+QUESTIONS = counter(
+    "kv_questions_total",
+    "Questions answered, by intent and by what produced the answer (cache, direct, llm).",
+    labels=("intent", "source"),
+)
+CONTEXT_TOKENS = histogram(
+    "kv_context_tokens",
+    "Context tokens sent to the LLM per question.",
+    buckets=(100, 250, 500, 1000, 1500, 2000, 3000, 4000, 8000),
+)
+
 BAD_WORDS = [
     "kill", "suicide","terrorist", "bomb", "weapon", "hack"
 ]
@@ -25,19 +59,13 @@ def clean_output(answer: str) -> str:
             return "The generated response was filtered for safety."
     return answer
 
-def extract_file_reference(question: str, available_files: list[str]) -> str | None:
-    q = question.lower()
-    print("DEBUG available_files:", available_files)
-    print("DEBUG question_lower:", q)
-
-    for file in available_files:
-        file_lower = file.lower()
-        stem = os.path.splitext(file_lower)[0]  # employee_data
-
-        if stem in q or file_lower in q:
-            return file
-
-    return None
+def extract_file_reference(question: str, available_files: Optional[list[str]] = None) -> str | None:
+    """
+    The catalogued file a question names, by longest word-bounded match
+    on file names and stems (None if none or ambiguous).
+    """
+    matcher = FileMatcher(available_files) if available_files is not None else get_file_matcher()
+    return matcher.match(question)
 
 
 def detect_intent(question: str) -> str:
@@ -57,6 +85,24 @@ def detect_intent(question: str) -> str:
 
     return "FACTUAL"
 
+def reciprocal_rank_fusion(rankings: List[List[Dict[str, Any]]], k: int = 5) -> List[Dict[str, Any]]:
+    """
+    Merge ranked hit lists by summing 1 / (RRF_K + rank) per chunk ID.
+    Fields of a chunk found by several retrievers are merged.
+    """
+    scores: Dict[str, float] = {}
+    merged: Dict[str, Dict[str, Any]] = {}
+
+    for hits in rankings:
+        for rank, hit in enumerate(hits, start=1):
+            key = hit.get("id") or hit["text"]
+            scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank)
+            merged[key] = {**hit, **merged.get(key, {})}
+
+    ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [merged[key] for key in ranked]
+
+
 def expand_query(question: str, summaries: list[str]) -> str:
     """
     Expand vague queries using document summaries instead of hardcoded keywords.
@@ -65,10 +111,17 @@ def expand_query(question: str, summaries: list[str]) -> str:
     return f"{question}. Context: {context_hint}"
 
 
-def ask_question(question: str):
+def _reply(answer: str, confidence: float = 0.0, sources: Optional[List[str]] = None):
+    return {"answer": answer, "sources": sources or [], "confidence": confidence}
+
+
+def _prepare_question(question: str) -> Dict[str, Any]:
     """
-    Central RAG controller.
-    Handles intent detection, routing, retrieval, and guardrails.
+    Everything up to (not including) LLM generation: guardrails, answer
+    cache, intent routing and retrieval.
+
+    The returned plan has a final `response` when no generation is needed,
+    otherwise the `prompt` to send plus its sources and confidence.
     """
 
     # -------- Normalize question --------
@@ -76,53 +129,224 @@ def ask_question(question: str):
     question = question.strip()
     question_lower = question.lower()
 
-    store = VectorStore()
-    print("DEBUG: Collection count =", store.collection.count())
-
     if contains_bad_words(question):
-        return {
-            "answer": "This question violates content guidelines.",
-            "sources": [],
-            "confidence": 0.0,
-        }
+        return {"response": _reply("This question violates content guidelines.")}
 
     if len(question.strip()) < 3:
-        return {
-            "answer": "Please ask a more meaningful question.",
-            "sources": [],
-            "confidence": 0.0,
-        }
-    
+        return {"response": _reply("Please ask a more meaningful question.")}
+
+    if ANSWER_CACHE_ENABLED:
+        with span("answer_cache"):
+            cached = answer_cache.get(question)
+        if cached is not None:
+            QUESTIONS.inc(intent="unknown", source="cache")
+            return {"response": cached}
+
     # -------- 1️⃣ Intent Detection --------
-    intent = detect_intent(question_lower)
+    with span("intent"):
+        intent = detect_intent(question_lower)
+
+    query_embedding = None
+    if ANSWER_CACHE_ENABLED and intent != "META":
+        query_embedding = embed_query(question_lower)
+        with span("answer_cache"):
+            cached = answer_cache.get_similar(question, query_embedding, intent)
+        if cached is not None:
+            QUESTIONS.inc(intent=intent, source="cache")
+            return {"response": cached}
+
+    with span("retrieval"):
+        plan = _plan_for_intent(question, original_question, intent, query_embedding)
+    cache_info = {
+        "question": question,
+        "intent": intent,
+        "query_embedding": query_embedding,
+    }
+
+    if "prompt" not in plan:
+        QUESTIONS.inc(intent=intent, source="direct")
+        _cache_response(cache_info, plan)
+        return {"response": plan}
+
+    QUESTIONS.inc(intent=intent, source="llm")
+    if plan.get("context_tokens") is not None:
+        CONTEXT_TOKENS.observe(plan["context_tokens"])
 
-    # -------- 2️⃣ Route based on intent --------
+    return {
+        "response": None,
+        "prompt": plan["prompt"],
+        "sources": plan["sources"],
+        "confidence": plan["confidence"],
+        "filter_output": plan.get("filter_output", False),
+        "context_tokens": plan.get("context_tokens"),
+        "cache_info": cache_info,
+    }
+
+
+def _cache_response(cache_info: Dict[str, Any], response: Dict[str, Any]) -> None:
+    # Empty results and the LLM fallback may come from a transient
+    # failure; don't pin them.
+    if (
+        ANSWER_CACHE_ENABLED
+        and response.get("confidence", 0.0) > 0
+        and response.get("answer") != "Not found in Knowledge Vault."
+    ):
+        answer_cache.put(
+            cache_info["question"],
+            response,
+            cache_info["intent"],
+            cache_info["query_embedding"],
+        )
 
-    # 🔹 SUMMARY / OVERVIEW QUESTIONS
-    if intent == "SUMMARY":
-        print("DEBUG: SUMMARY intent entered")
 
-        query_embedding = embedding_model.encode(question_lower).tolist()
+def _finish(plan: Dict[str, Any], answer: str) -> Dict[str, Any]:
+    if plan["filter_output"]:
+        answer = clean_output(answer)
 
-        # Get list of available files from metadata
-        summary_metas = summary_store.store.collection.get(include=["metadatas"])["metadatas"]
+    response = _reply(answer, plan["confidence"], plan["sources"])
+    _cache_response(plan["cache_info"], response)
+    return response
 
-        available_files = list(
-            {
-                os.path.basename(meta["file_name"])
-                for meta in summary_metas
-                if "file_name" in meta
-            }
-        )
 
-        # Detect if user asked for a specific file
-        target_file = extract_file_reference(question_lower, available_files)
+def ask_question(question: str):
+    """
+    Central RAG controller.
+    Handles intent detection, routing, retrieval, and guardrails.
+    Answers are served from the answer cache when the same (or a nearly
+    identical) question was answered against the current vault.
+    """
+    plan = _prepare_question(question)
+    if plan["response"] is not None:
+        return plan["response"]
+
+    with span("llm"):
+        answer = generate_answer(plan["prompt"])
+    return _finish(plan, answer)
+
+
+async def _prepare_question_async(question: str) -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    # Carry the request's context (its timing spans) onto the thread.
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_retrieval_executor, context.run, _prepare_question, question)
+
+
+async def ask_question_async(question: str):
+    """
+    ask_question for the async request path: retrieval runs on the
+    retrieval executor, generation awaits Gemini without holding a thread.
+    """
+    plan = await _prepare_question_async(question)
+    if plan["response"] is not None:
+        return plan["response"]
+
+    with span("llm"):
+        answer = await generate_answer_async(plan["prompt"])
+    return _finish(plan, answer)
+
+
+class StreamingSafetyFilter:
+    """
+    Incremental clean_output: holds back just enough trailing text that a
+    blocked word split across two chunks is still caught before any of it
+    is released.
+    """
+
+    def __init__(self):
+        self.holdback = max(len(w) for w in BAD_WORDS) - 1
+        self.buffer = ""
+        self.tripped = False
+
+    def feed(self, piece: str) -> str:
+        self.buffer += piece
+        lowered = self.buffer.lower()
+        if any(bad in lowered for bad in BAD_WORDS):
+            self.tripped = True
+            self.buffer = ""
+            return ""
+
+        if len(self.buffer) <= self.holdback:
+            return ""
+        released = self.buffer[:-self.holdback]
+        self.buffer = self.buffer[-self.holdback:]
+        return released
+
+    def flush(self) -> str:
+        released, self.buffer = self.buffer, ""
+        return released
+
+
+async def stream_question(question: str) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Streaming variant of ask_question. Yields (event, data) pairs:
+    `meta` (sources, confidence) as soon as retrieval is done, `token`
+    for each piece of the answer, `replace` if the safety filter trips,
+    and a final `done` carrying the complete answer.
+    """
+    plan = await _prepare_question_async(question)
+
+    if plan["response"] is not None:
+        response = plan["response"]
+        yield "meta", {"sources": response["sources"], "confidence": response["confidence"]}
+        yield "token", {"text": response["answer"]}
+        yield "done", {"answer": response["answer"]}
+        return
+
+    yield "meta", {"sources": plan["sources"], "confidence": plan["confidence"]}
+
+    safety = StreamingSafetyFilter() if plan["filter_output"] else None
+    parts: List[str] = []
+
+    with span("llm"):
+        async for piece in stream_answer_async(plan["prompt"]):
+            parts.append(piece)
+            if safety is None:
+                yield "token", {"text": piece}
+                continue
+
+            released = safety.feed(piece)
+            if safety.tripped:
+                break
+            if released:
+                yield "token", {"text": released}
+
+    if safety is not None and not safety.tripped:
+        tail = safety.flush()
+        if tail:
+            yield "token", {"text": tail}
+
+    response = _finish(plan, "".join(parts).strip())
+    if safety is not None and safety.tripped:
+        yield "replace", {"text": response["answer"]}
+
+    yield "done", {"answer": response["answer"]}
+
+
+def _plan_for_intent(question: str, original_question: str, intent: str, query_embedding=None):
+    """
+    Route a validated question to the retrieval strategy for its intent.
+
+    `query_embedding` is the embedding of the lowercased question if the
+    caller already has it; it is computed once here otherwise.
+
+    Returns either a final response (no LLM needed) or a plan holding the
+    grounded `prompt` plus the sources and confidence of its context.
+    """
+    question_lower = question.lower()
+
+    if query_embedding is None and intent != "META":
+        query_embedding = embed_query(question_lower)
+
+    # -------- 2️⃣ Route based on intent --------
+
+    # 🔹 SUMMARY / OVERVIEW QUESTIONS
+    if intent == "SUMMARY":
+        # Detect if user asked for a specific (catalogued) file
+        target_file = extract_file_reference(question_lower)
 
         # 🔹 FILE-SPECIFIC SUMMARY
         if target_file:
             summaries = summary_store.search_by_file(file_name=target_file)
-            
-            print("DEBUG summaries returned:", [s["file_name"] for s in summaries])
 
             if not summaries:
                 return {
@@ -131,7 +355,7 @@ def ask_question(question: str):
                     "confidence": 0.0,
                 }
 
-            context = f"[{summaries[0]['file_name']}]\n{summaries[0]['text']}"
+            context, packed = pack_context(summaries[:1], label_separator="\n")
 
             prompt = f"""
     Provide a concise summary of the document using ONLY the context below.
@@ -142,18 +366,15 @@ def ask_question(question: str):
     Answer:
     """.strip()
 
-            answer = generate_answer(prompt)
-
             return {
-                "answer": answer,
+                "prompt": prompt,
                 "sources": [target_file],
                 "confidence": 0.95,
+                "context_tokens": packed["tokens"],
             }
 
         # 🔹 GLOBAL SUMMARY (ALL FILES)
         else:
-            print("DEBUG: GLOBAL SUMMARY EXECUTED")
-
             summaries = summary_store.search(query_embedding, k=10)
 
             if not summaries:
@@ -163,10 +384,7 @@ def ask_question(question: str):
                     "confidence": 0.0,
                 }
 
-            context = "\n\n".join(
-                f"[{s['file_name']}]\n{s['text']}"
-                for s in summaries
-            )
+            context, packed = pack_context(summaries, label_separator="\n")
 
             prompt = f"""
         You are a Knowledge Vault assistant.
@@ -180,21 +398,17 @@ def ask_question(question: str):
         Answer:
         """.strip()
 
-            answer = generate_answer(prompt)
-            sources = list(set(s["file_name"] for s in summaries))
-
             return {
-                "answer": answer,
-                "sources": sources,
+                "prompt": prompt,
+                "sources": packed["sources"],
                 "confidence": 0.9,
+                "context_tokens": packed["tokens"],
             }
 
 
     # 🔹 META QUESTIONS (LIST DOCUMENTS)
     if intent == "META":
-        files = set()
-        for meta in store.collection.get(include=["metadatas"])["metadatas"]:
-            files.add(meta.get("file_name"))
+        files = get_catalog().file_names()
 
         if not files:
             return {
@@ -204,20 +418,18 @@ def ask_question(question: str):
             }
 
         answer = "The Knowledge Vault contains the following documents:\n" + "\n".join(
-            f"- {f}" for f in sorted(files)
+            f"- {f}" for f in files
         )
 
         return {
             "answer": answer,
-            "sources": list(files),
+            "sources": files,
             "confidence": 1.0,
         }
 
 
     # 🔹 COMPARISON QUESTIONS (SUMMARY-FIRST ROUTING)
     if intent == "COMPARISON":
-        query_embedding = embedding_model.encode(question_lower).tolist()
-
         summaries = summary_store.search(
             query_embedding=query_embedding,
             k=5
@@ -230,10 +442,7 @@ def ask_question(question: str):
                 "confidence": 0.0,
             }
 
-        context = "\n\n".join(
-            f"[{s['file_name']}]\n{s['text']}"
-            for s in summaries
-        )
+        context, packed = pack_context(summaries, label_separator="\n")
 
         prompt = f"""
     Compare the concepts using ONLY the context below.
@@ -248,33 +457,67 @@ def ask_question(question: str):
     Answer:
     """.strip()
 
-        answer = generate_answer(prompt)
-        sources = list(set(s["file_name"] for s in summaries))
-
         return {
-            "answer": answer,
-            "sources": sources,
+            "prompt": prompt,
+            "sources": packed["sources"],
             "confidence": 0.85,
+            "context_tokens": packed["tokens"],
         }
 
+    # Lexical matching and reranking use the question as asked, before
+    # any expansion.
+    lexical_query = question
+
     # 🔹 VAGUE QUESTIONS (AUTO QUERY EXPANSION)
     if intent == "VAGUE":
         summary_hits = summary_store.search(
-        query_embedding=embedding_model.encode(question_lower).tolist(),
+        query_embedding=query_embedding,
         k=3
         )
         if summary_hits:
             summaries_text = [s["text"] for s in summary_hits]
             question = expand_query(question, summaries_text)
+            # Only an expanded question needs a new embedding.
+            query_embedding = embed_query(question)
 
     # -------- 3️⃣ FACTUAL / DEFAULT RAG --------
-    query_embedding = embedding_model.encode(question).tolist()
 
-    results = store.search(
-        query_embedding=query_embedding,
-        k=5,
-        similarity_threshold=SIMILARITY_THRESHOLD,
-    )
+    # A question naming a file is answered from that file only.
+    target_file = extract_file_reference(lexical_query)
+
+    # With reranking on, retrieval over-fetches and the cross-encoder
+    # picks the chunks that reach the prompt.
+    fetch_k = RERANK_CANDIDATES if RERANK_ENABLED else 5
+
+    # Only chunk retrieval needs the chunk collection.
+    store = VectorStore()
+
+    def retrieve(file_name: Optional[str]) -> List[Dict[str, Any]]:
+        vector_hits = store.search(
+            query_embedding=query_embedding,
+            k=fetch_k,
+            file_name=file_name,
+            similarity_threshold=SIMILARITY_THRESHOLD,
+        )
+
+        # Exact identifiers and codes are found lexically even when their
+        # embedding distance falls outside SIMILARITY_THRESHOLD.
+        with span("lexical_search"):
+            lexical_hits = [
+                hit for hit in get_lexical_index().search(lexical_query, k=fetch_k, file_name=file_name)
+                if hit["score"] >= LEXICAL_MIN_SCORE
+            ]
+
+        return reciprocal_rank_fusion([vector_hits, lexical_hits], k=fetch_k)
+
+    results = retrieve(target_file)
+    if target_file and not results:
+        # The name may have been mentioned in passing.
+        results = retrieve(None)
+
+    if RERANK_ENABLED and results:
+        with span("rerank"):
+            results, _ = reranker.rerank(lexical_query, results)
 
     # -------- Guardrail --------
     if not results:
@@ -285,10 +528,9 @@ def ask_question(question: str):
         }
 
     # -------- Context Construction --------
-    context = "\n\n".join(
-        f"[{r['file_name']}] {r['text']}"
-        for r in results
-    )
+    # Overlapping neighbours are stitched together and near-duplicates
+    # dropped, most relevant first, within the token budget.
+    context, packed = pack_context(results)
 
     prompt = f"""
 Answer ONLY using the context below.
@@ -303,17 +545,20 @@ Question:
 Answer:
 """.strip()
 
-    answer = generate_answer(prompt)
-
-    sources = list(set(r["file_name"] for r in results))
-    confidence = round(
-        max(0.0, 1 - sum(r["distance"] for r in results) / len(results)),
-        2
-    )
+    sources = packed["sources"]
+    distances = [r["distance"] for r in results if "distance" in r]
+    rerank_scores = [r["rerank_score"] for r in results if "rerank_score" in r]
+    if rerank_scores:
+        confidence = round(sum(relevance(s) for s in rerank_scores) / len(rerank_scores), 2)
+    elif distances:
+        confidence = round(max(0.0, 1 - sum(distances) / len(distances)), 2)
+    else:
+        confidence = LEXICAL_ONLY_CONFIDENCE
 
-    answer = clean_output(answer)
     return {
-        "answer": answer,
+        "prompt": prompt,
         "sources": sources,
         "confidence": confidence,
+        "filter_output": True,
+        "context_tokens": packed["tokens"],
     }
\ No newline at end of file
@@ -0,0 +1,252 @@
+"""
+Optional cross-encoder reranking of retrieved chunks.
+
+Retrieval over-fetches candidates; the cross-encoder scores every
+(question, chunk) pair in one batched CPU pass and only the best chunks
+reach the prompt. Scores are cached per (question, chunk). A latency
+budget bounds the stage: when scoring doesn't finish in time the
+retrieval order is kept. Scoring stops at the deadline (batches done by
+then still land in the cache), and while the scoring thread is backed
+up new requests skip reranking instead of queueing behind stale work.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import List, Dict, Any, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from utils import text_sha256
+
+load_dotenv()
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "0").lower() in {"1", "true", "yes"}
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Candidates fetched for reranking, and chunks kept for the prompt.
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "4"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "300"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+
+# Scoring is CPU-bound; one dedicated thread keeps it off request threads
+# and from competing with itself.
+_rerank_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+# Scoring jobs queued or running before new requests skip reranking.
+_MAX_PENDING = 4
+
+_model = None
+_model_lock = threading.Lock()
+
+_LATENCY_WINDOW = 1000
+
+
+def get_model():
+    """
+    Return the process-wide CrossEncoder, loading it on first use.
+    """
+    global _model
+
+    if _model is not None:
+        return _model
+
+    with _model_lock:
+        if _model is None:
+            from sentence_transformers import CrossEncoder
+
+            start = time.perf_counter()
+            _model = CrossEncoder(RERANK_MODEL, device="cpu")
+            print(f"[INFO] Loaded rerank model {RERANK_MODEL} in {time.perf_counter() - start:.2f}s")
+
+    return _model
+
+
+def relevance(score: float) -> float:
+    """
+    Cross-encoder logit as a 0..1 relevance.
+    """
+    return 1.0 / (1.0 + math.exp(-score))
+
+
+class Reranker:
+    def __init__(
+        self,
+        top_k: int = RERANK_TOP_K,
+        batch_size: int = RERANK_BATCH_SIZE,
+        budget_ms: float = RERANK_BUDGET_MS,
+        cache_size: int = RERANK_CACHE_SIZE,
+    ):
+        self.top_k = top_k
+        self.batch_size = max(1, batch_size)
+        self.budget_ms = budget_ms
+        self.cache_size = cache_size
+
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.pairs_scored = 0
+        self.cache_hits = 0
+        self.over_budget = 0
+        self.skipped = 0
+        self._pending = 0
+        self._latencies: List[float] = []
+
+    # ---- cache ----
+    def _key(self, question: str, hit: Dict[str, Any]) -> Tuple[str, str]:
+        chunk = hit.get("id") or text_sha256(hit.get("text") or "")
+        return text_sha256(" ".join(question.lower().split())), chunk
+
+    def _cached(self, keys: List[Tuple[str, str]]) -> Dict[Tuple[str, str], float]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    found[key] = self._cache[key]
+        return found
+
+    def _store(self, scores: Dict[Tuple[str, str], float]) -> None:
+        with self._lock:
+            for key, score in scores.items():
+                self._cache[key] = score
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    # ---- scoring ----
+    def _score(
+        self,
+        question: str,
+        pairs: List[Tuple[Tuple[str, str], str]],
+        deadline: float,
+    ) -> Dict[Tuple[str, str], float]:
+        """
+        Score pairs batch by batch until done or `deadline` (perf_counter)
+        passes; the caller has stopped waiting by then.
+        """
+        try:
+            return self._score_batches(question, pairs, deadline)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _score_batches(
+        self,
+        question: str,
+        pairs: List[Tuple[Tuple[str, str], str]],
+        deadline: float,
+    ) -> Dict[Tuple[str, str], float]:
+        scores = {}
+        if time.perf_counter() >= deadline:
+            return scores
+
+        model = get_model()
+        for start in range(0, len(pairs), self.batch_size):
+            if time.perf_counter() >= deadline:
+                break
+            batch = pairs[start:start + self.batch_size]
+            predicted = model.predict(
+                [(question, text) for _, text in batch],
+                batch_size=self.batch_size,
+                show_progress_bar=False,
+            )
+            for (key, _), score in zip(batch, predicted):
+                scores[key] = float(score)
+
+        self._store(scores)
+        with self._lock:
+            self.pairs_scored += len(scores)
+        return scores
+
+    def rerank(self, question: str, hits: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Reorder `hits` by cross-encoder score and keep the best top_k.
+        Each kept hit gets "rerank_score". Returns (hits, timing info);
+        on budget overrun, or with the scoring thread backed up, the first
+        top_k hits are returned unscored.
+        """
+        started = time.perf_counter()
+        info: Dict[str, Any] = {"candidates": len(hits), "reranked": False}
+        if not hits:
+            return hits, info
+
+        keys = [self._key(question, hit) for hit in hits]
+        scores = self._cached(keys)
+        misses = [(key, hit.get("text") or "") for key, hit in zip(keys, hits) if key not in scores]
+        info["cache_hits"] = len(hits) - len(misses)
+
+        with self._lock:
+            backed_up = bool(misses) and self._pending >= _MAX_PENDING
+            if backed_up:
+                self.skipped += 1
+            elif misses:
+                self._pending += 1
+
+        if backed_up:
+            info["skipped"] = True
+        elif misses:
+            deadline = started + self.budget_ms / 1000.0
+            future = _rerank_executor.submit(self._score, question, misses, deadline)
+            try:
+                scores.update(future.result(timeout=self.budget_ms / 1000.0))
+            except FutureTimeout:
+                # Keep retrieval order; the scores are cached when they land.
+                with self._lock:
+                    self.over_budget += 1
+                info["over_budget"] = True
+            except Exception as e:
+                print(f"[ERROR] Reranking failed: {e}")
+                info["error"] = str(e)
+
+        reranked = len(scores) == len(hits)
+        if reranked:
+            order = sorted(range(len(hits)), key=lambda i: scores[keys[i]], reverse=True)
+            kept = [{**hits[i], "rerank_score": scores[keys[i]]} for i in order[: self.top_k]]
+        else:
+            kept = hits[: self.top_k]
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        info.update({"reranked": reranked, "ms": round(elapsed_ms, 2)})
+
+        with self._lock:
+            self.calls += 1
+            self.cache_hits += info["cache_hits"]
+            self._latencies.append(elapsed_ms)
+            del self._latencies[:-_LATENCY_WINDOW]
+
+        return kept, info
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                "enabled": RERANK_ENABLED,
+                "model": RERANK_MODEL,
+                "loaded": _model is not None,
+                "calls": self.calls,
+                "pairs_scored": self.pairs_scored,
+                "cache_hits": self.cache_hits,
+                "cache_entries": len(self._cache),
+                "over_budget": self.over_budget,
+                "skipped": self.skipped,
+                "pending": self._pending,
+            }
+
+        def pct(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 2)
+
+        stats.update({"ms_p50": pct(0.5), "ms_p95": pct(0.95), "ms_max": pct(1.0)})
+        return stats
+
+
+def warmup() -> None:
+    get_model().predict([("warmup", "warmup")], show_progress_bar=False)
+
+
+reranker = Reranker()
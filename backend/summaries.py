@@ -1,9 +1,9 @@
 # summaries.py
-from typing import List
+from typing import List, Optional
 
 from embeddings import embed_texts
 from vector_store import VectorStore
-from llm import generate_summary
+from summarizer import summarize_document, NOT_FOUND
 
 
 class DocumentSummaryStore:
@@ -14,9 +14,16 @@ class DocumentSummaryStore:
     def __init__(self):
         self.store = VectorStore(collection_name="knowledge_vault_summaries")
 
-    def add_summary(self, doc_id: str, file_name: str, full_text: str):
-        summary = generate_summary(full_text)
-        embedding = embed_texts([summary])[0]
+    def add_summary(self, doc_id: str, file_name: str, full_text: str) -> Optional[str]:
+        """
+        Summarize a document and store it under its doc_id, replacing any
+        summary of an earlier version of the same file. Returns the
+        summary's ID, or None if Gemini produced no summary.
+
+        Raises LLMUnavailableError if Gemini can't be reached; the stored
+        summary is left as it was.
+        """
+        summary = summarize_document(full_text)
 
         metadata = {
             "doc_id": doc_id,
@@ -24,11 +31,32 @@ class DocumentSummaryStore:
             "source": file_name,
         }
 
-        self.store.add(
+        stale_ids = [
+            entry["id"]
+            for entry in self.store.get(file_name=file_name, include=["metadatas"])
+            if entry["id"] != doc_id
+        ]
+
+        if summary == NOT_FOUND:
+            print(f"[WARN] No summary produced for {file_name}")
+            self.store.delete(ids=stale_ids)
+            return None
+
+        embedding = embed_texts([summary])[0]
+        self.store.upsert(
+            ids=[doc_id],
             embeddings=[embedding],
             documents=[summary],
             metadatas=[metadata],
         )
+        self.store.delete(ids=stale_ids)
+        return doc_id
+
+    def remove(self, file_name: str) -> None:
+        """
+        Delete the stored summary of a file.
+        """
+        self.store.delete(file_name=file_name)
 
     # 🔹 GLOBAL SUMMARY SEARCH (SEMANTIC)
     def search(self, query_embedding, k: int = 3):
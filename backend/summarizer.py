@@ -0,0 +1,211 @@
+"""
+Hierarchical (map-reduce) summarization for documents too large for one
+prompt.
+
+Small documents get a single generate_summary call as before. Larger ones
+are split into sections that fit SUMMARY_SECTION_TOKENS, summarized
+concurrently on a bounded pool (map), and the section summaries are then
+combined, in rounds if needed, into the final summary (reduce). Section
+summaries are cached by content hash, so re-ingesting a revised document
+only pays for the sections that changed.
+"""
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+from llm import generate_summary, generate_section_summary, combine_summaries, NOT_FOUND
+from utils import text_sha256
+
+load_dotenv()
+
+# Rough Gemini token estimate; only used to size prompts.
+CHARS_PER_TOKEN = 4
+
+SUMMARY_SECTION_TOKENS = int(os.getenv("SUMMARY_SECTION_TOKENS", "8000"))
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+# Upper bound on map calls per document; beyond it, evenly spaced sections
+# are summarized so latency stays bounded for arbitrarily large files.
+SUMMARY_MAX_SECTIONS = int(os.getenv("SUMMARY_MAX_SECTIONS", "24"))
+SUMMARY_CACHE_PATH = os.getenv("SUMMARY_CACHE_PATH", "data/summary_cache.sqlite3")
+# Section summaries kept in memory in front of the SQLite cache (LRU).
+SUMMARY_CACHE_MEMORY = int(os.getenv("SUMMARY_CACHE_MEMORY", "1000"))
+
+_executor = ThreadPoolExecutor(
+    max_workers=max(1, SUMMARY_CONCURRENCY),
+    thread_name_prefix="summarize",
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+# -------- SECTION CACHE --------
+class SectionSummaryCache:
+    def __init__(self, path: Optional[str], max_memory_entries: int = SUMMARY_CACHE_MEMORY):
+        self.max_memory_entries = max_memory_entries
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._db = None
+
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS section_summaries ("
+                " key TEXT PRIMARY KEY,"
+                " summary TEXT NOT NULL)"
+            )
+            self._db.commit()
+
+    def _remember(self, key: str, summary: str) -> None:
+        self._memory[key] = summary
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT summary FROM section_summaries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._remember(key, row[0])
+            return row[0]
+
+    def put(self, key: str, summary: str) -> None:
+        with self._lock:
+            self._remember(key, summary)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO section_summaries (key, summary) VALUES (?, ?)",
+                    (key, summary),
+                )
+                self._db.commit()
+
+
+_cache = SectionSummaryCache(SUMMARY_CACHE_PATH or None)
+
+
+# -------- SPLITTING --------
+def split_sections(text: str, max_tokens: int = SUMMARY_SECTION_TOKENS) -> List[str]:
+    """
+    Pack paragraphs (then lines, then raw slices for huge blocks) into
+    sections of at most max_tokens estimated tokens.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    sections: List[str] = []
+    current: List[str] = []
+    current_len = 0
+
+    def flush():
+        nonlocal current, current_len
+        if current:
+            sections.append("\n".join(current))
+        current, current_len = [], 0
+
+    for paragraph in text.split("\n"):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+
+        while len(paragraph) > max_chars:
+            flush()
+            sections.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+
+        if current_len + len(paragraph) + 1 > max_chars:
+            flush()
+        current.append(paragraph)
+        current_len += len(paragraph) + 1
+
+    flush()
+    return sections
+
+
+def _evenly_spaced(items: List[str], limit: int) -> List[str]:
+    if len(items) <= limit:
+        return items
+    step = len(items) / limit
+    return [items[int(i * step)] for i in range(limit)]
+
+
+# -------- MAP / REDUCE --------
+def _summarize_section(section: str) -> str:
+    key = text_sha256(section)
+    cached = _cache.get(key)
+    if cached is not None:
+        return cached
+
+    summary = generate_section_summary(section)
+    if summary != NOT_FOUND:
+        _cache.put(key, summary)
+    return summary
+
+
+def _reduce(summaries: List[str]) -> str:
+    """
+    Combine section summaries, grouping them into budget-sized prompts and
+    repeating until one summary remains.
+    """
+    while True:
+        numbered = [f"Section {i + 1}:\n{s}" for i, s in enumerate(summaries)]
+        groups = split_sections("\n\n".join(numbered))
+
+        if len(groups) == 1:
+            return combine_summaries(groups[0])
+
+        if len(groups) >= len(summaries):
+            # Every summary fills a prompt on its own, so another round
+            # would not shrink anything: cut each to an equal share of one
+            # prompt and combine once.
+            share = max(1, SUMMARY_SECTION_TOKENS * CHARS_PER_TOKEN // len(summaries) - 16)
+            print(f"[WARN] Summaries don't shrink when combined; truncating {len(summaries)} of them")
+            return combine_summaries(
+                "\n\n".join(f"Section {i + 1}:\n{s[:share]}" for i, s in enumerate(summaries))
+            )
+
+        summaries = [
+            s for s in _executor.map(combine_summaries, groups) if s != NOT_FOUND
+        ]
+        if not summaries:
+            return NOT_FOUND
+
+
+def summarize_document(full_text: str) -> str:
+    """
+    Summary of a document of any size.
+    """
+    if estimate_tokens(full_text) <= SUMMARY_SECTION_TOKENS:
+        return generate_summary(full_text)
+
+    sections = split_sections(full_text)
+    if len(sections) > SUMMARY_MAX_SECTIONS:
+        print(
+            f"[INFO] Summarizing {SUMMARY_MAX_SECTIONS} of {len(sections)} "
+            f"sections (SUMMARY_MAX_SECTIONS)"
+        )
+        sections = _evenly_spaced(sections, SUMMARY_MAX_SECTIONS)
+
+    summaries = [
+        s for s in _executor.map(_summarize_section, sections) if s != NOT_FOUND
+    ]
+    if not summaries:
+        print("[WARN] Every section summary failed")
+        return NOT_FOUND
+
+    if len(summaries) == 1:
+        return summaries[0]
+
+    return _reduce(summaries)
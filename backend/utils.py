@@ -0,0 +1,57 @@
+import hashlib
+import os
+import time
+
+# Touched whenever ingestion changes the vault; caches compare its mtime.
+VAULT_VERSION_FILE = os.getenv("VAULT_VERSION_FILE", "data/vault_version")
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    """
+    Hex SHA-256 of a file's bytes, read in blocks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_id_for(file_name: str, text: str) -> str:
+    """
+    Stable chunk ID derived from its content, scoped to the file so two
+    documents sharing boilerplate keep separate chunks.
+    """
+    return text_sha256(f"{file_name}\x00{text}")[:32]
+
+
+def doc_id_for(file_name: str, file_hash: str) -> str:
+    """
+    Document (and summary) ID: the file's content hash scoped to its name,
+    so identical files uploaded under two names stay separate documents.
+    """
+    return text_sha256(f"{file_name}\x00{file_hash}")
+
+
+def vault_version() -> int:
+    """
+    Monotonic stamp of the last change to the vault (0 if never changed).
+    Shared between workers through the file system.
+    """
+    try:
+        return os.stat(VAULT_VERSION_FILE).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def mark_vault_changed() -> None:
+    os.makedirs(os.path.dirname(VAULT_VERSION_FILE) or ".", exist_ok=True)
+    with open(VAULT_VERSION_FILE, "w") as f:
+        f.write(str(time.time_ns()))
+    # Some file systems have coarse mtimes; make sure the stamp moves.
+    now = time.time_ns()
+    os.utime(VAULT_VERSION_FILE, ns=(now, now))
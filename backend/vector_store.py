@@ -1,100 +1,69 @@
 import os
-from typing import List, Dict, Optional
-import chromadb
-from chromadb.api import ClientAPI
-from chromadb.api.models.Collection import Collection
-from dotenv import load_dotenv
-
-load_dotenv()
-
-_client: ClientAPI | None = None
-_collection: Collection | None = None
-
-
-class VectorStore:
-    def __init__(self, collection_name: str = "knowledge_vault"):
-        global _client, _collection
-
-        if _client is None:
-            _client = chromadb.CloudClient(
-                api_key=os.getenv("CHROMA_API_KEY"),
-                tenant=os.getenv("CHROMA_TENANT"),
-                database=os.getenv("CHROMA_DATABASE"),
-            )
-
-        if _collection is None:
-            _collection = _client.get_or_create_collection(
-                name=collection_name
-            )
+import uuid
+from typing import List, Dict, Optional, Any
 
-        self.client = _client
-        self.collection = _collection
+import numpy as np
+from dotenv import load_dotenv
 
-    def add(
-        self,
-        embeddings: List[List[float]],
-        metadatas: List[Dict],
-        documents: List[str],
-    ):
-        ids = [
-            f"doc_{i}"
-            for i in range(
-                self.collection.count(),
-                self.collection.count() + len(embeddings)
-            )
-        ]
+from metrics import span
 
-        self.collection.add(
-            ids=ids,
-            embeddings=embeddings,
-            metadatas=metadatas,
-            documents=documents
-        )
+load_dotenv()
 
-    # In vector_store.py
-    def search(
-        self,
-        query_embedding: List[float],
-        k: int = 5,
-        source_filter: Optional[str] = None,
-    ) -> List[Dict]:
-        
-        where = None
-        if source_filter:
-            # Standardize the filename (remove paths/URL encoding)
-            clean_name = os.path.basename(source_filter)
-            where = {"source": {"$eq": clean_name}}
-
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=k,
-            where=where,
-            include=["metadatas", "documents", "distances"] # Explicitly ask for distances to debug
+# "chroma" (Chroma Cloud, default) or "local" (in-process, see local_store.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+LOCAL_VECTOR_DIR = os.getenv("LOCAL_VECTOR_DIR", "data/vector_store")
+# "flat" (exact brute force) or "hnsw" (needs hnswlib)
+LOCAL_VECTOR_INDEX = os.getenv("LOCAL_VECTOR_INDEX", "flat").lower()
+# "float32" keeps vectors in memory; "float16" / "int8" keep quantized codes
+# in memory and re-score the best candidates from memory-mapped float32.
+LOCAL_VECTOR_DTYPE = os.getenv("LOCAL_VECTOR_DTYPE", "float32").lower()
+# "file" keeps one small index per document in the local backend, so
+# file-scoped searches only touch that document; "none" keeps one index.
+VECTOR_PARTITION = os.getenv("VECTOR_PARTITION", "file").lower()
+# Max records per add/upsert/update call; larger writes are split so they
+# stay under the server's payload limits. The local backend has no such
+# limit and takes each write whole.
+VECTOR_WRITE_BATCH = int(os.getenv("VECTOR_WRITE_BATCH", "100"))
+
+_client = None
+_collections: Dict[str, Any] = {}
+
+
+def _create_client():
+    if VECTOR_BACKEND == "local":
+        from local_store import LocalClient
+
+        partitions = {}
+        if VECTOR_PARTITION == "file":
+            partitions["knowledge_vault_chunks"] = "file_name"
+        elif VECTOR_PARTITION != "none":
+            raise ValueError(f"Unknown VECTOR_PARTITION: {VECTOR_PARTITION}")
+
+        return LocalClient(
+            path=LOCAL_VECTOR_DIR,
+            index_type=LOCAL_VECTOR_INDEX,
+            partitions=partitions,
+            dtype=LOCAL_VECTOR_DTYPE,
         )
 
-        # If the first ID is empty, we found nothing
-        if not results["ids"] or not results["ids"][0]:
-            print(f"DEBUG: Retrieval failed for filter: {where}")
-            return []
-
-        return [
-            {**meta, "text": doc}
-            for meta, doc in zip(results["metadatas"][0], results["documents"][0])
-        ]
+    if VECTOR_BACKEND == "chroma":
+        # Chroma Cloud applies the file_name `where` filter server-side;
+        # VECTOR_PARTITION only affects the local backend.
+        import chromadb
 
-import os
-import uuid
-from typing import List, Dict, Optional
+        return chromadb.CloudClient(
+            api_key=os.getenv("CHROMA_API_KEY"),
+            tenant=os.getenv("CHROMA_TENANT"),
+            database=os.getenv("CHROMA_DATABASE"),
+        )
 
-import chromadb
-from chromadb.api import ClientAPI
-from chromadb.api.models.Collection import Collection
-from dotenv import load_dotenv
+    raise ValueError(f"Unknown VECTOR_BACKEND: {VECTOR_BACKEND}")
 
-load_dotenv()
 
-_client: ClientAPI | None = None
-_collections: Dict[str, Collection] = {}
+def _batches(n: int):
+    step = max(1, n if VECTOR_BACKEND == "local" else VECTOR_WRITE_BATCH)
+    for start in range(0, n, step):
+        yield slice(start, start + step)
 
 
 class VectorStore:
@@ -104,17 +73,14 @@ class VectorStore:
     - Multi-file ingestion
     - Metadata-based filtering
     - Similarity-aware retrieval
+    - Pluggable backends (Chroma Cloud or local), chosen by VECTOR_BACKEND
     """
 
     def __init__(self, collection_name: str = "knowledge_vault_chunks"):
         global _client, _collections
 
         if _client is None:
-            _client = chromadb.CloudClient(
-                api_key=os.getenv("CHROMA_API_KEY"),
-                tenant=os.getenv("CHROMA_TENANT"),
-                database=os.getenv("CHROMA_DATABASE"),
-            )
+            _client = _create_client()
 
         if collection_name not in _collections:
             _collections[collection_name] = _client.get_or_create_collection(
@@ -126,7 +92,7 @@ class VectorStore:
 
     def add(
         self,
-        embeddings: List[List[float]],
+        embeddings: np.ndarray,
         documents: List[str],
         metadatas: List[Dict],
     ) -> None:
@@ -137,16 +103,111 @@ class VectorStore:
 
         ids = [str(uuid.uuid4()) for _ in embeddings]
 
-        self.collection.add(
-            ids=ids,
-            embeddings=embeddings,
-            documents=documents,
-            metadatas=metadatas,
+        for batch in _batches(len(ids)):
+            self.collection.add(
+                ids=ids[batch],
+                embeddings=embeddings[batch],
+                documents=documents[batch],
+                metadatas=metadatas[batch],
+            )
+
+    def upsert(
+        self,
+        ids: List[str],
+        embeddings: np.ndarray,
+        documents: List[str],
+        metadatas: List[Dict],
+    ) -> None:
+        """
+        Insert or overwrite entries under caller-chosen (content-hash) IDs.
+        """
+
+        if not ids:
+            return
+
+        for batch in _batches(len(ids)):
+            self.collection.upsert(
+                ids=ids[batch],
+                embeddings=embeddings[batch],
+                documents=documents[batch],
+                metadatas=metadatas[batch],
+            )
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict]) -> None:
+        """
+        Rewrite metadata of existing entries without touching their vectors.
+        """
+
+        if not ids:
+            return
+
+        for batch in _batches(len(ids)):
+            self.collection.update(ids=ids[batch], metadatas=metadatas[batch])
+
+    def delete(
+        self,
+        ids: Optional[List[str]] = None,
+        file_name: Optional[str] = None,
+    ) -> None:
+        """
+        Delete entries by ID or every entry belonging to a file.
+        """
+
+        if ids is not None:
+            for batch in _batches(len(ids)):
+                self.collection.delete(ids=ids[batch])
+            return
+
+        if file_name:
+            self.collection.delete(
+                where={"file_name": {"$eq": os.path.basename(file_name)}}
+            )
+
+    def get(
+        self,
+        file_name: Optional[str] = None,
+        where: Optional[Dict] = None,
+        include: Optional[List[str]] = None,
+    ) -> List[Dict]:
+        """
+        Fetch stored entries by metadata (no semantic search).
+
+        Args:
+            file_name: Optional file-level filter
+            where: Optional raw metadata filter (combined with file_name)
+            include: Fields to return, defaults to documents + metadatas
+        """
+
+        conditions = []
+        if file_name:
+            conditions.append({"file_name": {"$eq": os.path.basename(file_name)}})
+        if where:
+            conditions.append(where)
+
+        if len(conditions) > 1:
+            where = {"$and": conditions}
+        elif conditions:
+            where = conditions[0]
+
+        results = self.collection.get(
+            where=where,
+            include=include or ["documents", "metadatas"],
         )
 
+        if not results or not results.get("ids"):
+            return []
+
+        documents = results.get("documents") or [None] * len(results["ids"])
+        metadatas = results.get("metadatas") or [{}] * len(results["ids"])
+
+        return [
+            {"id": id_, "text": doc, **(meta or {})}
+            for id_, doc, meta in zip(results["ids"], documents, metadatas)
+        ]
+
     def search(
         self,
-        query_embedding: List[float],
+        query_embedding: np.ndarray,
         k: int = 5,
         file_name: Optional[str] = None,
         similarity_threshold: Optional[float] = None,
@@ -166,18 +227,20 @@ class VectorStore:
             clean_name = os.path.basename(file_name)
             where = {"file_name": {"$eq": clean_name}}
 
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=k,
-            where=where,
-            include=["documents", "metadatas", "distances"],
-        )
+        with span("vector_search"):
+            results = self.collection.query(
+                query_embeddings=[query_embedding],
+                n_results=k,
+                where=where,
+                include=["documents", "metadatas", "distances"],
+            )
 
         if not results["ids"] or not results["ids"][0]:
             return []
 
         hits = []
-        for doc, meta, dist in zip(
+        for id_, doc, meta, dist in zip(
+            results["ids"][0],
             results["documents"][0],
             results["metadatas"][0],
             results["distances"][0],
@@ -187,6 +250,7 @@ class VectorStore:
 
             hits.append(
                 {
+                    "id": id_,
                     "text": doc,
                     "distance": dist,
                     **meta,
@@ -47,7 +47,7 @@ async function uploadFile() {
   const formData = new FormData();
   formData.append("file", fileInput.files[0]);
 
-  uploadStatus.textContent = "Uploading & indexing...";
+  uploadStatus.textContent = "Uploading...";
 
   try {
     const res = await fetch(`${API_BASE}/upload`, {
@@ -61,13 +61,46 @@ async function uploadFile() {
       return;
     }
 
-
+    await pollJob(data.job_id);
     await fetchFiles();
   } catch {
     uploadStatus.textContent = "Upload failed";
   }
 }
 
+const JOB_POLL_MS = 1000;
+
+async function pollJob(jobId) {
+  while (true) {
+    const res = await fetch(`${API_BASE}/jobs/${jobId}`);
+    if (!res.ok) {
+      uploadStatus.textContent = "Upload failed";
+      return;
+    }
+
+    const job = await res.json();
+
+    if (job.status === "queued") {
+      uploadStatus.textContent = "Queued for indexing...";
+    } else if (job.status === "running") {
+      uploadStatus.textContent = `Indexing (${job.stage || "starting"})...`;
+    } else if (job.status === "failed") {
+      uploadStatus.textContent = `Indexing failed: ${job.error || "unknown error"}`;
+      return;
+    } else {
+      uploadStatus.textContent =
+        job.status === "skipped"
+          ? "Skipped (no usable text)"
+          : job.status === "unchanged"
+          ? "Already indexed (unchanged)"
+          : "Indexed";
+      return;
+    }
+
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_MS));
+  }
+}
+
 /* -----------------------------
    CHAT (GLOBAL SEARCH)
 --------------------------------*/
@@ -88,30 +121,77 @@ function addMessage(text, type, sources = []) {
   chatContainer.scrollTop = chatContainer.scrollHeight;
 }
 
-async function askQuestion() {
+function setSources(msg, sources) {
+  let src = msg.querySelector(".sources");
+  if (!sources.length) {
+    if (src) src.remove();
+    return;
+  }
+
+  if (!src) {
+    src = document.createElement("div");
+    src.className = "sources";
+    msg.appendChild(src);
+  }
+  src.textContent = "Sources: " + sources.join(", ");
+}
+
+function askQuestion() {
   const q = questionInput.value.trim();
   if (!q) return;
 
   addMessage(q, "user");
   questionInput.value = "";
 
-  const thinking = document.createElement("div");
-  thinking.className = "message ai";
-  thinking.textContent = "Thinking...";
-  chatContainer.appendChild(thinking);
+  // One message bubble, filled in as the answer streams.
+  const msg = document.createElement("div");
+  msg.className = "message ai";
+  const body = document.createElement("span");
+  body.textContent = "Thinking...";
+  msg.appendChild(body);
+  chatContainer.appendChild(msg);
 
-  try {
-    const url = `${API_BASE}/ask?q=${encodeURIComponent(q)}`;
+  let started = false;
+  let sources = [];
 
-    const res = await fetch(url);
-    const data = await res.json();
+  const url = `${API_BASE}/ask/stream?q=${encodeURIComponent(q)}`;
+  const stream = new EventSource(url);
 
-    chatContainer.removeChild(thinking);
-    addMessage(data.answer, "ai", data.sources || []);
-  } catch {
-    chatContainer.removeChild(thinking);
-    addMessage("Error contacting server.", "ai");
-  }
+  const append = (text) => {
+    if (!started) {
+      body.textContent = "";
+      started = true;
+    }
+    body.textContent += text;
+    chatContainer.scrollTop = chatContainer.scrollHeight;
+  };
+
+  stream.addEventListener("meta", (e) => {
+    sources = JSON.parse(e.data).sources || [];
+  });
+
+  stream.addEventListener("token", (e) => {
+    append(JSON.parse(e.data).text);
+  });
+
+  stream.addEventListener("replace", (e) => {
+    body.textContent = JSON.parse(e.data).text;
+    started = true;
+  });
+
+  stream.addEventListener("done", (e) => {
+    stream.close();
+    body.textContent = JSON.parse(e.data).answer;
+    setSources(msg, sources);
+    chatContainer.scrollTop = chatContainer.scrollHeight;
+  });
+
+  // Covers both the server's `error` event and network failures;
+  // close so EventSource doesn't reconnect and ask again.
+  stream.addEventListener("error", () => {
+    stream.close();
+    if (!started) body.textContent = "Error contacting server.";
+  });
 }
 
 function handleEnter(e) {